@@ -0,0 +1,278 @@
+"""
+Runs AssignTransit for several time periods (AM, MD, PM, EV, ...) at once, one worker process per
+period, instead of one period after another.
+
+The periods are read from a JSON file:
+
+    {
+        "shared": {"ttf_definitions": [...], "surface_transit_speeds": [...], ...},
+        "periods": [
+            {"name": "AM", "parameters": {"project_file": "AM/AM.emp", "scenario_number": 11,
+                                          "transit_classes": [...], ...}},
+            {"name": "MD", "parameters": {"project_file": "MD/MD.emp", "scenario_number": 12,
+                                          "transit_classes": [...], ...}},
+            ...
+        ]
+    }
+
+"shared" holds the read-only inputs common to every period. It is sent once to each worker process,
+not once per period, and each period's parameters are applied over it. The transit classes name the
+demand and output matrices of a period, so they cannot be shared. Each period needs its own Emme
+project (and so its own emmebank): the assignment creates temporary matrices and attributes in the
+emmebank, and two processes creating them in one emmebank would pick the same identifiers.
+run_periods checks these before starting any worker.
+
+The machine's processors (or --processors) are split between the workers so that the periods
+running at the same time never ask for more than that in total. Each period's share is its
+number_of_processors. The per-period results, errors and timings are written as JSON.
+
+The assignment itself is done by an engine, a function engine(parameters, processors) named as
+"module:function". The default, emme_engine, starts a dedicated Emme desktop on the period's
+project in the worker and runs the tmg2.Assign.assign_transit tool; it has not yet been run against
+an Emme installation, so try it on copies of the projects first. standin_engine runs the
+congested assignment phases on a synthetic network with the Emme stand-in, so the runner can be
+tried without an Emme licence:
+
+    python assign_transit_periods.py periods.json --processors 16 --output periods_results.json
+    python assign_transit_periods.py --standin AM MD PM EV --processors 8
+"""
+
+import argparse
+import concurrent.futures
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+# set in each worker process by _initialize_worker
+_worker_state = {}
+
+
+def emme_engine(parameters, processors):
+    """
+    Runs AssignTransit in a dedicated Emme desktop opened on parameters["project_file"]. Not yet run
+    against an Emme installation.
+    """
+    import inro.emme.desktop.app as _app
+    import inro.modeller as _m
+
+    desktop = _app.start_dedicated(visible=False, user_initials="TMG", project=parameters["project_file"])
+    try:
+        tool = _m.Modeller(desktop).tool("tmg2.Assign.assign_transit")
+        tool.number_of_processors = processors
+        tool(parameters)
+    finally:
+        desktop.close()
+    return {"scenario_number": parameters["scenario_number"]}
+
+
+def standin_engine(parameters, processors):
+    """
+    Assignment engine for trying the runner without Emme: builds a synthetic network for the period's
+    scenario on the Emme stand-in and times the congested assignment phases of AssignTransit on it, as
+    benchmark_assign_transit does.
+    """
+    import emme_standin
+    from emme_standin import synthetic
+
+    emmebank = emme_standin.install(zones=parameters.get("zones", 50))
+    import assign_transit_v2
+    import benchmark_assign_transit
+
+    scale = parameters.get("scale", "1k")
+    if scale not in synthetic.SCALES:
+        raise Exception("Unknown synthetic network scale '%s'" % scale)
+    result = benchmark_assign_transit.benchmark_scale(
+        assign_transit_v2,
+        emmebank,
+        parameters["scenario_number"],
+        scale,
+        parameters.get("iterations", 5),
+        parameters.get("seed", parameters["scenario_number"]),
+        benchmark_assign_transit.get_parameters(**parameters),
+    )
+    return {
+        "scenario_number": parameters["scenario_number"],
+        "transit_segments": result["element_totals"]["transit_segments"],
+        "per_iteration_seconds": result["per_iteration_seconds"],
+        "step_sizes": result["line_search"]["step_sizes"],
+        "errors": result["errors"],
+    }
+
+
+def get_engine(name):
+    """
+    Returns the engine function named "module:function".
+    """
+    module_name, _, function_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def allocate_processors(number_of_periods, processors, max_workers=None):
+    """
+    Returns the number of worker processes and the processors given to each period. When every period
+    gets its own worker the leftover processors go to the first periods; otherwise each period gets an
+    equal share, so the periods running at the same time never use more than `processors`.
+    """
+    workers = max(1, min(number_of_periods, processors, max_workers or processors))
+    share, remainder = divmod(processors, workers)
+    if workers == number_of_periods:
+        return workers, [share + (1 if i < remainder else 0) for i in range(number_of_periods)]
+    return workers, [share] * number_of_periods
+
+
+def check_periods(periods, shared_parameters=None):
+    """
+    Raises an exception when the periods could interfere with each other: transit classes given in the
+    shared parameters, two periods opening the same project, or two periods of a project assigning the
+    same scenario.
+    """
+    shared_parameters = shared_parameters or {}
+    if "transit_classes" in shared_parameters:
+        raise Exception(
+            "transit_classes name each period's demand and output matrices, so give them in the parameters"
+            " of every period instead of the shared parameters"
+        )
+    projects = {}
+    scenarios = {}
+    for period in periods:
+        parameters = dict(shared_parameters, **period["parameters"])
+        project_file = parameters.get("project_file")
+        if project_file is not None:
+            project_file = os.path.normcase(os.path.abspath(project_file))
+            if project_file in projects:
+                raise Exception(
+                    "Periods %s and %s both open the project %s; every period needs its own project, since"
+                    " temporary matrices created in one emmebank by two processes would collide"
+                    % (projects[project_file], period["name"], parameters["project_file"])
+                )
+            projects[project_file] = period["name"]
+        scenario = (project_file, parameters.get("scenario_number"))
+        if scenario in scenarios:
+            raise Exception(
+                "Periods %s and %s both assign scenario %s; every period needs its own scenario"
+                % (scenarios[scenario], period["name"], scenario[1])
+            )
+        scenarios[scenario] = period["name"]
+
+
+def _initialize_worker(engine, shared_parameters):
+    _worker_state["engine"] = get_engine(engine)
+    _worker_state["shared_parameters"] = shared_parameters
+
+
+def _run_period(name, period_parameters, processors):
+    parameters = dict(_worker_state["shared_parameters"])
+    parameters.update(period_parameters)
+    period = {
+        "name": name,
+        "scenario_number": parameters.get("scenario_number"),
+        "processors": processors,
+        "pid": os.getpid(),
+    }
+    start = time.time()
+    cpu_start = time.process_time()
+    try:
+        period["result"] = _worker_state["engine"](parameters, processors)
+        period["status"] = "completed"
+    except Exception:
+        period["status"] = "failed"
+        period["error"] = traceback.format_exc()
+    period["wall_seconds"] = time.time() - start
+    period["cpu_seconds"] = time.process_time() - cpu_start
+    return period
+
+
+def run_periods(
+    periods, shared_parameters=None, engine="assign_transit_periods:emme_engine", processors=None, max_workers=None
+):
+    """
+    Runs the periods ({"name", "parameters"} dicts) in worker processes and returns a summary with the
+    result, status and timings of each period, in the order given. A failed period does not stop the
+    others; its traceback is returned in "error". The periods are checked with check_periods first.
+    """
+    check_periods(periods, shared_parameters)
+    processors = processors or multiprocessing.cpu_count()
+    workers, period_processors = allocate_processors(len(periods), processors, max_workers)
+    start = time.time()
+    # spawned workers start clean, as a separate Emme desktop or stand-in needs
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_initialize_worker,
+        initargs=(engine, shared_parameters or {}),
+    ) as executor:
+        futures = [
+            executor.submit(_run_period, period["name"], period["parameters"], period_processors[i])
+            for i, period in enumerate(periods)
+        ]
+        results = [future.result() for future in futures]
+    return {
+        "engine": engine,
+        "processors": processors,
+        "workers": workers,
+        "wall_seconds": time.time() - start,
+        "period_wall_seconds": sum(period["wall_seconds"] for period in results),
+        "period_cpu_seconds": sum(period["cpu_seconds"] for period in results),
+        "periods": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run AssignTransit for several periods in parallel.")
+    parser.add_argument("periods_file", nargs="?", help="JSON file with the shared and per-period parameters")
+    parser.add_argument("--standin", nargs="+", metavar="PERIOD", help="run these periods on synthetic networks")
+    parser.add_argument("--scale", default="20k", help="synthetic network scale for --standin")
+    parser.add_argument("--engine", help='engine function as "module:function"')
+    parser.add_argument("--processors", type=int, help="processors to share between the periods")
+    parser.add_argument("--max-workers", type=int)
+    parser.add_argument("--output", default="assign_transit_periods.json")
+    args = parser.parse_args(argv)
+
+    if args.standin:
+        shared = {"scale": args.scale, "iterations": 5}
+        periods = [{"name": name, "parameters": {"scenario_number": i + 1}} for i, name in enumerate(args.standin)]
+        engine = args.engine or "assign_transit_periods:standin_engine"
+    elif args.periods_file:
+        with open(args.periods_file) as file:
+            configuration = json.load(file)
+        shared = configuration.get("shared", {})
+        periods = configuration["periods"]
+        engine = args.engine or "assign_transit_periods:emme_engine"
+    else:
+        parser.error("give a periods file or --standin")
+    summary = run_periods(periods, shared, engine, args.processors, args.max_workers)
+    for period in summary["periods"]:
+        print(
+            "%-6s scenario %-5s %2d processors  %-9s %8.2f s wall %8.2f s cpu"
+            % (
+                period["name"],
+                period["scenario_number"],
+                period["processors"],
+                period["status"],
+                period["wall_seconds"],
+                period["cpu_seconds"],
+            )
+        )
+        if period["status"] == "failed":
+            print(period["error"])
+    print(
+        "%d periods on %d workers in %.2f s (periods took %.2f s wall, %.2f s cpu in total)"
+        % (
+            len(summary["periods"]),
+            summary["workers"],
+            summary["wall_seconds"],
+            summary["period_wall_seconds"],
+            summary["period_cpu_seconds"],
+        )
+    )
+    with open(args.output, "w") as file:
+        json.dump(summary, file, indent=2)
+    return 1 if any(period["status"] == "failed" for period in summary["periods"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -52,6 +52,7 @@ import time as _time
 import multiprocessing
 
 from numpy import percentile
+import numpy as _np
 import inro.modeller as _m
 import csv
 from contextlib import contextmanager
@@ -483,8 +484,8 @@ class AssignTransit(_m.Tool()):
 
     def _publish_efficient_connector_network(self, scenario):
         """
-        Creates a network that completely replaces the scenario network in memory/disk, with
-        one that allows for the use of a logit distribution at specified choice points.
+        Flags (in NODE data1) the choice points at which the logit distribution applies, writing only
+        that node attribute to the scenario, and returns the scenario network.
 
         Run:
             - set "node_logit_scale" parameter = TRUE, to run Logit Discrete Choice Model
@@ -503,32 +504,44 @@ class AssignTransit(_m.Tool()):
                    to 1 apply same to all connectors.
 
                     *** Outgoing link connector attributes must be set to -1 to override flow connectors with fixed proportions.
+
+            - The flags are computed over the link i/j node arrays rather than by walking each node's links:
+              a regular node is a choice point when a link joins it to a centroid, or when more than one of
+              its incoming links starts at an agency node (numbered above 99999), in which case those agency
+              nodes are flagged too.
         """
-        network = scenario.get_network()
-        for node in network.regular_nodes():
-            node.data1 = 0
-        for node in network.regular_nodes():
-            agency_counter = 0
-            if node.number > 99999:
-                continue
-            for link in node.incoming_links():
-                if link.i_node.is_centroid is True:
-                    node.data1 = -1
-                if link.i_node.number > 99999:
-                    agency_counter += 1
-            for link in node.outgoing_links():
-                if link.j_node.is_centroid is True:
-                    node.data1 = -1
-            if agency_counter > 1:
-                node.data1 = -1
-                for link in node.incoming_links():
-                    if link.i_node.number > 99999:
-                        link.i_node.data1 = -1
-                for link in node.outgoing_links():
-                    if link.j_node.number > 99999:
-                        link.j_node.data1 = -1
-        scenario.publish_network(network)
-        return network
+        node_indices, data1 = scenario.get_attribute_values("NODE", ["data1"])
+        link_indices = scenario.get_attribute_values("LINK", [])[0]
+        number_of_nodes = len(node_indices)
+        node_numbers = _np.zeros(number_of_nodes, dtype=_np.int64)
+        node_numbers[_np.fromiter(node_indices.values(), _np.int64, number_of_nodes)] = _np.fromiter(
+            node_indices.keys(), _np.int64, number_of_nodes
+        )
+        # link end nodes as node positions, so the flags below are computed over the link arrays
+        i_nodes = []
+        j_nodes = []
+        for i_number, outgoing in link_indices.items():
+            i_nodes.extend([node_indices[i_number]] * len(outgoing))
+            j_nodes.extend(node_indices[j_number] for j_number in outgoing)
+        i_nodes = _np.asarray(i_nodes, dtype=_np.int64)
+        j_nodes = _np.asarray(j_nodes, dtype=_np.int64)
+        is_centroid = _np.zeros(number_of_nodes, dtype=bool)
+        is_centroid[[node_indices[number] for number in scenario.zone_numbers if number in node_indices]] = True
+        is_agency = node_numbers > 99999
+        is_choice_point = ~is_centroid & ~is_agency
+        centroid_adjacent = _np.zeros(number_of_nodes, dtype=bool)
+        centroid_adjacent[j_nodes[is_centroid[i_nodes]]] = True
+        centroid_adjacent[i_nodes[is_centroid[j_nodes]]] = True
+        agency_counter = _np.bincount(j_nodes[is_agency[i_nodes]], minlength=number_of_nodes)
+        multi_agency = is_choice_point & (agency_counter > 1)
+        data1 = _np.asarray(data1, dtype=_np.float64).copy()
+        data1[~is_centroid] = 0.0
+        data1[is_choice_point & centroid_adjacent] = -1.0
+        data1[multi_agency] = -1.0
+        data1[i_nodes[multi_agency[j_nodes] & is_agency[i_nodes]]] = -1.0
+        data1[j_nodes[multi_agency[i_nodes] & is_agency[j_nodes]]] = -1.0
+        scenario.set_attribute_values("NODE", ["data1"], [node_indices, data1])
+        return scenario.get_network()
 
     def _set_base_speed(self, scenario, parameters, stsu_att, stsu_ttf_map, ttfs_changed):
         erow_defined = self._check_attributes_and_get_erow(scenario)
@@ -1770,6 +1783,143 @@ class AssignTransit(_m.Tool()):
         congestion_matrix_list,
         fare_matrix_list,
     ):
+        if parameters.get("fused_skim_extraction", False) == False:
+            self._extract_output_matrices_by_component(
+                scenario,
+                parameters,
+                demand_matrix_list,
+                walk_time_matrix_list,
+                wait_time_matrix_list,
+                board_penalty_matrix_list,
+                in_vehicle_time_matrix_list,
+                congestion_matrix_list,
+                fare_matrix_list,
+            )
+            return
+        with _util.temporary_matrix_manager() as temp_matrix_list:
+            for i, transit_class in enumerate(parameters["transit_classes"]):
+                self._extract_class_matrices(
+                    i,
+                    scenario,
+                    parameters,
+                    transit_class,
+                    demand_matrix_list,
+                    walk_time_matrix_list,
+                    wait_time_matrix_list,
+                    board_penalty_matrix_list,
+                    in_vehicle_time_matrix_list,
+                    congestion_matrix_list,
+                    fare_matrix_list,
+                    temp_matrix_list,
+                )
+
+    def _extract_class_matrices(
+        self,
+        i,
+        scenario,
+        parameters,
+        transit_class,
+        demand_matrix_list,
+        walk_time_matrix_list,
+        wait_time_matrix_list,
+        board_penalty_matrix_list,
+        in_vehicle_time_matrix_list,
+        congestion_matrix_list,
+        fare_matrix_list,
+        temp_matrix_list,
+    ):
+        """
+        Extracts every requested skim of one class with a single matrix results pass over its strategies,
+        plus one strategy analysis of @ccost when congestion is needed:
+            - in-vehicle times are the actual in-vehicle times (timtr); when the uncongested times of a
+              congested assignment are asked for, the congestion matrix is subtracted from them
+            - fares are the actual in-vehicle costs (the segment fare attribute) plus the actual auxiliary
+              transit costs (the link fare attribute)
+        Strategy values average linearly over the strategies, so these should match the separate strategy
+        analyses of timtr, timtr-@ccost and the fare attributes, without the network calculations. This has
+        not yet been checked against the per-component matrices of an Emme run, so it is only used when
+        parameters["fused_skim_extraction"] is True.
+        """
+        congested = parameters["congested_assignment"] == True
+        in_vehicle_time_matrix = in_vehicle_time_matrix_list[i]
+        uncongested_times = (
+            in_vehicle_time_matrix is not None and congested and parameters["calculate_congested_ivtt_flag"] == False
+        )
+        congestion_matrix = congestion_matrix_list[i] if congested else None
+        if uncongested_times and congestion_matrix is None:
+            congestion_matrix = _util.initialize_matrix(
+                description="Temporary congestion for class %s" % transit_class["name"], matrix_type="FULL"
+            )
+            temp_matrix_list.append(congestion_matrix)
+        aux_transit_fare_matrix = None
+        if fare_matrix_list[i]:
+            aux_transit_fare_matrix = _util.initialize_matrix(
+                description="Temporary auxiliary transit fares for class %s" % transit_class["name"],
+                matrix_type="FULL",
+            )
+            temp_matrix_list.append(aux_transit_fare_matrix)
+
+        by_mode_subset = {"modes": ["*"]}
+        spec = {"by_mode_subset": by_mode_subset, "type": "EXTENDED_TRANSIT_MATRIX_RESULTS"}
+        if walk_time_matrix_list[i] or wait_time_matrix_list[i] or board_penalty_matrix_list[i]:
+            by_mode_subset["actual_aux_transit_times"] = wait_time_matrix_list[i]
+            by_mode_subset["actual_total_boarding_times"] = board_penalty_matrix_list[i]
+            spec["actual_total_waiting_times"] = walk_time_matrix_list[i]
+        if in_vehicle_time_matrix is not None:
+            by_mode_subset["actual_in_vehicle_times"] = in_vehicle_time_matrix
+        if fare_matrix_list[i]:
+            by_mode_subset["actual_in_vehicle_costs"] = fare_matrix_list[i]
+            by_mode_subset["actual_aux_transit_costs"] = aux_transit_fare_matrix
+        if len(by_mode_subset) > 1 or len(spec) > 2:
+            self._tracker.run_tool(
+                matrix_results_tool,
+                spec,
+                scenario=scenario,
+                class_name=transit_class["name"],
+                num_processors=self.number_of_processors,
+            )
+        if congestion_matrix is not None:
+            self._extract_congestion_matrix(i, scenario, transit_class, congestion_matrix, demand_matrix_list)
+        if uncongested_times:
+            self._subtract_matrix(scenario, in_vehicle_time_matrix, congestion_matrix)
+        if fare_matrix_list[i]:
+            self._add_matrix(scenario, fare_matrix_list[i], aux_transit_fare_matrix)
+
+    def _add_matrix(self, scenario, result_matrix, matrix):
+        spec = {
+            "type": "MATRIX_CALCULATION",
+            "result": str(result_matrix),
+            "expression": "%s + %s" % (result_matrix, matrix),
+        }
+        self._tracker.run_tool(
+            matrix_calc_tool, specification=spec, scenario=scenario, num_processors=self.number_of_processors
+        )
+
+    def _subtract_matrix(self, scenario, result_matrix, matrix):
+        spec = {
+            "type": "MATRIX_CALCULATION",
+            "result": str(result_matrix),
+            "expression": "%s - %s" % (result_matrix, matrix),
+        }
+        self._tracker.run_tool(
+            matrix_calc_tool, specification=spec, scenario=scenario, num_processors=self.number_of_processors
+        )
+
+    def _extract_output_matrices_by_component(
+        self,
+        scenario,
+        parameters,
+        demand_matrix_list,
+        walk_time_matrix_list,
+        wait_time_matrix_list,
+        board_penalty_matrix_list,
+        in_vehicle_time_matrix_list,
+        congestion_matrix_list,
+        fare_matrix_list,
+    ):
+        """
+        Extracts the skims with a separate strategy analysis (and network calculation) per component.
+        """
         for i, transit_class in enumerate(parameters["transit_classes"]):
             if walk_time_matrix_list[i] or wait_time_matrix_list or board_penalty_matrix_list[i]:
                 self._extract_times_matrices(
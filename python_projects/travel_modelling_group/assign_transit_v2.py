@@ -46,12 +46,20 @@ TMG Transit Assignment Tool
     V 2.0.2 Updated to receive JSON file parameters from Python API call
 """
 import enum
+import json
 import math
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
 import traceback as _traceback
 import time as _time
 import multiprocessing
 
 from numpy import percentile
+import numpy as _np
 import inro.modeller as _m
 import csv
 from contextlib import contextmanager
@@ -66,17 +74,770 @@ _bank = _MODELLER.emmebank
 _util = _MODELLER.module("tmg2.utilities.general_utilities")
 _db_utils = _MODELLER.module("inro.emme.utility.database_utilities")
 _tmg_tpb = _MODELLER.module("tmg2.utilities.TMG_tool_page_builder")
+net_edit = _MODELLER.module("tmg2.utilities.network_editing")
 network_calc_tool = _MODELLER.tool("inro.emme.network_calculation.network_calculator")
 extended_assignment_tool = _MODELLER.tool("inro.emme.transit_assignment.extended_transit_assignment")
 matrix_calc_tool = _MODELLER.tool("inro.emme.matrix_calculation.matrix_calculator")
 null_pointer_exception = _util.null_pointer_exception
 EMME_VERSION = _util.get_emme_version(tuple)
+# generated congestion functions, keyed by a hash of the TTF definitions and the assignment period
+_congestion_function_cache = {}
+
+
+class segment_layout:
+    """
+    Flat-array view of the transit segments of a network, aligned with the value arrays returned by
+    get_attribute_values("TRANSIT_SEGMENT", ...). Line itineraries do not change during an assignment,
+    so the layout is built once (with a single pass over the segments) and reused by every array kernel.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        line_indices = network.get_attribute_values("TRANSIT_LINE", ["headway"])[0]
+        segment_indices = network.get_attribute_values("TRANSIT_SEGMENT", ["dwell_time"])[0]
+        link_indices = network.get_attribute_values("LINK", ["length"])[0]
+        node_indices = network.get_attribute_values("NODE", ["x"])[0]
+        self.regular_nodes = _np.asarray(
+            sorted(node_indices[node.number] for node in network.regular_nodes()), dtype=_np.int64
+        )
+        self.number_of_lines = len(line_indices)
+        self.number_of_segments = sum(len(positions) for positions in segment_indices.values())
+        self.line = _np.zeros(self.number_of_segments, dtype=_np.int64)
+        self.number = _np.zeros(self.number_of_segments, dtype=_np.int64)
+        self.link = _np.full(self.number_of_segments, -1, dtype=_np.int64)
+        self.previous = _np.arange(self.number_of_segments, dtype=_np.int64)
+        self.next = _np.arange(self.number_of_segments, dtype=_np.int64)
+        self.hidden = _np.zeros(self.number_of_segments, dtype=bool)
+        for line in network.transit_lines():
+            positions = _np.asarray(segment_indices[line.id], dtype=_np.int64)
+            self.line[positions] = line_indices[line.id]
+            self.number[positions] = _np.arange(len(positions))
+            self.previous[positions[1:]] = positions[:-1]
+            self.next[positions[:-1]] = positions[1:]
+            self.hidden[positions[-1]] = True
+            for segment in line.segments():
+                self.link[positions[segment.number]] = link_indices[segment.i_node.number][segment.j_node.number]
+        self.visible = ~self.hidden
+
+    def link_values(self, values, default=0.0):
+        """
+        Maps an array of LINK values onto the segments; hidden segments get the default.
+        """
+        values = _np.asarray(values, dtype=_np.float64)
+        return _np.where(self.hidden, default, values[_np.maximum(self.link, 0)])
+
+
+class convergence_monitor:
+    """
+    Watches the relative gap of the congested iterations. Once parameters["convergence_window"] gaps are
+    known, a log-linear trend is fitted to the most recent ones, giving the rate at which the gap shrinks
+    per iteration and the number of iterations still needed to reach the target relative gap. The run
+    is flagged as:
+        - "oscillating" when the gap alternately rises and falls across the window without a clear trend
+        - "stalled" when the fitted trend improves the gap by less than parameters["stall_improvement"]
+          per iteration
+        - "unreachable" when the target is not predicted within the remaining iterations
+        - "converging" otherwise
+
+    parameters["stall_action"] selects what happens when the run is stalled or oscillating: "log"
+    (default) only records it, "terminate" ends the loop, and "accelerate" scales up the next step
+    sizes while stalled (and resets the scale on oscillation, where larger steps would overshoot).
+    "unreachable" is only logged, since a tight target (a zero relative gap in particular) makes any
+    run unreachable without it having stopped improving.
+    """
+
+    def __init__(self, parameters, step_scale=1.0):
+        self.window = int(parameters.get("convergence_window", 0))
+        self.stall_improvement = parameters.get("stall_improvement", 0.02)
+        self.action = parameters.get("stall_action", "log")
+        self.step_boost = parameters.get("stall_step_boost", 1.5)
+        self.max_step_scale = parameters.get("max_step_scale", 4.0)
+        self.target = parameters["rel_gap"]
+        self.step_scale = step_scale
+        self.iteration_seconds = []
+        self.decisions = []
+        if self.action not in ("log", "terminate", "accelerate"):
+            raise Exception("Unknown stall action '%s'" % self.action)
+
+    def enabled(self):
+        return self.window >= 3
+
+    def record_time(self, seconds):
+        self.iteration_seconds.append(seconds)
+
+    def assess(self, gap_history, iteration, last_iteration):
+        """
+        Assesses the gaps after `iteration` and returns the decision made, or None while the window is
+        not yet full. The decision is logged and kept in self.decisions.
+        """
+        if not self.enabled() or len(gap_history) < self.window:
+            return None
+        gaps = _np.asarray([gap["crgap"] for gap in gap_history[-self.window :]], dtype=_np.float64)
+        iterations = _np.asarray([gap["iteration"] for gap in gap_history[-self.window :]], dtype=_np.float64)
+        decision = {"iteration": iteration, "action": "continue", "step_scale": self.step_scale}
+        if _np.any(gaps <= 0.0):
+            # the gap estimate crossed zero, which happens only once the run has converged numerically
+            decision["state"] = "converging"
+            decision["rate"] = None
+            decision["predicted_iterations"] = 0
+        else:
+            slope = _np.polyfit(iterations, _np.log(gaps), 1)[0]
+            rate = math.exp(slope)
+            differences = _np.diff(gaps)
+            sign_changes = int(_np.count_nonzero(_np.sign(differences[1:]) * _np.sign(differences[:-1]) < 0))
+            predicted = None
+            if gaps[-1] <= self.target:
+                predicted = 0
+            elif slope < 0.0 and self.target > 0.0:
+                predicted = int(math.ceil((math.log(self.target) - math.log(gaps[-1])) / slope))
+            decision["rate"] = rate
+            decision["predicted_iterations"] = predicted
+            if 1.0 - rate < self.stall_improvement:
+                decision["state"] = "stalled"
+            elif predicted is None or predicted > last_iteration - iteration:
+                decision["state"] = "unreachable"
+            else:
+                decision["state"] = "converging"
+            if decision["state"] != "converging" and sign_changes >= len(differences) - 1:
+                decision["state"] = "oscillating"
+        if decision["state"] in ("stalled", "oscillating"):
+            if self.action == "terminate":
+                decision["action"] = "terminate"
+            elif self.action == "accelerate" and decision["state"] == "oscillating" and self.step_scale != 1.0:
+                self.step_scale = 1.0
+                decision["action"] = "reset step scale"
+            elif self.action == "accelerate" and decision["state"] == "stalled":
+                self.step_scale = min(self.max_step_scale, self.step_scale * self.step_boost)
+                decision["action"] = "boost step scale"
+        elif decision["state"] == "converging" and self.step_scale != 1.0:
+            self.step_scale = 1.0
+            decision["action"] = "reset step scale"
+        decision["new_step_scale"] = self.step_scale
+        self.decisions.append(decision)
+        _write(
+            "Convergence monitor after iteration %d: %s (gap rate %s per iteration, %s iterations to reach %g); %s"
+            % (
+                iteration,
+                decision["state"],
+                "n/a" if decision["rate"] is None else "%.4f" % decision["rate"],
+                "unknown" if decision["predicted_iterations"] is None else decision["predicted_iterations"],
+                self.target,
+                decision["action"],
+            )
+        )
+        return decision
+
+    def report_termination(self, iteration, last_iteration):
+        """
+        Logs the iterations (and the estimated time) an early termination saved.
+        """
+        saved = last_iteration - iteration
+        seconds = saved * float(_np.mean(self.iteration_seconds)) if self.iteration_seconds else 0.0
+        _write(
+            "Convergence monitor terminated the assignment after iteration %d: %d of the allowed iterations were"
+            " skipped, saving about %.1f seconds" % (iteration, saved, seconds)
+        )
+
+
+_peak_rss_reader = []
+
+
+def _get_peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None where it cannot be read.
+    """
+    if not _peak_rss_reader:
+        if os.name == "nt":
+            import ctypes
+            from ctypes import wintypes
+
+            class process_memory_counters(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t)
+                    for name in (
+                        "PeakWorkingSetSize",
+                        "WorkingSetSize",
+                        "QuotaPeakPagedPoolUsage",
+                        "QuotaPagedPoolUsage",
+                        "QuotaPeakNonPagedPoolUsage",
+                        "QuotaNonPagedPoolUsage",
+                        "PagefileUsage",
+                        "PeakPagefileUsage",
+                    )
+                ]
+
+            def read():
+                counters = process_memory_counters()
+                counters.cb = ctypes.sizeof(counters)
+                handle = ctypes.windll.kernel32.GetCurrentProcess()
+                if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                    return None
+                return int(counters.PeakWorkingSetSize)
+
+        else:
+            import resource
+            import sys
+
+            # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+            scale = 1 if sys.platform == "darwin" else 1024
+
+            def read():
+                return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+        _peak_rss_reader.append(read)
+    try:
+        return _peak_rss_reader[0]()
+    except Exception:
+        return None
+
+
+class phase_profiler:
+    """
+    Records the wall time, CPU time and peak resident set size of the phases of an assignment. Each
+    phase is timed by a `with profiler.phase(name):` block and tagged with the current iteration;
+    phases may nest. close() writes one JSON record per phase to the profile file and the same phases
+    as a Chrome trace (chrome://tracing, Perfetto) next to it, with the extension ".trace.json".
+
+    With no profile file the profiler is disabled and phase() returns a shared no-op context manager,
+    so instrumented code pays only for the method call. With `collect` it records phases in memory
+    (for the iteration log) without writing any file.
+    """
+
+    def __init__(self, path, collect=False):
+        self.path = path
+        self.enabled = bool(path) or collect
+        self.iteration = None
+        self.records = []
+        self._depth = 0
+        self._origin = _time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return _no_phase
+        return self._timed_phase(name)
+
+    @contextmanager
+    def _timed_phase(self, name):
+        start_rss = _get_peak_rss()
+        start_cpu = _time.process_time()
+        start = _time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            end = _time.perf_counter()
+            end_cpu = _time.process_time()
+            peak_rss = _get_peak_rss()
+            self._depth -= 1
+            self.records.append(
+                {
+                    "phase": name,
+                    "iteration": self.iteration,
+                    "depth": self._depth,
+                    "start_seconds": start - self._origin,
+                    "wall_seconds": end - start,
+                    "cpu_seconds": end_cpu - start_cpu,
+                    "peak_rss_bytes": peak_rss,
+                    "peak_rss_growth_bytes": None if peak_rss is None or start_rss is None else peak_rss - start_rss,
+                }
+            )
+
+    def get_phase_seconds(self, iteration):
+        """
+        Returns the wall seconds of the top-level phases of an iteration, summed by phase name with any
+        "(class name)" suffix dropped.
+        """
+        seconds = {}
+        for record in self.records:
+            if record["iteration"] == iteration and record["depth"] == 1:
+                name = record["phase"].split(" (")[0]
+                seconds[name] = seconds.get(name, 0.0) + record["wall_seconds"]
+        return seconds
+
+    def get_trace_path(self):
+        return os.path.splitext(self.path)[0] + ".trace.json"
+
+    def close(self):
+        if not self.path or not self.records:
+            self.records = []
+            return
+        records = sorted(self.records, key=lambda record: (record["start_seconds"], record["depth"]))
+        with open(self.path, "w") as profile_file:
+            for record in records:
+                profile_file.write(json.dumps(record) + "\n")
+        process = os.getpid()
+        events = []
+        for record in records:
+            args = {"iteration": record["iteration"], "cpu_seconds": record["cpu_seconds"]}
+            if record["peak_rss_bytes"] is not None:
+                args["peak_rss_mb"] = record["peak_rss_bytes"] / 1048576.0
+            events.append(
+                {
+                    "name": record["phase"],
+                    "cat": "assignment",
+                    "ph": "X",
+                    "ts": record["start_seconds"] * 1e6,
+                    "dur": record["wall_seconds"] * 1e6,
+                    "pid": process,
+                    "tid": 0,
+                    "args": args,
+                }
+            )
+            if record["peak_rss_bytes"] is not None:
+                events.append(
+                    {
+                        "name": "Peak RSS",
+                        "ph": "C",
+                        "ts": (record["start_seconds"] + record["wall_seconds"]) * 1e6,
+                        "pid": process,
+                        "args": {"MB": args["peak_rss_mb"]},
+                    }
+                )
+        with open(self.get_trace_path(), "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        _write("Phase profile written to %s and %s" % (self.path, self.get_trace_path()))
+        self.records = []
+
+
+class _no_phase_context:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_no_phase = _no_phase_context()
+
+
+class iteration_log:
+    """
+    Buffered log of the congested iterations. The assignment loop queues one row per iteration (gaps,
+    step size, excess km, iteration and phase timings) and, every `snapshot_interval` iterations, a copy
+    of the segment arrays; a background thread writes them, so the loop never waits on disk. The rows are
+    appended to the CSV file as they arrive and kept in memory by column; close() has the thread write the
+    columns once, as one array per column in "<log name>_columns.npz" (NaN where a value is missing). The
+    snapshots are compressed NumPy archives in the "<log name>_segments" directory.
+    """
+
+    COLUMNS = (
+        "iteration",
+        "lambda",
+        "gradient",
+        "cngap",
+        "crgap",
+        "norm_gap_difference",
+        "excess_km",
+        "iteration_seconds",
+    )
+    PHASES = (
+        "Compute segment costs",
+        "Extended transit assignment",
+        "Update network",
+        "Compute min trip impedance",
+        "Find step size",
+        "Prune strategies",
+        "Surface transit speed update",
+        "Update volumes",
+        "Compute gaps",
+    )
+    SEGMENT_ATTRIBUTES = (
+        "transit_volume",
+        "current_voltr",
+        "transit_boardings",
+        "transit_time",
+        "dwell_time",
+        "cost",
+        "transit_time_func",
+    )
+
+    def __init__(self, path, snapshot_interval=0):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_directory = os.path.splitext(path)[0] + "_segments"
+        self.columns_path = os.path.splitext(path)[0] + "_columns.npz"
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write_queued, name="iteration log writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def append(self, iteration, values, phase_seconds):
+        row = [iteration] + [values.get(column, "") for column in self.COLUMNS[1:]]
+        row += [phase_seconds.get(phase, "") for phase in self.PHASES]
+        self._queue.put(("row", row))
+
+    def snapshot(self, iteration, network):
+        """
+        Queues a copy of the segment arrays of `network` when `iteration` is a snapshot iteration.
+        """
+        if self.snapshot_interval <= 0 or iteration % self.snapshot_interval != 0:
+            return
+        available = network.attributes("TRANSIT_SEGMENT")
+        attributes = [attribute for attribute in self.SEGMENT_ATTRIBUTES if attribute in available]
+        data = network.get_attribute_values("TRANSIT_SEGMENT", attributes)
+        arrays = dict(
+            (attribute, _np.array(values, dtype=_np.float64)) for attribute, values in zip(attributes, data[1:])
+        )
+        path = os.path.join(self.snapshot_directory, "iteration_%d.npz" % iteration)
+        self._queue.put(("snapshot", (path, arrays)))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            _write("The iteration log %s could not be written: %s" % (self.path, self.error))
+
+    def _write_queued(self):
+        try:
+            names = list(self.COLUMNS) + [phase.lower().replace(" ", "_") + "_seconds" for phase in self.PHASES]
+            columns = [[] for _ in names]
+            with open(self.path, "w", newline="") as log_file:
+                writer = csv.writer(log_file)
+                writer.writerow(names)
+                while True:
+                    # write everything queued so far in one batch, then flush once
+                    items = [self._queue.get()]
+                    while True:
+                        try:
+                            items.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    for item in items:
+                        if item is None:
+                            continue
+                        if item[0] == "row":
+                            writer.writerow(item[1])
+                            for column, value in zip(columns, item[1]):
+                                column.append(_np.nan if value == "" or value is None else value)
+                        else:
+                            path, arrays = item[1]
+                            if not os.path.isdir(self.snapshot_directory):
+                                os.makedirs(self.snapshot_directory)
+                            _np.savez_compressed(path, **arrays)
+                    log_file.flush()
+                    if items[-1] is None:
+                        self._write_columns(names, columns)
+                        return
+        except Exception as error:
+            self.error = error
+            # keep draining so close() never blocks on a failed writer
+            while self._queue.get() is not None:
+                pass
+
+    def _write_columns(self, names, columns):
+        # write to a temporary file first, so a reader never sees a half-written archive
+        temporary_path = self.columns_path + ".tmp"
+        with open(temporary_path, "wb") as columns_file:
+            _np.savez(
+                columns_file,
+                **dict((name, _np.asarray(column, dtype=_np.float64)) for name, column in zip(names, columns))
+            )
+        os.replace(temporary_path, self.columns_path)
+
+
+class demand_snapshot:
+    """
+    Read-only copy of the class demand matrices, taken once per assignment. Demand does not change while
+    the assignment runs, so the assigned totals (intrazonal trips excluded, as p.ne.q does) are computed
+    once, and each distinct matrix is saved to a .npy file that is memory-mapped on first use, letting the
+    OS page it in when it is read instead of every class holding a full copy. Classes that share a demand
+    matrix share its file, its memory map and the matrix snapshot stored with the strategies, whose data is
+    the memory map for as long as the assignment runs. release() copies each snapshot's data into memory
+    before deleting the files, so the strategy data never refers to a deleted file.
+    """
+
+    def __init__(self, scenario, demand_matrix_list):
+        self.key = self.get_key(demand_matrix_list)
+        self.directory = tempfile.mkdtemp(prefix="tmg_demand_")
+        self.matrix_ids = [matrix.id for matrix in demand_matrix_list]
+        self.paths = {}
+        self.totals = []
+        self._demand_matrices = {}
+        self._matrices = {}
+        self._matrix_snapshots = {}
+        totals = {}
+        for matrix in demand_matrix_list:
+            if matrix.id not in self.paths:
+                data = _np.asarray(matrix.get_numpy_data(scenario.id), dtype=_np.float64)
+                self.paths[matrix.id] = os.path.join(self.directory, "%s.npy" % matrix.id)
+                _np.save(self.paths[matrix.id], data)
+                totals[matrix.id] = float(data.sum() - _np.trace(data))
+                self._demand_matrices[matrix.id] = matrix
+            self.totals.append(totals[matrix.id])
+
+    @staticmethod
+    def get_key(demand_matrix_list):
+        return tuple((matrix.id, str(getattr(matrix, "timestamp", ""))) for matrix in demand_matrix_list)
+
+    def get_matrix(self, index):
+        """
+        Returns the memory-mapped demand of class `index`.
+        """
+        matrix_id = self.matrix_ids[index]
+        if matrix_id not in self._matrices:
+            self._matrices[matrix_id] = _np.load(self.paths[matrix_id], mmap_mode="r")
+        return self._matrices[matrix_id]
+
+    def get_matrix_snapshot(self, index):
+        """
+        Returns the matrix snapshot (id, description, timestamp and data, as Modeller's matrix_snapshot
+        gives) of the demand of class `index`, with the memory-mapped matrix as its data.
+        """
+        matrix_id = self.matrix_ids[index]
+        if matrix_id not in self._matrix_snapshots:
+            matrix = self._demand_matrices[matrix_id]
+            self._matrix_snapshots[matrix_id] = {
+                "id": matrix.id,
+                "description": matrix.description,
+                "timestamp": matrix.timestamp,
+                "data": self.get_matrix(index),
+            }
+        return self._matrix_snapshots[matrix_id]
+
+    def release(self):
+        """
+        Detaches the matrix snapshots handed out from the files (their data becomes an in-memory copy, once
+        per distinct matrix), drops the memory maps, which closes them once the last array read from them is
+        gone, and deletes the files. A file that cannot be deleted (one still mapped on Windows) is logged.
+        """
+        for snapshot in self._matrix_snapshots.values():
+            snapshot["data"] = _np.array(snapshot["data"])
+        self._matrices = {}
+        self._matrix_snapshots = {}
+        self._demand_matrices = {}
+
+        def report(function, path, exc_info):
+            _write("Demand snapshot file %s could not be deleted: %s" % (path, exc_info[1]))
+
+        shutil.rmtree(self.directory, onerror=report)
+
+
+class network_calculation_batch:
+    """
+    Runs NETWORK_CALCULATION specifications against one scenario as a batch. Consecutive specifications
+    with a transit line, link or node result are evaluated together on attribute arrays: the attributes
+    they read and write are fetched once per element type, each selection becomes a mask and each
+    expression is evaluated over whole columns (in order, so later specifications see earlier results),
+    and the results are written back once. Any other specification is run by the network calculator in
+    its place, after the pending results are written.
+
+    Only the selections the tool itself builds are evaluated on arrays: "all", "mode=<mode ids>" (the
+    elements allowing any of the listed modes) and "<attribute>=<low>,<high>" (an inclusive range), with
+    arithmetic expressions (+ - * / ^ and parentheses) over numbers and attributes. Specifications added
+    with coalesce=False, such as those holding a filter from the parameters, always go to the network
+    calculator, as does everything when the batch is created with coalesce=False. A result that is not
+    finite raises an exception rather than being written.
+    """
+
+    ELEMENT_TYPES = {"transit_line": "TRANSIT_LINE", "link": "LINK", "node": "NODE"}
+    NAMES = {
+        "TRANSIT_LINE": {"hdw": "headway", "spd": "speed", "ut1": "data1", "ut2": "data2", "ut3": "data3"},
+        "LINK": {
+            "len": "length",
+            "lanes": "num_lanes",
+            "vdf": "volume_delay_func",
+            "ul1": "data1",
+            "ul2": "data2",
+            "ul3": "data3",
+        },
+        "NODE": {"ui1": "data1", "ui2": "data2", "ui3": "data3"},
+    }
+    TOKEN = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+)|(@?[A-Za-z_]\w*)|([-+*/^()]))")
+    NUMBER = r"\s*(-?\d+\.?\d*|-?\.\d+)\s*"
+
+    def __init__(self, scenario, coalesce=True):
+        self.scenario = scenario
+        self.coalesce = coalesce
+        self.specifications = []
+        self._attributes = {}
+
+    def add(self, specification, coalesce=True):
+        self.specifications.append((specification, coalesce))
+
+    def run(self):
+        """
+        Runs the queued specifications and returns their reports, in order.
+        """
+        reports = []
+        pending = []
+        for specification, coalesce in self.specifications:
+            compiled = self._compile(specification) if self.coalesce and coalesce else None
+            if compiled is None:
+                reports.extend(self._evaluate(pending))
+                pending = []
+                reports.append(network_calc_tool(specification, scenario=self.scenario))
+            else:
+                pending.append(compiled)
+        reports.extend(self._evaluate(pending))
+        self.specifications = []
+        return reports
+
+    def _attribute_name(self, element_type, name):
+        if element_type not in self._attributes:
+            self._attributes[element_type] = set(self.scenario.attributes(element_type))
+        name = self.NAMES[element_type].get(name, name)
+        if name not in self._attributes[element_type]:
+            raise ValueError(name)
+        return name
+
+    def _compile(self, specification):
+        """
+        Returns (element type, result, selection, expression code, attributes read, specification), or
+        None when the specification has to go to the network calculator.
+        """
+        selections = specification.get("selections") or {}
+        if specification.get("aggregation") or not specification.get("result") or len(selections) != 1:
+            return None
+        key, selection = list(selections.items())[0]
+        element_type = self.ELEMENT_TYPES.get(key)
+        if element_type is None:
+            return None
+        try:
+            result = self._attribute_name(element_type, str(specification["result"]))
+            selection, selection_names = self._parse_selection(element_type, str(selection))
+            expression, expression_names = self._parse_expression(element_type, str(specification["expression"]))
+        except ValueError:
+            return None
+        names = selection_names | expression_names | {result}
+        return element_type, result, selection, expression, names, specification
+
+    def _parse_selection(self, element_type, selection):
+        """
+        Returns ((name, values), attributes read) for "all", "mode=<mode ids>" or "<attribute>=<low>,<high>".
+        """
+        selection = selection.strip()
+        if selection == "all":
+            return ("all", None), set()
+        name, separator, values = selection.partition("=")
+        name = name.strip()
+        values = values.strip()
+        if name == "mode" and element_type != "NODE" and re.match(r"^\w+$", values):
+            return ("mode", values), set()
+        bounds = re.match("^%s,%s$" % (self.NUMBER, self.NUMBER), values)
+        if separator == "" or bounds is None:
+            raise ValueError(selection)
+        name = self._attribute_name(element_type, name)
+        return (name, (float(bounds.group(1)), float(bounds.group(2)))), {name}
+
+    def _parse_expression(self, element_type, expression):
+        python = []
+        names = set()
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = self.TOKEN.match(expression, position)
+            if match is None:
+                raise ValueError(expression)
+            number, name, operator = match.groups()
+            if number is not None:
+                python.append(number)
+            elif name is not None:
+                name = self._attribute_name(element_type, name)
+                names.add(name)
+                python.append("columns[%r]" % name)
+            else:
+                python.append("**" if operator == "^" else operator)
+            position = match.end()
+        if not python:
+            raise ValueError(expression)
+        return compile(" ".join(python), "<expression>", "eval"), names
+
+    def _evaluate(self, pending):
+        if not pending:
+            return []
+        read = {}
+        for element_type, result, selection, expression, names, specification in pending:
+            read.setdefault(element_type, set()).update(names)
+        tables = {}
+        for element_type, names in read.items():
+            names = sorted(names)
+            values = self.scenario.get_attribute_values(element_type, names)
+            table = {"indices": values[0]}
+            for name, column in zip(names, values[1:]):
+                table[name] = _np.array(column, dtype=_np.float64)
+            tables[element_type] = table
+        reports = []
+        written = {}
+        for element_type, result, selection, expression, names, specification in pending:
+            table = tables[element_type]
+            mask = self._select(element_type, table, selection, table[result].size)
+            with _np.errstate(all="ignore"):
+                values = _np.asarray(eval(expression, {"__builtins__": {}}, {"columns": table}), dtype=_np.float64)
+            values = _np.broadcast_to(values, mask.shape)[mask]
+            if not _np.all(_np.isfinite(values)):
+                raise Exception(
+                    "Network calculation of %s = %s for %s gives %d values that are not finite"
+                    % (
+                        specification["result"],
+                        specification["expression"],
+                        list(specification["selections"].values())[0],
+                        int(_np.count_nonzero(~_np.isfinite(values))),
+                    )
+                )
+            table[result][mask] = values
+            written.setdefault(element_type, []).append(result)
+            report = {"num_evaluated": int(values.size), "type": "NETWORK_CALCULATION"}
+            if values.size:
+                report.update(
+                    {
+                        "sum": float(values.sum()),
+                        "average": float(values.mean()),
+                        "maximum": float(values.max()),
+                        "minimum": float(values.min()),
+                    }
+                )
+            reports.append(report)
+        for element_type, results in written.items():
+            results = sorted(set(results))
+            table = tables[element_type]
+            self.scenario.set_attribute_values(
+                element_type, results, [table["indices"]] + [table[result] for result in results]
+            )
+        return reports
+
+    def _select(self, element_type, table, selection, size):
+        name, values = selection
+        if name == "all":
+            return _np.ones(size, dtype=bool)
+        if name == "mode":
+            # an element is selected when any of its modes is listed
+            mode_sets, inverse = _np.unique(self._mode_column(element_type, table), return_inverse=True)
+            return _np.array([any(mode in values for mode in mode_set) for mode_set in mode_sets])[inverse]
+        low, high = values
+        return (table[name] >= low) & (table[name] <= high)
+
+    def _mode_column(self, element_type, table):
+        """
+        Builds (once per batch) a column of the modes of each link or transit line, in attribute order.
+        """
+        if "modes" in table:
+            return table["modes"]
+        indices = table["indices"]
+        if element_type == "LINK":
+            network = self.scenario.get_partial_network(["LINK"], include_attributes=False)
+            column = _np.empty(sum(len(outgoing) for outgoing in indices.values()), dtype=object)
+            for link in network.links():
+                column[indices[link.i_node.number][link.j_node.number]] = "".join(
+                    sorted(str(mode) for mode in link.modes)
+                )
+        else:
+            network = self.scenario.get_partial_network(["TRANSIT_LINE"], include_attributes=False)
+            column = _np.empty(len(indices), dtype=object)
+            for line in network.transit_lines():
+                column[indices[line.id]] = line.mode.id
+        table["modes"] = column
+        return column
 
 
 class AssignTransit(_m.Tool()):
     version = "2.0.0"
     tool_run_msg = ""
     number_of_tasks = 15
+    # element types of the partial networks the assignment works on (nodes are loaded with the links)
+    transit_network_types = ["LINK", "TRANSIT_SEGMENT", "TRANSIT_LINE", "TRANSIT_VEHICLE"]
+    # full network loads allowed per run, checked when Python runs with assertions enabled
+    max_full_network_loads = 0
 
     def __init__(self):
         self._tracker = _util.progress_tracker(self.number_of_tasks)
@@ -84,6 +845,11 @@ class AssignTransit(_m.Tool()):
         self.connector_logit_truncation = 0.05
         self.consider_total_impedance = True
         self.use_logit_connector_choice = True
+        self._segment_layout = None
+        self._profiler = phase_profiler("")
+        self._demand_snapshot = None
+        self._iteration_log = None
+        self._full_network_loads = 0
 
     def page(self):
         if EMME_VERSION < (4, 1, 5):
@@ -108,18 +874,32 @@ class AssignTransit(_m.Tool()):
 
     def __call__(self, parameters):
         scenario = _util.load_scenario(parameters["scenario_number"])
+        self._profiler = phase_profiler(parameters.get("profile_file", ""))
+        self._full_network_loads = 0
         try:
             self._execute(scenario, parameters)
+            self._check_network_loads()
         except Exception as e:
             raise Exception(_util.format_reverse_stack())
+        finally:
+            self._close_iteration_log()
+            self._release_demand_snapshot()
+            self._profiler.close()
 
     def run_xtmf(self, parameters):
         scenario = _util.load_scenario(parameters["scenario_number"])
         # self._check_attributes_exist(scenario, parameters)
+        self._profiler = phase_profiler(parameters.get("profile_file", ""))
+        self._full_network_loads = 0
         try:
             self._execute(scenario, parameters)
+            self._check_network_loads()
         except Exception as e:
             raise Exception(_util.format_reverse_stack())
+        finally:
+            self._close_iteration_log()
+            self._release_demand_snapshot()
+            self._profiler.close()
 
     def _execute(self, scenario, parameters):
         load_input_matrix_list = self._load_input_matrices(parameters, "demand_matrix")
@@ -140,7 +920,8 @@ class AssignTransit(_m.Tool()):
         ):
             self._tracker.reset()
             with _trace("Checking travel time functions..."):
-                changes = self._heal_travel_time_functions()
+                with self._profiler.phase("Heal travel time functions"):
+                    changes = self._heal_travel_time_functions()
                 if changes == 0:
                     _write("No problems were found")
             with _util.temporary_matrix_manager() as temp_matrix_list:
@@ -203,34 +984,41 @@ class AssignTransit(_m.Tool()):
                         scenario, parameters, temp_attribute_list
                     )
                     self._tracker.start_process(5)
-                    self._assign_effective_headway(
-                        scenario,
-                        parameters,
-                        effective_headway_attribute_list[0].id,
-                    )
+                    with self._profiler.phase("Assign effective headway"):
+                        self._assign_effective_headway(
+                            scenario,
+                            parameters,
+                            effective_headway_attribute_list[0].id,
+                        )
                     self._tracker.complete_subtask()
-                    self._assign_walk_perception(scenario, parameters)
-                    if parameters["node_logit_scale"] == True:
-                        network = self._publish_efficient_connector_network(scenario)
-                    else:
-                        network = scenario.get_network()
+                    with self._profiler.phase("Assign walk perception"):
+                        self._assign_walk_perception(scenario, parameters)
+                    with self._profiler.phase("Load network"):
+                        if parameters["node_logit_scale"] == True:
+                            network = self._publish_efficient_connector_network(scenario)
+                        else:
+                            network = self._load_network(scenario, self.transit_network_types)
                     with _util.temp_extra_attribute_manager(scenario, "TRANSIT_LINE") as stsu_att:
                         with self._temp_stsu_ttfs(scenario, parameters) as temp_stsu_ttf:
                             stsu_ttf_map = temp_stsu_ttf[0]
                             ttfs_changed = temp_stsu_ttf[1]
                             if parameters["surface_transit_speed"] == True:
-                                self._set_base_speed(scenario, parameters, stsu_att, stsu_ttf_map, ttfs_changed)
-                            self._run_transit_assignment(
-                                scenario,
-                                parameters,
-                                network,
-                                stsu_att,
-                                demand_matrix_list,
-                                effective_headway_attribute_list,
-                                headway_fraction_attribute_list,
-                                impedance_matrix_list,
-                                walk_time_perception_attribute_list,
-                            )
+                                with self._profiler.phase("Set base speed"):
+                                    self._set_base_speed(
+                                        scenario, parameters, stsu_att, stsu_ttf_map, ttfs_changed, network
+                                    )
+                            with self._profiler.phase("Transit assignment"):
+                                self._run_transit_assignment(
+                                    scenario,
+                                    parameters,
+                                    network,
+                                    stsu_att,
+                                    demand_matrix_list,
+                                    effective_headway_attribute_list,
+                                    headway_fraction_attribute_list,
+                                    impedance_matrix_list,
+                                    walk_time_perception_attribute_list,
+                                )
 
     # ---LOAD - SUB FUNCTIONS -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     def _load_atts(self, scenario, parameters):
@@ -455,8 +1243,10 @@ class AssignTransit(_m.Tool()):
             "selections": {"transit_line": "hdw=15,999"},
             "type": "NETWORK_CALCULATION",
         }
-        network_calc_tool(small_headway_spec, scenario)
-        network_calc_tool(large_headway_spec, scenario)
+        calculations = network_calculation_batch(scenario, parameters.get("coalesce_network_calculations", True))
+        calculations.add(small_headway_spec)
+        calculations.add(large_headway_spec)
+        calculations.run()
 
     def _assign_walk_perception(self, scenario, parameters):
         transit_classes = parameters["transit_classes"]
@@ -464,6 +1254,7 @@ class AssignTransit(_m.Tool()):
             walk_time_perception_attribute = transit_class["walk_time_perception_attribute"]
             ex_att = scenario.extra_attribute(walk_time_perception_attribute)
             ex_att.initialize(1.0)
+        calculations = network_calculation_batch(scenario, parameters.get("coalesce_network_calculations", True))
 
         def apply_selection(val, selection):
             spec = {
@@ -473,7 +1264,8 @@ class AssignTransit(_m.Tool()):
                 "selections": {"link": selection},
                 "type": "NETWORK_CALCULATION",
             }
-            network_calc_tool(spec, scenario)
+            # the filters come from the parameters, so only "all" is evaluated on arrays
+            calculations.add(spec, coalesce=selection.strip() == "all")
 
         with _trace("Assigning perception factors"):
             for transit_class in transit_classes:
@@ -481,11 +1273,12 @@ class AssignTransit(_m.Tool()):
                     selection = str(wp["filter"])
                     value = str(wp["walk_perception_value"])
                     apply_selection(value, selection)
+            calculations.run()
 
     def _publish_efficient_connector_network(self, scenario):
         """
-        Creates a network that completely replaces the scenario network in memory/disk, with
-        one that allows for the use of a logit distribution at specified choice points.
+        Flags (in NODE data1) the choice points at which the logit distribution applies, writing only
+        that node attribute to the scenario, and returns the scenario's transit network topology.
 
         Run:
             - set "node_logit_scale" parameter = TRUE, to run Logit Discrete Choice Model
@@ -504,78 +1297,122 @@ class AssignTransit(_m.Tool()):
                    to 1 apply same to all connectors.
 
                     *** Outgoing link connector attributes must be set to -1 to override flow connectors with fixed proportions.
-        """
-        network = scenario.get_network()
-        for node in network.regular_nodes():
-            node.data1 = 0
-        for node in network.regular_nodes():
-            agency_counter = 0
-            if node.number > 99999:
-                continue
-            for link in node.incoming_links():
-                if link.i_node.is_centroid is True:
-                    node.data1 = -1
-                if link.i_node.number > 99999:
-                    agency_counter += 1
-            for link in node.outgoing_links():
-                if link.j_node.is_centroid is True:
-                    node.data1 = -1
-            if agency_counter > 1:
-                node.data1 = -1
-                for link in node.incoming_links():
-                    if link.i_node.number > 99999:
-                        link.i_node.data1 = -1
-                for link in node.outgoing_links():
-                    if link.j_node.number > 99999:
-                        link.j_node.data1 = -1
-        scenario.publish_network(network)
-        return network
 
-    def _set_base_speed(self, scenario, parameters, stsu_att, stsu_ttf_map, ttfs_changed):
+            - The flags are computed over the link i/j node arrays rather than by walking each node's links:
+              a regular node is a choice point when a link joins it to a centroid, or when more than one of
+              its incoming links starts at an agency node (numbered above 99999), in which case those agency
+              nodes are flagged too.
+        """
+        node_indices, data1 = scenario.get_attribute_values("NODE", ["data1"])
+        link_indices = scenario.get_attribute_values("LINK", [])[0]
+        number_of_nodes = len(node_indices)
+        node_numbers = _np.zeros(number_of_nodes, dtype=_np.int64)
+        node_numbers[_np.fromiter(node_indices.values(), _np.int64, number_of_nodes)] = _np.fromiter(
+            node_indices.keys(), _np.int64, number_of_nodes
+        )
+        # link end nodes as node positions, so the flags below are computed over the link arrays
+        i_nodes = []
+        j_nodes = []
+        for i_number, outgoing in link_indices.items():
+            i_nodes.extend([node_indices[i_number]] * len(outgoing))
+            j_nodes.extend(node_indices[j_number] for j_number in outgoing)
+        i_nodes = _np.asarray(i_nodes, dtype=_np.int64)
+        j_nodes = _np.asarray(j_nodes, dtype=_np.int64)
+        is_centroid = _np.zeros(number_of_nodes, dtype=bool)
+        is_centroid[[node_indices[number] for number in scenario.zone_numbers if number in node_indices]] = True
+        is_agency = node_numbers > 99999
+        is_choice_point = ~is_centroid & ~is_agency
+        centroid_adjacent = _np.zeros(number_of_nodes, dtype=bool)
+        centroid_adjacent[j_nodes[is_centroid[i_nodes]]] = True
+        centroid_adjacent[i_nodes[is_centroid[j_nodes]]] = True
+        agency_counter = _np.bincount(j_nodes[is_agency[i_nodes]], minlength=number_of_nodes)
+        multi_agency = is_choice_point & (agency_counter > 1)
+        data1 = _np.asarray(data1, dtype=_np.float64).copy()
+        data1[~is_centroid] = 0.0
+        data1[is_choice_point & centroid_adjacent] = -1.0
+        data1[multi_agency] = -1.0
+        data1[i_nodes[multi_agency[j_nodes] & is_agency[i_nodes]]] = -1.0
+        data1[j_nodes[multi_agency[i_nodes] & is_agency[j_nodes]]] = -1.0
+        scenario.set_attribute_values("NODE", ["data1"], [node_indices, data1])
+        return self._load_network(scenario, self.transit_network_types)
+
+    def _set_base_speed(self, scenario, parameters, stsu_att, stsu_ttf_map, ttfs_changed, network):
+        """
+        Sets the base dwell times, surface transit TTFs and speeds (data1) of the segments of every line
+        selected by a surface transit speed rule. Works on the scenario's attribute arrays; the network is
+        only used for its (cached) segment layout and is not modified.
+        """
         erow_defined = self._check_attributes_and_get_erow(scenario)
         self._set_up_line_attributes(scenario, parameters, stsu_att)
         ttfs_xrow = self.process_ttfs_xrow(parameters)
-        network = scenario.get_network()
-        for line in network.transit_lines():
-            for stsu in parameters["surface_transit_speeds"]:
-                if line[stsu_att.id] <= 0.0:
-                    continue
-                default_duration = stsu["default_duration"]
-                correlation = stsu["transit_auto_correlation"]
-                erow_speed_global = stsu["global_erow_speed"]
-                segments = line.segments()
-                number_of_segments = segments.__length_hint__()
-                for segment in segments:
-                    if segment.allow_alightings == True and segment.allow_boardings == True:
-                        segment.dwell_time = 0.01
-                    else:
-                        segment.dwell_time = 0.0
-                    if segment.j_node is None:
-                        continue
-                    segment_number = segment.number
-                    segment.transit_time_func = stsu_ttf_map[segment.transit_time_func]
-                    time = segment.link["auto_time"]
-                    if time > 0.0:
-                        if segment.transit_time_func in ttfs_xrow:
-                            if erow_defined == True and segment["@erow_speed"] > 0.0:
-                                segment.data1 = segment["@erow_speed"]
-                            else:
-                                segment.data1 = erow_speed_global
-                        else:
-                            segment.data1 = (segment.link.length * 60.0) / (time * correlation)
-                    if time <= 0.0:
-                        if erow_defined == True and segment["@erow_speed"] > 0.0:
-                            segment.data1 = segment["@erow_speed"]
-                        else:
-                            if segment_number <= 1 or segment_number >= (number_of_segments - 1):
-                                segment.data1 = 20
-                            else:
-                                segment.data1 = erow_speed_global
-                    if segment_number == 0:
-                        continue
-                    segment.dwell_time = (segment["@tstop"] * default_duration) / 60
-        data = network.get_attribute_values("TRANSIT_SEGMENT", ["dwell_time", "transit_time_func", "data1"])
-        scenario.set_attribute_values("TRANSIT_SEGMENT", ["dwell_time", "transit_time_func", "data1"], data)
+        layout = self._get_segment_layout(network)
+        rules = parameters["surface_transit_speeds"]
+        line_rule = _np.asarray(scenario.get_attribute_values("TRANSIT_LINE", [stsu_att.id])[1], dtype=_np.float64)
+        segment_rule = line_rule.astype(_np.int64)[layout.line] - 1
+        processed = layout.visible & (segment_rule >= 0)
+        rule = _np.maximum(segment_rule, 0)
+        default_duration = _np.asarray([float(stsu["default_duration"]) for stsu in rules])[rule]
+        correlation = _np.asarray([float(stsu["transit_auto_correlation"]) for stsu in rules])[rule]
+        erow_speed_global = _np.asarray([float(stsu["global_erow_speed"]) for stsu in rules])[rule]
+        segment_attributes = [
+            "allow_alightings",
+            "allow_boardings",
+            "transit_time_func",
+            "dwell_time",
+            "data1",
+            "@tstop",
+        ]
+        if erow_defined == True:
+            segment_attributes.append("@erow_speed")
+        data = scenario.get_attribute_values("TRANSIT_SEGMENT", segment_attributes)
+        values = dict(zip(segment_attributes, [_np.array(column, dtype=_np.float64) for column in data[1:]]))
+        link_data = scenario.get_attribute_values("LINK", ["auto_time", "length"])
+        time = layout.link_values(link_data[1])
+        length = layout.link_values(link_data[2])
+        # TTF remapping and the exclusive ROW test as lookup tables indexed by TTF number
+        ttf = values["transit_time_func"].astype(_np.int64)
+        table_size = max([int(ttf.max(initial=0))] + list(stsu_ttf_map) + list(stsu_ttf_map.values()) + list(ttfs_xrow))
+        ttf_table = _np.full(table_size + 1, -1, dtype=_np.int64)
+        for old_ttf, new_ttf in stsu_ttf_map.items():
+            ttf_table[old_ttf] = new_ttf
+        xrow_table = _np.zeros(table_size + 1, dtype=bool)
+        xrow_table[[t for t in ttfs_xrow if t >= 0]] = True
+        new_ttf = ttf_table[ttf]
+        unmapped = processed & (new_ttf < 0)
+        if unmapped.any():
+            raise Exception(
+                "No surface transit speed TTF is defined for ttf%d" % ttf[_np.flatnonzero(unmapped)[0]]
+            )
+        new_ttf = _np.where(processed, new_ttf, ttf)
+        # speeds
+        visible_segments = _np.bincount(layout.line[layout.visible], minlength=layout.number_of_lines)[layout.line]
+        line_end = (layout.number <= 1) | (layout.number >= visible_segments - 1)
+        if erow_defined == True:
+            has_erow = values["@erow_speed"] > 0.0
+            erow_speed = _np.where(has_erow, values["@erow_speed"], erow_speed_global)
+            erow_speed_no_time = _np.where(
+                has_erow, values["@erow_speed"], _np.where(line_end, 20.0, erow_speed_global)
+            )
+        else:
+            erow_speed = erow_speed_global
+            erow_speed_no_time = _np.where(line_end, 20.0, erow_speed_global)
+        with _np.errstate(divide="ignore", invalid="ignore"):
+            mixed_speed = (length * 60.0) / (time * correlation)
+        speed = _np.where(time > 0.0, _np.where(xrow_table[new_ttf], erow_speed, mixed_speed), values["data1"])
+        speed = _np.where(time <= 0.0, erow_speed_no_time, speed)
+        # dwell times: stop-based on all but the first segment of each line
+        allowed = (values["allow_alightings"] == 1.0) & (values["allow_boardings"] == 1.0)
+        dwell_time = _np.where(
+            layout.number == 0, _np.where(allowed, 0.01, 0.0), (values["@tstop"] * default_duration) / 60
+        )
+        values["dwell_time"] = _np.where(processed, dwell_time, values["dwell_time"])
+        values["transit_time_func"] = new_ttf.astype(_np.float64)
+        values["data1"] = _np.where(processed, speed, values["data1"])
+        scenario.set_attribute_values(
+            "TRANSIT_SEGMENT",
+            ["dwell_time", "transit_time_func", "data1"],
+            (data[0], values["dwell_time"], values["transit_time_func"], values["data1"]),
+        )
         ttfs_changed.append(True)
 
     def process_ttfs_xrow(self, parameters):
@@ -610,6 +1447,7 @@ class AssignTransit(_m.Tool()):
 
     def _set_up_line_attributes(self, scenario, parameters, stsu_att):
         stsu = []
+        calculations = network_calculation_batch(scenario, parameters.get("coalesce_network_calculations", True))
         for i, sts in enumerate(parameters["surface_transit_speeds"]):
             spec = {
                 "type": "NETWORK_CALCULATION",
@@ -632,7 +1470,9 @@ class AssignTransit(_m.Tool()):
                     "Please enter a correct mode filter and/or line filter in Surface Transit Speed parameters %d"
                     % (i + 1)
                 )
-            report = network_calc_tool(spec, scenario=scenario)
+            # a line filter comes from the parameters, so leave it to the network calculator
+            calculations.add(spec, coalesce=sts["line_filter_expression"] == "")
+        calculations.run()
         return stsu
 
     def _run_transit_assignment(
@@ -719,6 +1559,14 @@ class AssignTransit(_m.Tool()):
                 walk_time_perception_attribute_list,
             )
         else:
+            # loaded once; each iteration only refreshes the attributes the speed update reads
+            network = self._load_network(scenario, self.transit_network_types)
+            attributes_to_copy = {
+                "TRANSIT_LINE": ["headway"],
+                "TRANSIT_SEGMENT": ["transit_volume", "transit_boardings", "dwell_time", "transit_time_func", "@tstop"],
+            }
+            if scenario.extra_attribute("@doors") is not None:
+                attributes_to_copy["TRANSIT_LINE"].append("@doors")
             for itr in range(0, parameters["iterations"]):
                 self._run_spec_uncongested(
                     scenario,
@@ -730,7 +1578,9 @@ class AssignTransit(_m.Tool()):
                     impedance_matrix_list,
                     walk_time_perception_attribute_list,
                 )
-                network = scenario.get_network()
+                for type, atts in attributes_to_copy.items():
+                    data = scenario.get_attribute_values(type, atts)
+                    network.set_attribute_values(type, atts, data)
                 network = self._surface_transit_speed_update(scenario, parameters, network, 1)
 
     def _run_congested_assignment(
@@ -745,12 +1595,48 @@ class AssignTransit(_m.Tool()):
         effective_headway_attribute_list,
         walk_time_perception_attribute_list,
     ):
-        for iteration in range(0, parameters["iterations"] + 1):
-            with _trace("Iteration %d" % iteration):
+        checkpoint_interval = parameters.get("checkpoint_interval", 0)
+        gap_history = []
+        pruning_totals = {"files_removed": 0, "bytes_freed": 0, "strategies_removed": 0, "strategies_assigned": 0}
+        first_iteration = 0
+        last_iteration = parameters["iterations"]
+        step_scale = 1.0
+        if parameters.get("resume_from", "") != "":
+            strategies, network, state = self._resume_from_checkpoint(
+                scenario, parameters, stsu_att, demand_matrix_list
+            )
+            first_iteration = state["iteration"] + 1
+            last_iteration = state.get("last_iteration", last_iteration)
+            alphas = state["alphas"]
+            assigned_class_demand = state["assigned_class_demand"]
+            assigned_total_demand = state["assigned_total_demand"]
+            average_impedance = state["average_impedance"]
+            gap_history = state["gaps"]
+            step_scale = state.get("step_scale", 1.0)
+        elif parameters.get("warm_start", False) == True:
+            warm_start = self._warm_start(scenario, parameters, stsu_att, demand_matrix_list)
+            if warm_start is not None:
+                strategies, network, alphas, assigned_class_demand, assigned_total_demand, congestion_costs = warm_start
+                # the new strategy files are numbered after the ones kept from the previous run, which may
+                # have been pruned, so the last kept iteration and not the number of strategies counts
+                first_iteration = self._get_next_strategy_iteration(strategies, len(alphas))
+                last_iteration = first_iteration + parameters["iterations"] - 1
+                average_impedance = None
+        monitor = convergence_monitor(parameters, step_scale)
+        if parameters.get("csvfile", "") != "":
+            self._iteration_log = iteration_log(parameters["csvfile"], parameters.get("segment_snapshot_interval", 0))
+            # the log reports phase timings, so collect them even when no profile file is written
+            self._profiler.enabled = True
+        for iteration in range(first_iteration, last_iteration + 1):
+            self._profiler.iteration = iteration
+            with _trace("Iteration %d" % iteration), self._profiler.phase("Iteration"):
                 print("Starting iteration %d" % iteration)
+                iteration_start = _time.time()
+                terminate = False
 
                 if iteration == 0:
-                    strategies = self._prep_strategy_files(scenario, parameters, demand_matrix_list)
+                    with self._profiler.phase("Prepare strategy files"):
+                        strategies = self._prep_strategy_files(scenario, parameters, demand_matrix_list)
                     zeroes = [0.0] * _bank.dimensions["transit_segments"]
                     setattr(scenario._net.segment, "data3", zeroes)
                     self._run_extended_transit_assignment(
@@ -765,22 +1651,32 @@ class AssignTransit(_m.Tool()):
                         impedance_matrix_list,
                     )
                     alphas = [1.0]
-                    assigned_class_demand = self._compute_assigned_class_demand(
-                        scenario, demand_matrix_list, self.number_of_processors
-                    )
+                    with self._profiler.phase("Compute assigned class demand"):
+                        assigned_class_demand = self._compute_assigned_class_demand(
+                            scenario, demand_matrix_list, self.number_of_processors
+                        )
                     assigned_total_demand = sum(assigned_class_demand)
-                    network = self._prepare_network(scenario, parameters, stsu_att)
+                    with self._profiler.phase("Prepare network"):
+                        network = self._prepare_network(scenario, parameters, stsu_att)
                     if parameters["surface_transit_speed"] == True:
-                        network = self._surface_transit_speed_update(scenario, parameters, network, 1)
-                    average_min_trip_impedance = self._compute_min_trip_impedance(
-                        scenario, demand_matrix_list, assigned_class_demand, impedance_matrix_list
-                    )
+                        with self._profiler.phase("Surface transit speed update"):
+                            network = self._surface_transit_speed_update(scenario, parameters, network, 1)
+                    with self._profiler.phase("Compute min trip impedance"):
+                        average_min_trip_impedance = self._compute_min_trip_impedance(
+                            scenario, demand_matrix_list, assigned_class_demand, impedance_matrix_list
+                        )
                     congestion_costs = self._get_congestion_costs(parameters, network, assigned_total_demand)
                     average_impedance = average_min_trip_impedance + congestion_costs
-                    if parameters["csvfile"].lower() is not "":
-                        self._write_csv_files(iteration, network, "", "", "")
+                    if self._iteration_log is not None:
+                        self._iteration_log.append(
+                            iteration,
+                            {"iteration_seconds": _time.time() - iteration_start},
+                            self._profiler.get_phase_seconds(iteration),
+                        )
+                        self._iteration_log.snapshot(iteration, network)
                 else:
-                    excess_km = self._compute_segment_costs(scenario, parameters, network)
+                    with self._profiler.phase("Compute segment costs"):
+                        excess_km = self._compute_segment_costs(scenario, parameters, network)
                     self._run_extended_transit_assignment(
                         scenario,
                         parameters,
@@ -792,43 +1688,381 @@ class AssignTransit(_m.Tool()):
                         walk_time_perception_attribute_list,
                         impedance_matrix_list,
                     )
-                    network = self._update_network(scenario, network)
-                    average_min_trip_impedance = self._compute_min_trip_impedance(
-                        scenario, demand_matrix_list, assigned_class_demand, impedance_matrix_list
-                    )
-                    find_step_size = self._find_step_size(
-                        parameters,
-                        network,
-                        average_min_trip_impedance,
-                        average_impedance,
-                        assigned_total_demand,
-                        alphas,
-                    )
+                    with self._profiler.phase("Update network"):
+                        network = self._update_network(scenario, network)
+                    with self._profiler.phase("Compute min trip impedance"):
+                        average_min_trip_impedance = self._compute_min_trip_impedance(
+                            scenario, demand_matrix_list, assigned_class_demand, impedance_matrix_list
+                        )
+                    if average_impedance is None:
+                        # warm start: the restored volumes are taken as a best response to their own costs.
+                        # This approximation has not been checked against the gaps of a cold run, so it is
+                        # not known yet how many iterations a warm start saves on a real network
+                        average_impedance = average_min_trip_impedance + congestion_costs
+                    with self._profiler.phase("Find step size"):
+                        find_step_size = self._find_step_size(
+                            parameters,
+                            network,
+                            average_min_trip_impedance,
+                            average_impedance,
+                            assigned_total_demand,
+                            alphas,
+                            monitor.step_scale,
+                        )
                     lambdaK = find_step_size[0]
                     alphas = find_step_size[1]
-                    if parameters["surface_transit_speed"] == True:
-                        network = self._surface_transit_speed_update(scenario, parameters, network, 1)
-                    self._update_volumes(network, lambdaK)
-                    (average_impedance, cngap, crgap, norm_gap_difference, net_cost,) = self._compute_gaps(
-                        parameters,
-                        assigned_total_demand,
-                        lambdaK,
-                        average_min_trip_impedance,
-                        average_impedance,
-                        network,
+                    search_report = find_step_size[2]
+                    segment_state = find_step_size[3]
+                    if parameters.get("strategy_prune_threshold", 0.0) > 0.0:
+                        with self._profiler.phase("Prune strategies"):
+                            alphas = self._prune_strategies(
+                                scenario, parameters, strategies, alphas, pruning_totals
+                            )
+                    _write(
+                        "Step size %f found by %s search: %d gradient evaluations in %d passes"
+                        % (
+                            lambdaK,
+                            search_report["method"],
+                            search_report["gradient_evaluations"],
+                            search_report["passes"],
+                        )
                     )
-                    if parameters["csvfile"].lower() is not "":
-                        self._write_csv_files(
+                    if "evaluations_saved" in search_report:
+                        _write(
+                            "Three-point interpolation would have needed %d gradient evaluations against %d for the %s"
+                            " search (%d saved)"
+                            % (
+                                search_report["interpolation_evaluations"],
+                                search_report["gradient_evaluations"],
+                                search_report["method"],
+                                search_report["evaluations_saved"],
+                            )
+                        )
+                    if parameters["surface_transit_speed"] == True:
+                        with self._profiler.phase("Surface transit speed update"):
+                            network = self._surface_transit_speed_update(scenario, parameters, network, 1)
+                    with self._profiler.phase("Update volumes"):
+                        self._update_volumes(network, lambdaK)
+                    with self._profiler.phase("Compute gaps"):
+                        if segment_state is not None:
+                            (
+                                average_impedance,
+                                cngap,
+                                crgap,
+                                norm_gap_difference,
+                                net_cost,
+                                gradient,
+                            ) = self._compute_gaps_array(
+                                parameters,
+                                segment_state,
+                                assigned_total_demand,
+                                lambdaK,
+                                average_min_trip_impedance,
+                                average_impedance,
+                                network,
+                            )
+                        else:
+                            (average_impedance, cngap, crgap, norm_gap_difference, net_cost,) = self._compute_gaps(
+                                parameters,
+                                assigned_total_demand,
+                                lambdaK,
+                                average_min_trip_impedance,
+                                average_impedance,
+                                network,
+                            )
+                            gradient = None
+                    if self._iteration_log is not None:
+                        self._iteration_log.append(
                             iteration,
+                            {
+                                "lambda": lambdaK,
+                                "gradient": gradient if gradient is not None else "",
+                                "cngap": cngap,
+                                "crgap": crgap,
+                                "norm_gap_difference": norm_gap_difference,
+                                "excess_km": excess_km,
+                                "iteration_seconds": _time.time() - iteration_start,
+                            },
+                            self._profiler.get_phase_seconds(iteration),
+                        )
+                        self._iteration_log.snapshot(iteration, network)
+                    gap_history.append(
+                        {
+                            "iteration": iteration,
+                            "lambda": lambdaK,
+                            "gradient": gradient,
+                            "cngap": cngap,
+                            "crgap": crgap,
+                            "norm_gap_difference": norm_gap_difference,
+                        }
+                    )
+                    monitor.record_time(_time.time() - iteration_start)
+                    decision = monitor.assess(gap_history, iteration, last_iteration)
+                    terminate = decision is not None and decision["action"] == "terminate"
+                if checkpoint_interval > 0 and iteration % checkpoint_interval == 0:
+                    with self._profiler.phase("Write checkpoint"):
+                        self._write_checkpoint(
+                            scenario,
                             network,
-                            cngap,
-                            crgap,
-                            norm_gap_difference,
+                            strategies,
+                            {
+                                "iteration": iteration,
+                                "last_iteration": last_iteration,
+                                "alphas": alphas,
+                                "assigned_class_demand": assigned_class_demand,
+                                "assigned_total_demand": assigned_total_demand,
+                                "average_impedance": average_impedance,
+                                "gaps": gap_history,
+                                "step_scale": monitor.step_scale,
+                            },
                         )
-                    if crgap < parameters["rel_gap"] or norm_gap_difference >= 0:
-                        break
+                if iteration > 0 and (crgap < parameters["rel_gap"] or norm_gap_difference >= 0):
+                    break
+                if terminate:
+                    monitor.report_termination(iteration, last_iteration)
+                    break
+        strategies.data["assigned_total_demand"] = assigned_total_demand
+        self._close_iteration_log()
+        if pruning_totals["strategies_removed"] > 0:
+            _write(
+                "Strategy pruning removed %d strategy files (%s); %d of %d strategies remain, so strategy"
+                " analyses now read %.1f%% fewer strategies"
+                % (
+                    pruning_totals["files_removed"],
+                    self._format_bytes(pruning_totals["bytes_freed"]),
+                    len(alphas),
+                    pruning_totals["strategies_assigned"],
+                    100.0 * pruning_totals["strategies_removed"] / pruning_totals["strategies_assigned"],
+                )
+            )
         return (strategies, alphas, network)
 
+    def _prune_strategies(self, scenario, parameters, strategies, alphas, pruning_totals):
+        """
+        Drops the strategies whose alpha fell below parameters["strategy_prune_threshold"], deleting their
+        strategy files for every class, and renormalises the remaining alphas to sum to one. The blended
+        volumes already include the dropped strategies, so the threshold bounds the weight by which the
+        strategy-based analyses may differ from them. Returns the new alphas and adds to pruning_totals.
+        """
+        threshold = parameters["strategy_prune_threshold"]
+        pruning_totals["strategies_assigned"] = pruning_totals["strategies_removed"] + len(alphas)
+        keep = [i for i, alpha in enumerate(alphas) if alpha >= threshold]
+        if len(keep) == len(alphas):
+            return alphas
+        if not keep:
+            keep = [max(range(len(alphas)), key=lambda i: alphas[i])]
+        removed_alpha = 1.0 - sum(alphas[i] for i in keep) / sum(alphas)
+        kept_total = sum(alphas[i] for i in keep)
+        strategy_directory = self._get_strategy_directory(scenario)
+        size_before = self._get_directory_size(strategy_directory)
+        kept = set(keep)
+        files_removed = 0
+        for class_data in strategies.data["classes"]:
+            class_files = class_data["strat_files"]
+            for i in range(len(class_files)):
+                if i not in kept:
+                    strategies.delete_strat_file(class_files[i])
+                    files_removed += 1
+            class_data["strat_files"] = [class_files[i] for i in keep]
+        size_after = self._get_directory_size(strategy_directory)
+        bytes_freed = 0
+        if size_before is not None and size_after is not None:
+            bytes_freed = max(size_before - size_after, 0)
+        pruning_totals["files_removed"] += files_removed
+        pruning_totals["bytes_freed"] += bytes_freed
+        pruning_totals["strategies_removed"] += len(alphas) - len(keep)
+        _write(
+            "Pruned %d strategies below alpha %g (total weight %g): %d strategy files, %s"
+            % (len(alphas) - len(keep), threshold, removed_alpha, files_removed, self._format_bytes(bytes_freed))
+        )
+        return [alphas[i] / kept_total for i in keep]
+
+    def _get_strategy_directory(self, scenario):
+        """
+        Returns the directory next to the emmebank in which Emme stores the strategy files of the scenario.
+        """
+        return os.path.join(os.path.dirname(os.path.abspath(scenario.emmebank.path)), "STRATS_s%s" % scenario.number)
+
+    def _get_directory_size(self, path):
+        """
+        Returns the total size in bytes of the files under `path`, or None when it is not a directory.
+        """
+        if not os.path.isdir(path):
+            return None
+        total = 0
+        for directory, _, file_names in os.walk(path):
+            for file_name in file_names:
+                try:
+                    total += os.path.getsize(os.path.join(directory, file_name))
+                except OSError:
+                    pass
+        return total
+
+    def _get_next_strategy_iteration(self, strategies, default):
+        """
+        Returns the iteration after the last one whose strategy files are on the scenario, or `default`
+        when none of the files is named "Iteration <number> <class>".
+        """
+        iterations = []
+        for strat_file in strategies.strat_files():
+            match = re.match(r"Iteration (\d+) ", strat_file.name)
+            if match is not None:
+                iterations.append(int(match.group(1)))
+        if not iterations:
+            return default
+        return max(iterations) + 1
+
+    def _format_bytes(self, number_of_bytes):
+        if number_of_bytes == 0:
+            return "size not reported"
+        for unit in ("bytes", "KB", "MB"):
+            if number_of_bytes < 1024.0:
+                return "%.1f %s" % (number_of_bytes, unit)
+            number_of_bytes /= 1024.0
+        return "%.1f GB" % number_of_bytes
+
+    def _warm_start(self, scenario, parameters, stsu_att, demand_matrix_list):
+        """
+        Seeds the congested assignment with the results a previous run saved on the scenario: its
+        strategy files and alphas are kept, and its blended volumes (scaled to the new assigned
+        demand) become the starting solution, so no all-or-nothing iteration 0 is needed. The
+        uncongested segment times are recovered from the saved transit times and @ccost.
+
+        Returns None, after logging why, when the scenario holds no usable previous results.
+        """
+        strategies = scenario.transit_strategies
+        previous = strategies.data or {}
+        alphas = previous.get("alphas")
+        if scenario.extra_attribute("@ccost") is None or not alphas or "classes" not in previous:
+            _write("No previous congested assignment results on scenario %s, starting from iteration 0" % scenario)
+            return None
+        previous_files = dict((class_data["name"], class_data["strat_files"]) for class_data in previous["classes"])
+        existing_files = set(strat_file.name for strat_file in strategies.strat_files())
+        for transit_class in parameters["transit_classes"]:
+            class_files = previous_files.get(transit_class["name"])
+            if class_files is None or len(class_files) != len(alphas) or not existing_files.issuperset(class_files):
+                _write(
+                    "Previous strategies of scenario %s do not match transit class '%s', starting from iteration 0"
+                    % (scenario, transit_class["name"])
+                )
+                return None
+        assigned_class_demand = self._compute_assigned_class_demand(
+            scenario, demand_matrix_list, self.number_of_processors
+        )
+        assigned_total_demand = sum(assigned_class_demand)
+        previous_total_demand = previous.get("assigned_total_demand", assigned_total_demand)
+        if not previous_total_demand > 0.0:
+            # the previous volumes cannot be scaled to the new demand, e.g. after a run with empty demand
+            _write("The previous run on scenario %s assigned no demand, starting from iteration 0" % scenario)
+            return None
+        demand_ratio = assigned_total_demand / previous_total_demand
+        data = self._get_strategy_data(scenario, parameters, demand_matrix_list)
+        for class_data in data["classes"]:
+            class_data["strat_files"] = list(previous_files[class_data["name"]])
+        strategies.data = data
+        network = self._prepare_network(scenario, parameters, stsu_att)
+        for type, mapping in self._attribute_mapping().items():
+            attributes = [dest for dest in mapping.values() if dest != "timtr"]
+            data = network.get_attribute_values(type, attributes)
+            scaled = [_np.asarray(values, dtype=_np.float64) * demand_ratio for values in data[1:]]
+            network.set_attribute_values(type, attributes, [data[0]] + scaled)
+        network.copy_attribute("TRANSIT_SEGMENT", "voltr", "transit_volume")
+        network.copy_attribute("TRANSIT_SEGMENT", "board", "transit_boardings")
+        layout = self._get_segment_layout(network)
+        data = network.get_attribute_values("TRANSIT_SEGMENT", ["transit_time", "base_dwell_time"])
+        transit_time, base_dwell_time = [_np.asarray(values, dtype=_np.float64) for values in data[1:]]
+        congestion_time = scenario.get_attribute_values("TRANSIT_SEGMENT", ["@ccost"])[1]
+        congestion_time = _np.asarray(congestion_time, dtype=_np.float64)
+        uncongested_time = _np.where(
+            layout.visible, transit_time - congestion_time + base_dwell_time[layout.next], transit_time
+        )
+        network.set_attribute_values(
+            "TRANSIT_SEGMENT", ["uncongested_time", "timtr"], (data[0], uncongested_time, uncongested_time)
+        )
+        if parameters["surface_transit_speed"] == True:
+            network = self._surface_transit_speed_update(scenario, parameters, network, 1)
+        congestion_costs = self._get_congestion_costs(parameters, network, assigned_total_demand)
+        _write(
+            "Warm start from %d previous strategies, volumes scaled by %f for the new demand"
+            % (len(alphas), demand_ratio)
+        )
+        return strategies, network, list(alphas), assigned_class_demand, assigned_total_demand, congestion_costs
+
+    def _checkpoint_attributes(self):
+        atts = {
+            "NODE": ["inboa", "fiali"],
+            "LINK": ["volax"],
+            "TRANSIT_SEGMENT": ["voltr", "board", "dwell_time", "uncongested_time", "base_dwell_time"],
+        }
+        return atts
+
+    def _get_checkpoint_path(self, scenario):
+        return os.path.join(
+            os.path.dirname(os.path.abspath(_bank.path)), "congested_transit_%s.checkpoint" % scenario.number
+        )
+
+    def _write_checkpoint(self, scenario, network, strategies, state):
+        """
+        Saves the iteration state (scalars, gaps, strategy files per class) and the blended network
+        arrays as a compressed NumPy archive next to the emmebank. The file is written to a temporary
+        name first, so an interruption while saving never leaves a truncated checkpoint behind.
+        """
+        state = dict(state)
+        state["scenario"] = scenario.number
+        state["strategy_files"] = {
+            class_data["name"]: list(class_data["strat_files"]) for class_data in strategies.data["classes"]
+        }
+        arrays = {"state": _np.array(json.dumps(state))}
+        for type, attributes in self._checkpoint_attributes().items():
+            data = network.get_attribute_values(type, attributes)
+            for attribute, values in zip(attributes, data[1:]):
+                arrays["%s:%s" % (type, attribute)] = _np.asarray(values, dtype=_np.float64)
+        path = self._get_checkpoint_path(scenario)
+        with open(path + ".tmp", "wb") as checkpoint_file:
+            _np.savez_compressed(checkpoint_file, **arrays)
+        os.replace(path + ".tmp", path)
+        _write("Checkpoint of iteration %d saved to %s" % (state["iteration"], path))
+
+    def _resume_from_checkpoint(self, scenario, parameters, stsu_att, demand_matrix_list):
+        """
+        Restores the state saved by _write_checkpoint, so the congested loop can continue with the
+        iteration after it. Strategy files written after the checkpoint are deleted.
+        """
+        path = parameters["resume_from"]
+        if not os.path.isfile(path):
+            raise Exception("Checkpoint file '%s' was not found" % path)
+        with _np.load(path) as checkpoint:
+            state = json.loads(str(checkpoint["state"]))
+            arrays = {key: checkpoint[key] for key in checkpoint.files if key != "state"}
+        if state["scenario"] != scenario.number:
+            raise Exception("Checkpoint '%s' belongs to scenario %s, not %s" % (path, state["scenario"], scenario))
+        strategies = scenario.transit_strategies
+        data = self._get_strategy_data(scenario, parameters, demand_matrix_list)
+        kept_files = set()
+        for class_data in data["classes"]:
+            class_data["strat_files"] = state["strategy_files"][class_data["name"]]
+            kept_files.update(class_data["strat_files"])
+        existing_files = set(strat_file.name for strat_file in strategies.strat_files())
+        if not kept_files.issubset(existing_files):
+            raise Exception(
+                "Strategy files %s of checkpoint '%s' are missing from scenario %s"
+                % (", ".join(sorted(kept_files - existing_files)), path, scenario)
+            )
+        for name in existing_files - kept_files:
+            strategies.delete_strat_file(name)
+        strategies.data = data
+        strategies._save_config()
+        network = self._prepare_network(scenario, parameters, stsu_att)
+        for type, attributes in self._checkpoint_attributes().items():
+            indices = network.get_attribute_values(type, [])[0]
+            network.set_attribute_values(
+                type, attributes, [indices] + [arrays["%s:%s" % (type, attribute)] for attribute in attributes]
+            )
+        data = network.get_attribute_values("TRANSIT_SEGMENT", ["dwell_time"])
+        scenario.set_attribute_values("TRANSIT_SEGMENT", ["dwell_time"], data)
+        _write("Resuming from the checkpoint of iteration %d in %s" % (state["iteration"], path))
+        return strategies, network, state
+
     def _run_spec_uncongested(
         self,
         scenario,
@@ -862,7 +2096,8 @@ class AssignTransit(_m.Tool()):
                 parameters["walk_all_way_flag"],
                 walk_time_perception_attribute_list[i],
             )
-            self._tracker.run_tool(
+            self._run_tool(
+                "Extended transit assignment (%s)" % transit_class["name"],
                 extended_assignment_tool,
                 specification=spec_uncongested,
                 class_name=transit_class["name"],
@@ -985,63 +2220,50 @@ class AssignTransit(_m.Tool()):
     def _surface_transit_speed_update(self, scenario, parameters, network, lambdaK):
         if "transit_alightings" not in network.attributes("TRANSIT_SEGMENT"):
             network.create_attribute("TRANSIT_SEGMENT", "transit_alightings", 0.0)
-        for line in network.transit_lines():
-            prev_volume = 0.0
-            headway = line.headway
-            number_of_trips = parameters["assignment_period"] * 60.0 / headway
-            for stsu in parameters["surface_transit_speeds"]:
-                boarding_duration = stsu["boarding_duration"]
-                alighting_duration = stsu["alighting_duration"]
-                default_duration = stsu["default_duration"]
-                try:
-                    doors = segment.line["@doors"]
-                    if doors == 0.0:
-                        number_of_door_pairs = 1.0
-                    else:
-                        number_of_door_pairs = doors / 2.0
-                except:
-                    number_of_door_pairs = 1.0
-
-                for segment in line.segments(include_hidden=True):
-                    segment_number = segment.number
-                    if segment_number > 0 and segment.j_node is not None:
-                        segment.transit_alightings = max(
-                            prev_volume + segment.transit_boardings - segment.transit_volume,
-                            0.0,
-                        )
-                    else:
-                        continue
-                    # prevVolume is used above for the previous segments volume, the first segment is always ignored.
-                    prev_volume = segment.transit_volume
-
-                    boarding = segment.transit_boardings / number_of_trips / number_of_door_pairs
-                    alighting = segment.transit_alightings / number_of_trips / number_of_door_pairs
-
-                    old_dwell = segment.dwell_time
-                    # in seconds
-                    segment_dwell_time = (
-                        (boarding_duration * boarding)
-                        + (alighting_duration * alighting)
-                        + (segment["@tstop"] * default_duration)
-                    )
-                    # in minutes
-                    segment_dwell_time /= 60
-                    if segment_dwell_time >= 99.99:
-                        segment_dwell_time = 99.98
-                    alpha = 1 - lambdaK
-                    segment.dwell_time = old_dwell * alpha + segment_dwell_time * lambdaK
+        layout = self._get_segment_layout(network)
+        data = network.get_attribute_values(
+            "TRANSIT_SEGMENT", ["transit_volume", "transit_boardings", "transit_alightings", "dwell_time", "@tstop"]
+        )
+        volume, boardings, alightings, dwell_time, stops = [_np.array(values, dtype=_np.float64) for values in data[1:]]
+        # the first segment of each line is always ignored, and the second one sees no previous volume
+        updated = layout.visible & (layout.number > 0)
+        prev_volume = _np.where(layout.number > 1, volume[layout.previous], 0.0)
+        alightings = _np.where(updated, _np.maximum(prev_volume + boardings - volume, 0.0), alightings)
+        headway = _np.asarray(network.get_attribute_values("TRANSIT_LINE", ["headway"])[1], dtype=_np.float64)
+        number_of_trips = (parameters["assignment_period"] * 60.0 / headway)[layout.line]
+        if "@doors" in network.attributes("TRANSIT_LINE"):
+            doors = _np.asarray(network.get_attribute_values("TRANSIT_LINE", ["@doors"])[1], dtype=_np.float64)
+            number_of_door_pairs = _np.where(doors == 0.0, 1.0, doors / 2.0)[layout.line]
+        else:
+            number_of_door_pairs = 1.0
+        boarding = boardings / number_of_trips / number_of_door_pairs
+        alighting = alightings / number_of_trips / number_of_door_pairs
+        alpha = 1 - lambdaK
+        for stsu in parameters["surface_transit_speeds"]:
+            # in seconds
+            segment_dwell_time = (
+                (stsu["boarding_duration"] * boarding)
+                + (stsu["alighting_duration"] * alighting)
+                + (stops * stsu["default_duration"])
+            )
+            # in minutes
+            segment_dwell_time /= 60
+            segment_dwell_time[segment_dwell_time >= 99.99] = 99.98
+            dwell_time = _np.where(updated, dwell_time * alpha + segment_dwell_time * lambdaK, dwell_time)
+        network.set_attribute_values(
+            "TRANSIT_SEGMENT", ["transit_alightings", "dwell_time"], (data[0], alightings, dwell_time)
+        )
         data = network.get_attribute_values("TRANSIT_SEGMENT", ["dwell_time", "transit_time_func"])
         scenario.set_attribute_values("TRANSIT_SEGMENT", ["dwell_time", "transit_time_func"], data)
         return network
 
     def _add_cong_term_to_func(self, scenario):
-        used_functions = set()
-        any_non_zero = False
-        for segment in scenario.get_network().transit_segments():
-            if segment.transit_time_func != 0:
-                used_functions.add("ft" + str(segment.transit_time_func))
-                any_non_zero = True
-        if not any_non_zero:
+        segment_indices, ttf = scenario.get_attribute_values("TRANSIT_SEGMENT", ["transit_time_func"])
+        # the last segment of each line is the hidden one, which network.transit_segments() leaves out
+        visible = [index for positions in segment_indices.values() for index in positions[:-1]]
+        ttf = _np.asarray(ttf, dtype=_np.int64)[visible]
+        used_functions = set("ft" + str(value) for value in _np.unique(ttf[ttf != 0]))
+        if not used_functions:
             raise Exception("All segments have a TTF of 0!")
         return list(used_functions)
 
@@ -1078,61 +2300,83 @@ class AssignTransit(_m.Tool()):
         return attributes
 
     def _get_func_spec(self, parameters):
-        partial_spec = (
-            "import math \ndef calc_segment_cost(transit_volume, capacity, segment):\n    cap_period = "
-            + str(parameters["assignment_period"])
-        )
-        i = 0
-        for ttf_def in parameters["ttf_definitions"]:
-            ttf = ttf_def["ttf"]
-            alpha = ttf_def["congestion_exponent"]
-            beta = (2 * alpha - 1) / (2 * alpha - 2)
-            alpha_square = alpha ** 2
-            beta_square = beta ** 2
-            perception = ttf_def["congestion_perception"]
-            if i == 0:
-                partial_spec += (
-                    "\n    if segment.transit_time_func == "
-                    + f"{ttf}"
-                    + ": \n        return max(0,("
-                    + f"{perception}"
-                    + " * (1 + math.sqrt("
-                    + str(alpha_square)
-                    + " * \n            (1 - transit_volume / capacity) ** 2 + "
-                    + str(beta_square)
-                    + ") - "
-                    + str(alpha)
-                    + " \n            * (1 - transit_volume / capacity) - "
-                    + str(beta)
-                    + ")))"
-                )
-            else:
-                partial_spec += (
-                    "\n    elif segment.transit_time_func == "
-                    + f"{ttf}"
-                    + ": \n        return max(0,("
-                    + f"{perception}"
-                    + " * (1 + math.sqrt("
-                    + str(alpha_square)
-                    + " *  \n            (1 - transit_volume / capacity) ** 2 + "
-                    + str(beta_square)
-                    + ") - "
-                    + str(alpha)
-                    + " \n            * (1 - transit_volume / capacity) - "
-                    + str(beta)
-                    + ")))"
-                )
-            i += 1
-        partial_spec += '\n    else: \n        raise Exception("ttf=%s congestion values not defined in input" %s segment.transit_time_func)'
+        """
+        Returns the CUSTOM congestion function spec. The generated calc_segment_cost looks the conical
+        constants of the segment's TTF up in a table built into the source, so its cost does not grow
+        with the number of TTF definitions. Specs are generated (and validated) once per distinct set
+        of TTF definitions and assignment period.
+        """
+        key = self._get_func_spec_key(parameters)
+        if key not in _congestion_function_cache:
+            source = self._generate_congestion_function(parameters)
+            self._validate_congestion_function(parameters, source)
+            _congestion_function_cache[key] = source
         func_spec = {
             "type": "CUSTOM",
             "assignment_period": parameters["assignment_period"],
             "orig_func": False,
             "congestion_attribute": "us3",
-            "python_function": partial_spec,
+            "python_function": _congestion_function_cache[key],
         }
         return func_spec
 
+    def _get_func_spec_key(self, parameters):
+        ttf_definitions = tuple(
+            (ttf_def["ttf"], ttf_def["congestion_exponent"], ttf_def["congestion_perception"])
+            for ttf_def in parameters["ttf_definitions"]
+        )
+        return hash((ttf_definitions, parameters["assignment_period"]))
+
+    def _generate_congestion_function(self, parameters):
+        constants = {}
+        for ttf_def in parameters["ttf_definitions"]:
+            ttf = int(ttf_def["ttf"])
+            if ttf in constants:
+                # as in _calculate_segment_cost, the first definition of a TTF wins
+                continue
+            alpha = ttf_def["congestion_exponent"]
+            beta = (2 * alpha - 1) / (2 * alpha - 2)
+            constants[ttf] = (ttf_def["congestion_perception"], alpha, beta, alpha ** 2, beta ** 2)
+        table = ",\n".join(
+            "    %d: (%r, %r, %r, %r, %r)" % ((ttf,) + values) for ttf, values in constants.items()
+        )
+        return (
+            "import math\n"
+            "CONGESTION_CONSTANTS = {\n" + table + ",\n}\n"
+            "def calc_segment_cost(transit_volume, capacity, segment):\n"
+            "    cap_period = %r\n"
+            "    constants = CONGESTION_CONSTANTS.get(segment.transit_time_func)\n"
+            "    if constants is None:\n"
+            '        raise Exception("ttf=%%s congestion values not defined in input" %% segment.transit_time_func)\n'
+            "    perception, alpha, beta, alpha_square, beta_square = constants\n"
+            "    return max(0, perception * (1 + math.sqrt(alpha_square * (1 - transit_volume / capacity) ** 2\n"
+            "        + beta_square) - alpha * (1 - transit_volume / capacity) - beta))\n"
+        ) % parameters["assignment_period"]
+
+    def _validate_congestion_function(self, parameters, source):
+        """
+        Checks the generated calc_segment_cost against _calculate_segment_cost for every defined TTF
+        over a range of volume to capacity ratios.
+        """
+        namespace = {}
+        exec(compile(source, "<congestion function>", "exec"), namespace)
+        calc_segment_cost = namespace["calc_segment_cost"]
+
+        class segment:
+            pass
+
+        capacity = 100.0
+        for ttf_def in parameters["ttf_definitions"]:
+            segment.transit_time_func = int(ttf_def["ttf"])
+            for transit_volume in _np.linspace(0.0, 2.0 * capacity, 41):
+                expected = self._calculate_segment_cost(parameters, transit_volume, capacity, segment)
+                generated = calc_segment_cost(transit_volume, capacity, segment)
+                if not math.isclose(generated, expected, rel_tol=1e-12, abs_tol=1e-12):
+                    raise Exception(
+                        "Generated congestion function gives %s instead of %s for ttf=%s at volume %s"
+                        % (generated, expected, segment.transit_time_func, transit_volume)
+                    )
+
     def _get_base_assignment_spec(
         self,
         scenario,
@@ -1276,14 +2520,16 @@ class AssignTransit(_m.Tool()):
                     transit_class["link_fare_attribute_id"],
                 )
                 if index == 0:
-                    self._tracker.run_tool(
+                    self._run_tool(
+                        "Extended transit assignment (%s)" % transit_class["name"],
                         assignment_tool,
                         specification=spec,
                         scenario=scenario,
                         add_volumes=False,
                     )
                 else:
-                    self._tracker.run_tool(
+                    self._run_tool(
+                        "Extended transit assignment (%s)" % transit_class["name"],
                         assignment_tool,
                         specification=spec,
                         scenario=scenario,
@@ -1296,10 +2542,21 @@ class AssignTransit(_m.Tool()):
                 values = scenario.get_attribute_values("TRANSIT_SEGMENT", ["transit_time"])
                 strategies_file.add_attr_values("TRANSIT_SEGMENT", "transit_time", values[1])
 
+    def _run_tool(self, phase_name, tool, **kwargs):
+        """
+        Runs an Emme tool through the progress tracker, profiled as its own phase.
+        """
+        with self._profiler.phase(phase_name):
+            return self._tracker.run_tool(tool, **kwargs)
+
     def _prep_strategy_files(self, scenario, parameters, demand_matrix_list):
         strategies = scenario.transit_strategies
         strategies.clear()
         _time.sleep(0.05)
+        strategies.data = self._get_strategy_data(scenario, parameters, demand_matrix_list)
+        return strategies
+
+    def _get_strategy_data(self, scenario, parameters, demand_matrix_list):
         data = {
             "type": "CONGESTED_TRANSIT_ASSIGNMENT",
             "namespace": str(self),
@@ -1315,9 +2572,10 @@ class AssignTransit(_m.Tool()):
             return "".join(modes)
 
         class_data = []
+        snapshot = self._get_demand_snapshot(scenario, [_bank.matrix(matrix) for matrix in demand_matrix_list])
         for i, transit_class in enumerate(parameters["transit_classes"]):
             name = transit_class["name"]
-            demand = _MODELLER.matrix_snapshot(_bank.matrix(demand_matrix_list[i]))
+            demand = snapshot.get_matrix_snapshot(i)
             modes = transit_class["mode"]
             class_data.append(
                 {
@@ -1329,24 +2587,32 @@ class AssignTransit(_m.Tool()):
             )
         data["classes"] = class_data
         data["multi_class"] = True
-        strategies.data = data
-        return strategies
+        return data
+
+    def _get_demand_snapshot(self, scenario, demand_matrix_list):
+        """
+        Returns the demand snapshot of the current assignment, taking it on first use (or when the demand
+        matrices changed since it was taken).
+        """
+        key = demand_snapshot.get_key(demand_matrix_list)
+        if self._demand_snapshot is None or self._demand_snapshot.key != key:
+            self._release_demand_snapshot()
+            self._demand_snapshot = demand_snapshot(scenario, demand_matrix_list)
+        return self._demand_snapshot
+
+    def _close_iteration_log(self):
+        if self._iteration_log is not None:
+            self._iteration_log.close()
+            self._iteration_log = None
+
+    def _release_demand_snapshot(self):
+        if self._demand_snapshot is not None:
+            self._demand_snapshot.release()
+            self._demand_snapshot = None
 
     def _compute_assigned_class_demand(self, scenario, demand_matrix_list, number_of_processors):
         assigned_demand = []
-        for i in range(0, len(demand_matrix_list)):
-            matrix_calc_spec = {
-                "type": "MATRIX_CALCULATION",
-                "expression": str(demand_matrix_list[i]) + " * (p.ne.q)",
-                # "expression": "mf10",
-                "aggregation": {"origins": "+", "destinations": "+"},
-            }
-            report = matrix_calc_tool(
-                specification=matrix_calc_spec,
-                scenario=scenario,
-                num_processors=number_of_processors,
-            )
-            trips = report["result"]
+        for trips in self._get_demand_snapshot(scenario, demand_matrix_list).totals:
             if trips <= 0:
                 raise Exception("Invalid number of trips assigned")
             assigned_demand.append(trips)
@@ -1355,42 +2621,28 @@ class AssignTransit(_m.Tool()):
     def _compute_min_trip_impedance(self, scenario, demand_matrix_list, assigned_class_demand, impedance_matrix_list):
         average_min_trip_impedance = 0.0
         class_imped = []
+        snapshot = self._get_demand_snapshot(scenario, demand_matrix_list)
         for i in range(0, len(assigned_class_demand)):
-            matrix_calc_spec = {
-                "type": "MATRIX_CALCULATION",
-                "expression": str(impedance_matrix_list[i].id)
-                + "*"
-                + str(demand_matrix_list[i])
-                + "/"
-                + str(assigned_class_demand[i]),
-                "aggregation": {"origins": "+", "destinations": "+"},
-            }
-            report = matrix_calc_tool(
-                specification=matrix_calc_spec,
-                scenario=scenario,
-                num_processors=self.number_of_processors,
-            )
-            class_imped.append(float(report["result"]))
+            impedance = _np.asarray(impedance_matrix_list[i].get_numpy_data(scenario.id), dtype=_np.float64)
+            demand = snapshot.get_matrix(i)
+            class_imped.append(float(_np.dot(impedance.ravel(), demand.ravel())) / assigned_class_demand[i])
         for i in range(0, len(assigned_class_demand)):
             average_min_trip_impedance += class_imped[i] * assigned_class_demand[i]
         average_min_trip_impedance = average_min_trip_impedance / sum(assigned_class_demand)
         return average_min_trip_impedance
 
     def _get_congestion_costs(self, parameters, network, assigned_total_demand):
-        congestion_cost = 0.0
-        for line in network.transit_lines():
-            capacity = float(line.total_capacity)
-            for segment in line.segments():
-                flow_X_time = float(segment.voltr) * (float(segment.timtr) - float(segment.dwell_time))
-                congestion = self._calculate_segment_cost(parameters, float(segment.voltr), capacity, segment)
-                congestion_cost += flow_X_time * congestion
+        layout = self._get_segment_layout(network)
+        data = network.get_attribute_values("TRANSIT_SEGMENT", ["voltr", "timtr", "dwell_time", "transit_time_func"])
+        voltr, timtr, dwell_time, ttf = [_np.asarray(values, dtype=_np.float64) for values in data[1:]]
+        capacity = self._get_segment_capacity(network, layout)
+        congestion = self._calculate_segment_cost_array(self._get_ttf_lookup(parameters), voltr, capacity, ttf)
+        flow_X_time = voltr * (timtr - dwell_time)
+        congestion_cost = float(_np.sum(_np.where(layout.visible, flow_X_time * congestion, 0.0)))
         return congestion_cost / assigned_total_demand
 
     def _prepare_network(self, scenario, parameters, stsu_att):
-        network = scenario.get_partial_network(
-            ["LINK", "TRANSIT_SEGMENT", "TRANSIT_LINE", "TRANSIT_VEHICLE"],
-            include_attributes=False,
-        )
+        network = self._load_network(scenario, self.transit_network_types)
         attributes_to_copy = {
             "TRANSIT_VEHICLE": ["total_capacity"],
             "NODE": ["initial_boardings", "final_alightings"],
@@ -1592,19 +2844,119 @@ class AssignTransit(_m.Tool()):
                 return max(0, cost)
         return 0
 
+    def _get_ttf_lookup(self, parameters):
+        """
+        Precomputes the conical congestion constants of every TTF definition into arrays indexed by
+        transit_time_func. As in _calculate_segment_cost, the first definition of a TTF wins.
+        """
+        size = max([int(ttf_def["ttf"]) for ttf_def in parameters["ttf_definitions"]] + [0]) + 1
+        ttf_lookup = {
+            "defined": _np.zeros(size, dtype=bool),
+            "perception": _np.zeros(size),
+            "alpha": _np.zeros(size),
+            "beta": _np.zeros(size),
+            "alpha_square": _np.zeros(size),
+            "beta_square": _np.zeros(size),
+        }
+        for ttf_def in parameters["ttf_definitions"]:
+            ttf = int(ttf_def["ttf"])
+            if ttf_lookup["defined"][ttf]:
+                continue
+            alpha = ttf_def["congestion_exponent"]
+            beta = (2 * alpha - 1) / (2 * alpha - 2)
+            ttf_lookup["defined"][ttf] = True
+            ttf_lookup["perception"][ttf] = ttf_def["congestion_perception"]
+            ttf_lookup["alpha"][ttf] = alpha
+            ttf_lookup["beta"][ttf] = beta
+            ttf_lookup["alpha_square"][ttf] = alpha ** 2
+            ttf_lookup["beta_square"][ttf] = beta ** 2
+        return ttf_lookup
+
+    def _calculate_segment_cost_array(self, ttf_lookup, transit_volume, capacity, ttf):
+        """
+        Array version of _calculate_segment_cost: evaluates the conical congestion term for all segments
+        at once, using the same operation order so results match the scalar version bit for bit.
+        Segments whose TTF has no definition get a cost of 0.
+        """
+        ttf = _np.asarray(ttf).astype(_np.int64)
+        in_range = (ttf >= 0) & (ttf < len(ttf_lookup["defined"]))
+        ttf = _np.where(in_range, ttf, 0)
+        defined = ttf_lookup["defined"][ttf] & in_range
+        alpha = ttf_lookup["alpha"][ttf]
+        with _np.errstate(divide="ignore", invalid="ignore"):
+            ratio = 1 - _np.asarray(transit_volume, dtype=_np.float64) / capacity
+            cost = ttf_lookup["perception"][ttf] * (
+                1
+                + _np.sqrt(ttf_lookup["alpha_square"][ttf] * ratio ** 2 + ttf_lookup["beta_square"][ttf])
+                - alpha * ratio
+                - ttf_lookup["beta"][ttf]
+            )
+        return _np.where(defined, _np.fmax(cost, 0.0), 0.0)
+
+    def _calculate_segment_cost_derivative_array(self, ttf_lookup, transit_volume, capacity, ttf):
+        """
+        Returns the conical congestion term of _calculate_segment_cost_array and its closed-form derivative
+        with respect to volume, perception * alpha / capacity * (1 - alpha * r / sqrt(alpha^2 r^2 + beta^2))
+        with r = 1 - volume / capacity. The derivative is 0 wherever the cost is clamped to 0.
+        """
+        ttf = _np.asarray(ttf).astype(_np.int64)
+        in_range = (ttf >= 0) & (ttf < len(ttf_lookup["defined"]))
+        ttf = _np.where(in_range, ttf, 0)
+        defined = ttf_lookup["defined"][ttf] & in_range
+        alpha = ttf_lookup["alpha"][ttf]
+        perception = ttf_lookup["perception"][ttf]
+        with _np.errstate(divide="ignore", invalid="ignore"):
+            ratio = 1 - _np.asarray(transit_volume, dtype=_np.float64) / capacity
+            root = _np.sqrt(ttf_lookup["alpha_square"][ttf] * ratio ** 2 + ttf_lookup["beta_square"][ttf])
+            cost = perception * (1 + root - alpha * ratio - ttf_lookup["beta"][ttf])
+            derivative = perception * alpha / capacity * (1 - alpha * ratio / root)
+        return (
+            _np.where(defined, _np.fmax(cost, 0.0), 0.0),
+            _np.where(defined & (cost > 0.0), derivative, 0.0),
+        )
+
+    def _load_network(self, scenario, element_types=None):
+        """
+        Loads the scenario network: only `element_types`, without attribute values, or (with None) the full
+        network. Full loads take seconds and gigabytes on large networks, so they are counted for the debug
+        check at the end of each run.
+        """
+        if element_types is None:
+            self._full_network_loads += 1
+            return scenario.get_network()
+        return scenario.get_partial_network(element_types, include_attributes=False)
+
+    def _check_network_loads(self):
+        assert self._full_network_loads <= self.max_full_network_loads, (
+            "%d full network loads in one run, at most %d expected; load a partial network or read attribute arrays"
+            % (self._full_network_loads, self.max_full_network_loads)
+        )
+
+    def _get_segment_layout(self, network):
+        if self._segment_layout is None or self._segment_layout.network is not network:
+            self._segment_layout = segment_layout(network)
+        return self._segment_layout
+
+    def _get_segment_capacity(self, network, layout):
+        line_capacity = network.get_attribute_values("TRANSIT_LINE", ["total_capacity"])[1]
+        return _np.asarray(line_capacity, dtype=_np.float64)[layout.line]
+
     def _compute_segment_costs(self, scenario, parameters, network):
-        excess_km = 0.0
-        for line in network.transit_lines():
-            capacity = line.total_capacity
-            for segment in line.segments():
-                volume = segment.current_voltr = segment.voltr
-                length = segment.link.length
-                if volume >= capacity:
-                    excess = volume - capacity
-                    excess_km += excess * length
-                segment.cost = self._calculate_segment_cost(parameters, segment.voltr, capacity, segment)
-        values = network.get_attribute_values("TRANSIT_SEGMENT", ["cost"])
-        scenario.set_attribute_values("TRANSIT_SEGMENT", ["data3"], values)
+        layout = self._get_segment_layout(network)
+        data = network.get_attribute_values(
+            "TRANSIT_SEGMENT", ["voltr", "current_voltr", "cost", "transit_time_func"]
+        )
+        voltr, current_voltr, cost, ttf = [_np.asarray(values, dtype=_np.float64) for values in data[1:]]
+        capacity = self._get_segment_capacity(network, layout)
+        length = layout.link_values(network.get_attribute_values("LINK", ["length"])[1])
+        visible = layout.visible
+        current_voltr = _np.where(visible, voltr, current_voltr)
+        excess = _np.where(visible & (voltr >= capacity), voltr - capacity, 0.0)
+        excess_km = float(_np.sum(excess * length))
+        segment_cost = self._calculate_segment_cost_array(self._get_ttf_lookup(parameters), voltr, capacity, ttf)
+        cost = _np.where(visible, segment_cost, cost)
+        network.set_attribute_values("TRANSIT_SEGMENT", ["current_voltr", "cost"], (data[0], current_voltr, cost))
+        scenario.set_attribute_values("TRANSIT_SEGMENT", ["data3"], (data[0], cost))
         return excess_km
 
     def _update_network(self, scenario, network):
@@ -1617,16 +2969,80 @@ class AssignTransit(_m.Tool()):
         return network
 
     def _find_step_size(
-        self, parameters, network, average_min_trip_impedance, average_impedance, assigned_total_demand, alphas
+        self,
+        parameters,
+        network,
+        average_min_trip_impedance,
+        average_impedance,
+        assigned_total_demand,
+        alphas,
+        step_scale=1.0,
     ):
+        """
+        Finds the step size lambda at which the line-search gradient crosses zero, using the method
+        selected by parameters["step_size_method"]:
+            - "interpolation" (default): three-point quadratic interpolation, one gradient evaluation per step
+            - "grid": brackets the root from a grid of lambdas evaluated in one broadcast pass, then refines
+            - "newton": safeguarded Newton steps using the analytic derivative of the gradient
+
+        The step size found is multiplied by step_scale (set by the convergence monitor while the gap
+        stalls) before it is clamped to [0, 1].
+
+        Returns the step size, the updated alphas, a report of the gradient evaluations made and the
+        segment snapshot the search was evaluated on (None when the object line search was used).
+        """
+        method = parameters.get("step_size_method", "interpolation")
+        offset = average_min_trip_impedance - average_impedance
+        segment_state = None
+        if method in ("grid", "newton"):
+            if parameters.get("array_line_search", True) != True:
+                raise Exception(
+                    "The '%s' step size method runs on segment arrays and cannot be used with array_line_search"
+                    " set to FALSE" % method
+                )
+            segment_state = self._snapshot_segment_state(parameters, network)
+            if method == "grid":
+                lambdaK, search_report = self._find_step_size_grid(
+                    parameters, segment_state, assigned_total_demand, offset
+                )
+            else:
+                lambdaK, search_report = self._find_step_size_newton(segment_state, assigned_total_demand, offset)
+            if parameters.get("step_size_report", False) == True:
+                reference = self._interpolate_step_size(
+                    lambda l: self._compute_gradient_array(segment_state, assigned_total_demand, l), offset
+                )
+                search_report["interpolation_evaluations"] = reference[1]["gradient_evaluations"]
+                search_report["evaluations_saved"] = (
+                    reference[1]["gradient_evaluations"] - search_report["gradient_evaluations"]
+                )
+        elif method == "interpolation":
+            if parameters.get("array_line_search", True) == True:
+                segment_state = self._snapshot_segment_state(parameters, network)
+
+                def compute_gradient(lambdaK):
+                    return self._compute_gradient_array(segment_state, assigned_total_demand, lambdaK)
+
+            else:
+
+                def compute_gradient(lambdaK):
+                    return self._compute_gradient(parameters, assigned_total_demand, lambdaK, network)
+
+            lambdaK, search_report = self._interpolate_step_size(compute_gradient, offset)
+        else:
+            raise Exception("Unknown step size method '%s'" % method)
+        lambdaK = max(0.0, min(1.0, lambdaK * step_scale))
+        alphas = [a * (1 - lambdaK) for a in alphas]
+        alphas.append(lambdaK)
+        return lambdaK, alphas, search_report, segment_state
+
+    def _interpolate_step_size(self, compute_gradient, offset):
         approx1 = 0.0
         approx2 = 0.5
         approx3 = 1.0
-        grad1 = average_min_trip_impedance - average_impedance
-        grad2 = self._compute_gradient(parameters, assigned_total_demand, approx2, network)
-        grad2 += average_min_trip_impedance - average_impedance
-        grad3 = self._compute_gradient(parameters, assigned_total_demand, approx3, network)
-        grad3 += average_min_trip_impedance - average_impedance
+        grad1 = offset
+        grad2 = compute_gradient(approx2) + offset
+        grad3 = compute_gradient(approx3) + offset
+        evaluations = 2
         for m_steps in range(0, 21):
             h1 = approx2 - approx1
             h2 = approx3 - approx2
@@ -1653,18 +3069,109 @@ class AssignTransit(_m.Tool()):
             temp = abs(temp) * 100000.0
             if temp < 100:
                 break
-            grad = self._compute_gradient(parameters, assigned_total_demand, lambdaK, network)
-            grad += average_min_trip_impedance - average_impedance
+            grad = compute_gradient(lambdaK) + offset
+            evaluations += 1
             approx1 = approx2
             approx2 = approx3
             approx3 = lambdaK
             grad1 = grad2
             grad2 = grad3
             grad3 = grad
-        lambdaK = max(0.0, min(1.0, lambdaK))
-        alphas = [a * (1 - lambdaK) for a in alphas]
-        alphas.append(lambdaK)
-        return lambdaK, alphas
+        return lambdaK, {"method": "interpolation", "gradient_evaluations": evaluations, "passes": evaluations}
+
+    def _find_step_size_newton(self, segment_state, assigned_total_demand, offset):
+        """
+        Finds the zero of the line-search gradient with Newton steps, each using the gradient and its
+        analytic derivative from one pass over the segments. At lambda = 0 both are known without a pass
+        (the gradient is the offset and the derivative comes from the snapshot), so the first step is
+        free. Steps that leave the bracket around the root, or meet a non-positive derivative, fall back
+        to bisection, except that lambda = 1 is tried first while its gradient is unknown, so a gradient
+        still negative at 1 gives a step size of 1, as the interpolation search gives once clamped. Stops
+        on the same step tolerance as the interpolation search.
+        """
+        lower, upper = 0.0, 1.0
+        upper_evaluated = False
+        lambdaK = 0.0
+        grad = offset
+        derivative = float(
+            _np.sum(
+                segment_state["t0"]
+                * segment_state["assigned_cost_derivative"]
+                * segment_state["volume_difference"] ** 2
+            )
+        ) / assigned_total_demand
+        evaluations = 0
+        for newton_steps in range(0, 21):
+            if lambdaK > 0.0:
+                grad, derivative = self._compute_gradient_derivative_array(
+                    segment_state, assigned_total_demand, lambdaK
+                )
+                grad += offset
+                evaluations += 1
+            if grad == 0.0:
+                break
+            if grad < 0.0:
+                if lambdaK == 1.0:
+                    break
+                lower = lambdaK
+            else:
+                if lambdaK == 0.0:
+                    break
+                upper = lambdaK
+                upper_evaluated = True
+            if derivative > 0.0:
+                step = -grad / derivative
+            else:
+                step = None
+            if step is None or not lower < lambdaK + step < upper:
+                if upper_evaluated:
+                    step = (lower + upper) / 2.0 - lambdaK
+                else:
+                    # the root may lie at or beyond 1: evaluate there before bisecting towards it
+                    step = upper - lambdaK
+                    upper_evaluated = True
+            lambdaK += step
+            if abs(step) * 100000.0 < 100:
+                break
+        return lambdaK, {"method": "newton", "gradient_evaluations": evaluations, "passes": evaluations}
+
+    def _find_step_size_grid(self, parameters, segment_state, assigned_total_demand, offset):
+        """
+        Brackets the zero of the (increasing) line-search gradient on a grid of lambdas evaluated in a
+        single pass, narrows the bracket with a few interior grids, and finishes with a secant step.
+        """
+        grid_points = int(parameters.get("step_size_grid_points", 11))
+        refinements = int(parameters.get("step_size_refinements", 3))
+        lower, upper = 0.0, 1.0
+        grad_lower, grad_upper = offset, None
+        lambdas = _np.linspace(lower, upper, grid_points)
+        evaluations = passes = 0
+        for refinement in range(0, refinements + 1):
+            grads = self._compute_gradient_grid(segment_state, assigned_total_demand, lambdas) + offset
+            evaluations += len(lambdas)
+            passes += 1
+            crossed = _np.flatnonzero(grads >= 0.0)
+            if len(crossed) == 0:
+                lower, grad_lower = lambdas[-1], grads[-1]
+            elif crossed[0] == 0 and refinement == 0:
+                lower, grad_lower = lambdas[0], grads[0]
+                grad_upper = None
+                break
+            else:
+                k = crossed[0]
+                upper, grad_upper = lambdas[k], grads[k]
+                if k > 0:
+                    lower, grad_lower = lambdas[k - 1], grads[k - 1]
+            if grad_upper is None:
+                break
+            if abs(upper - lower) * 100000.0 < 100:
+                break
+            lambdas = _np.linspace(lower, upper, grid_points + 2)[1:-1]
+        if grad_upper is None or grad_upper == grad_lower:
+            lambdaK = float(lower)
+        else:
+            lambdaK = float(lower - grad_lower * (upper - lower) / (grad_upper - grad_lower))
+        return lambdaK, {"method": "grid", "gradient_evaluations": evaluations, "passes": passes}
 
     def _compute_gradient(self, parameters, assigned_total_demand, lambdaK, network):
         value = 0.0
@@ -1685,6 +3192,102 @@ class AssignTransit(_m.Tool()):
                 value += t0 * cost_difference * volume_difference
         return value / assigned_total_demand
 
+    def _snapshot_segment_state(self, parameters, network):
+        """
+        Reads the segment state the line search depends on into contiguous float64 arrays (visible
+        segments only), so that each gradient evaluation is a handful of array operations instead of
+        a traversal of every line and segment. None of these values change within an iteration.
+        """
+        layout = self._get_segment_layout(network)
+        visible = layout.visible
+        data = network.get_attribute_values(
+            "TRANSIT_SEGMENT",
+            ["current_voltr", "transit_volume", "transit_time", "dwell_time", "cost", "transit_time_func"],
+        )
+        assigned_volume, cumulative_volume, transit_time, dwell_time, cost, ttf = [
+            _np.ascontiguousarray(_np.asarray(values, dtype=_np.float64)[visible]) for values in data[1:]
+        ]
+        capacity = self._get_segment_capacity(network, layout)[visible]
+        ttf_lookup = self._get_ttf_lookup(parameters)
+        if parameters.get("step_size_method", "interpolation") == "newton":
+            # the Newton search also needs the cost slope at the assigned volumes, from the same pass
+            assigned_cost, assigned_cost_derivative = self._calculate_segment_cost_derivative_array(
+                ttf_lookup, assigned_volume, capacity, ttf
+            )
+        else:
+            assigned_cost = self._calculate_segment_cost_array(ttf_lookup, assigned_volume, capacity, ttf)
+            assigned_cost_derivative = None
+        return {
+            "ttf_lookup": ttf_lookup,
+            "ttf": ttf,
+            "capacity": capacity,
+            "assigned_volume": assigned_volume,
+            "cumulative_volume": cumulative_volume,
+            "transit_time": transit_time,
+            "cost": cost,
+            "t0": (transit_time - dwell_time) / (1 + cost),
+            "volume_difference": cumulative_volume - assigned_volume,
+            "assigned_cost": assigned_cost,
+            "assigned_cost_derivative": assigned_cost_derivative,
+        }
+
+    def _compute_gradient_array(self, segment_state, assigned_total_demand, lambdaK):
+        """
+        Array version of _compute_gradient, evaluated on a _snapshot_segment_state snapshot.
+        """
+        if lambdaK == 1:
+            adjusted_volume = segment_state["cumulative_volume"]
+        else:
+            adjusted_volume = segment_state["assigned_volume"] + lambdaK * segment_state["volume_difference"]
+        cost_difference = (
+            self._calculate_segment_cost_array(
+                segment_state["ttf_lookup"], adjusted_volume, segment_state["capacity"], segment_state["ttf"]
+            )
+            - segment_state["assigned_cost"]
+        )
+        value = _np.sum(segment_state["t0"] * cost_difference * segment_state["volume_difference"])
+        return float(value) / assigned_total_demand
+
+    def _compute_gradient_derivative_array(self, segment_state, assigned_total_demand, lambdaK):
+        """
+        Returns the line-search gradient of _compute_gradient_array at lambdaK together with its derivative
+        with respect to lambda, sum(t0 * c'(v) * volume_difference ** 2) / total demand, from one pass.
+        """
+        if lambdaK == 1:
+            adjusted_volume = segment_state["cumulative_volume"]
+        else:
+            adjusted_volume = segment_state["assigned_volume"] + lambdaK * segment_state["volume_difference"]
+        cost, cost_derivative = self._calculate_segment_cost_derivative_array(
+            segment_state["ttf_lookup"], adjusted_volume, segment_state["capacity"], segment_state["ttf"]
+        )
+        weight = segment_state["t0"] * segment_state["volume_difference"]
+        value = _np.sum(weight * (cost - segment_state["assigned_cost"]))
+        derivative = _np.sum(weight * cost_derivative * segment_state["volume_difference"])
+        return float(value) / assigned_total_demand, float(derivative) / assigned_total_demand
+
+    def _compute_gradient_grid(self, segment_state, assigned_total_demand, lambdas):
+        """
+        Evaluates _compute_gradient_array for a whole vector of step sizes in one broadcast computation over
+        a segments x candidates matrix. Returns one gradient per candidate.
+        """
+        lambdas = _np.asarray(lambdas, dtype=_np.float64)
+        assigned_volume = segment_state["assigned_volume"][:, None]
+        volume_difference = segment_state["volume_difference"][:, None]
+        adjusted_volume = _np.where(
+            lambdas == 1, segment_state["cumulative_volume"][:, None], assigned_volume + lambdas * volume_difference
+        )
+        cost_difference = (
+            self._calculate_segment_cost_array(
+                segment_state["ttf_lookup"],
+                adjusted_volume,
+                segment_state["capacity"][:, None],
+                segment_state["ttf"][:, None],
+            )
+            - segment_state["assigned_cost"][:, None]
+        )
+        value = _np.sum(segment_state["t0"][:, None] * cost_difference * volume_difference, axis=0)
+        return value / assigned_total_demand
+
     def _create_journey_level_modes(self, mode_list, level):
         ret = []
         for mode in mode_list:
@@ -1696,17 +3299,23 @@ class AssignTransit(_m.Tool()):
 
     def _update_volumes(self, network, lambdaK):
         alpha = 1 - lambdaK
-        for node in network.regular_nodes():
-            node.inboa = node.inboa * alpha + node.initial_boardings * lambdaK
-            node.fiali = node.fiali * alpha + node.final_alightings * lambdaK
-        for link in network.links():
-            link.volax = link.volax * alpha + link.aux_transit_volume * lambdaK
-        for line in network.transit_lines():
-            capacity = float(line.total_capacity)
-            congested = False
-            for segment in line.segments():
-                segment.voltr = segment.voltr * alpha + segment.transit_volume * lambdaK
-                segment.board = segment.board * alpha + segment.transit_boardings * lambdaK
+        layout = self._get_segment_layout(network)
+        blends = [
+            ("NODE", ["inboa", "fiali"], ["initial_boardings", "final_alightings"], layout.regular_nodes),
+            ("LINK", ["volax"], ["aux_transit_volume"], None),
+            ("TRANSIT_SEGMENT", ["voltr", "board"], ["transit_volume", "transit_boardings"], layout.visible),
+        ]
+        for type, attributes, assigned_attributes, selection in blends:
+            data = network.get_attribute_values(type, attributes + assigned_attributes)
+            values = [_np.array(column, dtype=_np.float64) for column in data[1:]]
+            blended = []
+            for current, assigned in zip(values[: len(attributes)], values[len(attributes) :]):
+                if selection is None:
+                    current = current * alpha + assigned * lambdaK
+                else:
+                    current[selection] = current[selection] * alpha + assigned[selection] * lambdaK
+                blended.append(current)
+            network.set_attribute_values(type, attributes, [data[0]] + blended)
         return
 
     def _compute_gaps(
@@ -1718,8 +3327,15 @@ class AssignTransit(_m.Tool()):
         previous_average_min_trip_impedance,
         network,
     ):
-        cngap = previous_average_min_trip_impedance - average_min_trip_impedance
         net_costs = self._compute_network_costs(parameters, assigned_total_demand, lambdaK, network)
+        return self._combine_gaps(
+            parameters, lambdaK, average_min_trip_impedance, previous_average_min_trip_impedance, net_costs
+        )
+
+    def _combine_gaps(
+        self, parameters, lambdaK, average_min_trip_impedance, previous_average_min_trip_impedance, net_costs
+    ):
+        cngap = previous_average_min_trip_impedance - average_min_trip_impedance
         average_impedance = (
             lambdaK * average_min_trip_impedance + (1 - lambdaK) * previous_average_min_trip_impedance + net_costs
         )
@@ -1727,6 +3343,46 @@ class AssignTransit(_m.Tool()):
         norm_gap_difference = (parameters["norm_gap"] - cngap) * 100000.0
         return (average_impedance, cngap, crgap, norm_gap_difference, net_costs)
 
+    def _compute_gaps_array(
+        self,
+        parameters,
+        segment_state,
+        assigned_total_demand,
+        lambdaK,
+        average_min_trip_impedance,
+        previous_average_min_trip_impedance,
+        network,
+    ):
+        """
+        Fused version of _compute_gaps, evaluated on the snapshot the step-size search used: the
+        segment costs at the accepted step size are computed once and give both the network cost
+        term and the line-search gradient at lambdaK, which is returned after the gaps so the caller
+        can record it with them (in the gap history and the iteration log). Only the dwell times are
+        re-read, since the surface transit speed update may have changed them after the search.
+        """
+        t0 = segment_state["t0"]
+        if parameters["surface_transit_speed"] == True:
+            layout = self._get_segment_layout(network)
+            dwell_time = _np.asarray(
+                network.get_attribute_values("TRANSIT_SEGMENT", ["dwell_time"])[1], dtype=_np.float64
+            )[layout.visible]
+            t0 = (segment_state["transit_time"] - dwell_time) / (1 + segment_state["cost"])
+        volume_difference = segment_state["volume_difference"]
+        adjusted_volume = segment_state["assigned_volume"] + lambdaK * volume_difference
+        cost_difference = (
+            self._calculate_segment_cost_array(
+                segment_state["ttf_lookup"], adjusted_volume, segment_state["capacity"], segment_state["ttf"]
+            )
+            - segment_state["assigned_cost"]
+        )
+        weighted_cost_difference = t0 * cost_difference
+        net_costs = float(_np.sum(weighted_cost_difference * adjusted_volume)) / assigned_total_demand
+        gradient = float(_np.sum(weighted_cost_difference * volume_difference)) / assigned_total_demand
+        gaps = self._combine_gaps(
+            parameters, lambdaK, average_min_trip_impedance, previous_average_min_trip_impedance, net_costs
+        )
+        return gaps + (gradient,)
+
     def _compute_network_costs(self, parameters, assigned_total_demand, lambdaK, network):
         value = 0.0
         for line in network.transit_lines():
@@ -1744,6 +3400,11 @@ class AssignTransit(_m.Tool()):
         return value / assigned_total_demand
 
     def _save_results(self, scenario, parameters, network, alphas, strategies):
+        """
+        Sets the final congested transit times and @ccost of the visible segments from the segment arrays and
+        writes them, with the assigned volumes and boardings, to the scenario in one call per element type.
+        The dwell time of a segment's stop is held by the next segment of its line.
+        """
         if scenario.extra_attribute("@ccost") is not None:
             ccost = scenario.extra_attribute("@ccost")
             scenario.delete_extra_attribute("@ccost")
@@ -1752,19 +3413,36 @@ class AssignTransit(_m.Tool()):
         congestion_attribute = scenario.create_extra_attribute(type, "@ccost")
         congestion_attribute.description = "congestion cost"
         network.create_attribute(type, "@ccost")
-        for line in network.transit_lines():
-            capacity = float(line.total_capacity)
-            i = 0
-            for segment in line.segments():
-                volume = float(segment.voltr)
-                congestion_term = self._calculate_segment_cost(parameters, volume, capacity, segment)
-                base_time = float(segment.uncongested_time) - float(line.segment(i + 1).base_dwell_time)
-                segment.transit_time = (base_time + float(line.segment(i + 1).dwell_time)) * (1 + congestion_term)
-                segment["@ccost"] = segment.transit_time - base_time
-                i += 1
+        layout = self._get_segment_layout(network)
+        data = network.get_attribute_values(
+            type,
+            [
+                "voltr",
+                "board",
+                "uncongested_time",
+                "base_dwell_time",
+                "dwell_time",
+                "transit_time_func",
+                "transit_time",
+            ],
+        )
+        voltr, board, uncongested_time, base_dwell_time, dwell_time, ttf, transit_time = [
+            _np.asarray(values, dtype=_np.float64) for values in data[1:]
+        ]
+        capacity = self._get_segment_capacity(network, layout)
+        congestion_term = self._calculate_segment_cost_array(self._get_ttf_lookup(parameters), voltr, capacity, ttf)
+        base_time = uncongested_time - base_dwell_time[layout.next]
+        congested_time = (base_time + dwell_time[layout.next]) * (1 + congestion_term)
+        transit_time = _np.where(layout.visible, congested_time, transit_time)
+        ccost = _np.where(layout.visible, congested_time - base_time, 0.0)
+        network.set_attribute_values(type, ["transit_time", "@ccost"], [data[0], transit_time, ccost])
+        scenario.set_attribute_values(
+            type,
+            ["transit_time", "transit_volume", "transit_boardings", "@ccost"],
+            [data[0], transit_time, voltr, board, ccost],
+        )
         attribute_mapping = self._attribute_mapping()
-        attribute_mapping["TRANSIT_SEGMENT"]["@ccost"] = "@ccost"
-        attribute_mapping["TRANSIT_SEGMENT"]["transit_time"] = "transit_time"
+        del attribute_mapping[type]
         for type, mapping in attribute_mapping.items():
             data = network.get_attribute_values(type, mapping.values())
             scenario.set_attribute_values(type, mapping.keys(), data)
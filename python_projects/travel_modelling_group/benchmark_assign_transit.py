@@ -0,0 +1,380 @@
+"""
+Benchmark of the congested transit assignment phases of assign_transit_v2.AssignTransit.
+
+Runs on synthetic networks built with the in-memory Emme stand-in (emme_standin), so it needs
+no Emme licence. For every scale the network is prepared (and its segment layout built) once,
+then each congested iteration replaces the assignment results (as the extended transit
+assignment would) and times:
+
+    _compute_segment_costs, _find_step_size, _surface_transit_speed_update,
+    _update_volumes and _compute_gaps
+
+followed by one _save_results. Timings are written as JSON; pass an earlier output file as
+--baseline to flag phases that slowed down by more than --tolerance (exit status 1). A phase that
+raises is reported as FAILED, the later phases of that benchmark are not run, and the exit status is 1.
+
+Several --step-size-method values are benchmarked on the same synthetic assignments (same seed), and
+for each the line-search gradient evaluations, passes and step sizes are reported. The synthetic
+results written between iterations are random and do not respond to the segment costs or the step
+size, so the number of iterations a method needs to reach a relative gap cannot be measured here;
+compare it on an Emme network with the iteration log (csvfile) instead.
+
+The setup network calculations (effective headways, walk perceptions and surface transit speed rules)
+are also run on two copies of each network, one network calculator call per specification and
+coalesced into one batch; any difference between the two results also gives exit status 1. On the
+stand-in both sides are evaluated by Python, so this only checks the batching (order of evaluation,
+fallbacks and write-back), not that the batch reads selections and expressions as Emme does.
+
+    python benchmark_assign_transit.py --scales 1k 20k 150k --iterations 5 --output benchmark.json
+    python benchmark_assign_transit.py --scales 20k --step-size-method interpolation newton
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy
+
+import emme_standin
+from emme_standin import synthetic
+
+ITERATION_PHASES = (
+    "_compute_segment_costs",
+    "_find_step_size",
+    "_surface_transit_speed_update",
+    "_update_volumes",
+    "_compute_gaps",
+)
+
+
+def get_parameters(**overrides):
+    parameters = {
+        "assignment_period": 3.0,
+        "iterations": 5,
+        "norm_gap": 0.0,
+        "rel_gap": 0.0,
+        "csvfile": "",
+        "xrow_ttf_range": "2",
+        "surface_transit_speed": True,
+        "surface_transit_speeds": [
+            {
+                "alighting_duration": 1.1219,
+                "boarding_duration": 1.9577,
+                "default_duration": 7.4331,
+                "global_erow_speed": 35,
+                "line_filter_expression": "",
+                "mode_filter_expression": "",
+                "transit_auto_correlation": 1.612,
+            }
+        ],
+        "ttf_definitions": [
+            {"ttf": 1, "congestion_exponent": 5.972385, "congestion_perception": 1},
+            {"ttf": 2, "congestion_exponent": 6.72, "congestion_perception": 2},
+            {"ttf": 3, "congestion_exponent": 9.0, "congestion_perception": 1},
+        ],
+    }
+    parameters.update(overrides)
+    return parameters
+
+
+NETWORK_CALCULATION_PARAMETERS = {
+    "effective_headway_slope": 0.7,
+    "transit_classes": [
+        {
+            "walk_time_perception_attribute": "@walkp",
+            "walk_perceptions": [
+                {"filter": "all", "walk_perception_value": 1.5},
+                {"filter": "length=0,0.5 and mode=b", "walk_perception_value": 1.2},
+                {"filter": "mode=w and not mode=b", "walk_perception_value": 1.8},
+                {"filter": "i=1,999 and j=10000,99999", "walk_perception_value": 2.2},
+            ],
+        }
+    ],
+    "surface_transit_speeds": [
+        {"mode_filter_expression": "", "line_filter_expression": ""},
+        {"mode_filter_expression": "b", "line_filter_expression": ""},
+        {"mode_filter_expression": "s", "line_filter_expression": "hdw=0,10"},
+        {"mode_filter_expression": "bm", "line_filter_expression": "line=L00*"},
+    ],
+}
+
+
+class phase_failed(Exception):
+    """
+    Raised by phase_timer.run after recording the error of a phase, so the benchmark of a scale stops at the
+    failed phase (later phases depend on its result) without losing what was measured before it.
+    """
+
+
+class phase_timer:
+    """
+    Collects wall-clock samples per phase; a phase that raises is recorded with its error and phase_failed
+    is raised in its place.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def run(self, name, function, *args):
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        except Exception as error:
+            self.errors[name] = "%s: %s" % (type(error).__name__, error)
+            raise phase_failed(name)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        phases = {}
+        for name, samples in self.samples.items():
+            phases[name] = {
+                "calls": len(samples),
+                "total_seconds": float(numpy.sum(samples)),
+                "mean_seconds": float(numpy.mean(samples)),
+                "min_seconds": float(numpy.min(samples)),
+                "max_seconds": float(numpy.max(samples)),
+            }
+        return phases
+
+
+def benchmark_scale(assign_transit, emmebank, number, scale, iterations, seed, parameters):
+    scenario = synthetic.build_scenario(emmebank, number, seed=seed, **synthetic.SCALES[scale])
+    # created by AssignTransit before the assignment; _save_results writes the final boardings to them
+    for attribute_id in ("@boardings", "@alightings"):
+        scenario.create_extra_attribute("TRANSIT_SEGMENT", attribute_id)
+    rng = numpy.random.default_rng(seed)
+    tool = assign_transit.AssignTransit()
+    stsu_att = scenario.extra_attribute("@stsu")
+    timer = phase_timer()
+    alphas = [1.0]
+    average_impedance = 45.0
+    average_min_trip_impedance = 40.0
+    assigned_total_demand = 100.0 * synthetic.SCALES[scale]["lines"]
+    line_search = {"gradient_evaluations": 0, "passes": 0, "step_sizes": []}
+    completed_iterations = 0
+    try:
+        network = timer.run("_prepare_network", tool._prepare_network, scenario, parameters, stsu_att)
+        # built once per network and reused by every array kernel; timed apart from the first iteration
+        timer.run("_get_segment_layout", tool._get_segment_layout, network)
+        for iteration in range(iterations):
+            synthetic.simulate_assignment(network, rng)
+            timer.run("_compute_segment_costs", tool._compute_segment_costs, scenario, parameters, network)
+            lambdaK, alphas, search_report, segment_state = timer.run(
+                "_find_step_size",
+                tool._find_step_size,
+                parameters,
+                network,
+                average_min_trip_impedance,
+                average_impedance,
+                assigned_total_demand,
+                alphas,
+            )
+            line_search["gradient_evaluations"] += search_report["gradient_evaluations"]
+            line_search["passes"] += search_report["passes"]
+            line_search["step_sizes"].append(lambdaK)
+            if parameters["surface_transit_speed"] == True:
+                timer.run(
+                    "_surface_transit_speed_update",
+                    tool._surface_transit_speed_update,
+                    scenario,
+                    parameters,
+                    network,
+                    lambdaK,
+                )
+            timer.run("_update_volumes", tool._update_volumes, network, lambdaK)
+            if segment_state is not None:
+                gaps = timer.run(
+                    "_compute_gaps",
+                    tool._compute_gaps_array,
+                    parameters,
+                    segment_state,
+                    assigned_total_demand,
+                    lambdaK,
+                    average_min_trip_impedance,
+                    average_impedance,
+                    network,
+                )
+            else:
+                gaps = timer.run(
+                    "_compute_gaps",
+                    tool._compute_gaps,
+                    parameters,
+                    assigned_total_demand,
+                    lambdaK,
+                    average_min_trip_impedance,
+                    average_impedance,
+                    network,
+                )
+            average_impedance = gaps[0]
+            completed_iterations += 1
+        timer.run(
+            "_save_results", tool._save_results, scenario, parameters, network, alphas, scenario.transit_strategies
+        )
+    except phase_failed:
+        # the error is in timer.errors; the result is reported as failed and the later phases as not run
+        pass
+    phases = timer.summary()
+    result = {
+        "scale": scale,
+        "step_size_method": parameters.get("step_size_method", "interpolation"),
+        "seed": seed,
+        "iterations": iterations,
+        "completed_iterations": completed_iterations,
+        "element_totals": scenario.element_totals(),
+        "network_loads": dict(scenario.network_loads),
+        "phases": phases,
+        "errors": timer.errors,
+        "per_iteration_seconds": sum(phases[name]["mean_seconds"] for name in ITERATION_PHASES if name in phases),
+        "line_search": line_search,
+    }
+    emmebank.delete_scenario(number)
+    return result
+
+
+def compare_network_calculations(assign_transit, emmebank, number, scale, seed):
+    """
+    Runs the setup network calculations on two copies of a synthetic network, one network calculator
+    call per specification and coalesced, and returns the calls, seconds and largest difference.
+    """
+    comparison = {"scale": scale, "max_difference": 0.0}
+    attributes = {}
+    for mode, coalesce in (("individual", False), ("coalesced", True)):
+        scenario = synthetic.build_scenario(emmebank, number, seed=seed, **synthetic.SCALES[scale])
+        scenario.create_extra_attribute("TRANSIT_LINE", "@ehdw")
+        scenario.create_extra_attribute("LINK", "@walkp")
+        parameters = dict(NETWORK_CALCULATION_PARAMETERS, coalesce_network_calculations=coalesce)
+        tool = assign_transit.AssignTransit()
+        calls = assign_transit.network_calc_tool.calls
+        start = time.perf_counter()
+        tool._assign_effective_headway(scenario, parameters, "@ehdw")
+        tool._assign_walk_perception(scenario, parameters)
+        tool._set_up_line_attributes(scenario, parameters, scenario.extra_attribute("@stsu"))
+        comparison[mode] = {
+            "seconds": time.perf_counter() - start,
+            "network_calculator_calls": assign_transit.network_calc_tool.calls - calls,
+        }
+        for element_type, attribute in (("TRANSIT_LINE", "@ehdw"), ("LINK", "@walkp"), ("TRANSIT_LINE", "@stsu")):
+            values = numpy.asarray(scenario.get_attribute_values(element_type, [attribute])[1])
+            if attribute in attributes:
+                difference = float(numpy.max(numpy.abs(values - attributes[attribute]), initial=0.0))
+                comparison["max_difference"] = max(comparison["max_difference"], difference)
+            attributes[attribute] = values
+        emmebank.delete_scenario(number)
+    return comparison
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+
+    def key(result):
+        return (result["scale"], result.get("step_size_method", "interpolation"))
+
+    previous = {key(result): result for result in baseline["results"]}
+    for result in results:
+        if key(result) not in previous:
+            continue
+        for name, timing in result["phases"].items():
+            before = previous[key(result)]["phases"].get(name)
+            if before is not None and timing["mean_seconds"] > before["mean_seconds"] * (1.0 + tolerance):
+                regressions.append((result["scale"], name, before["mean_seconds"], timing["mean_seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AssignTransit congested assignment phases.")
+    parser.add_argument("--scales", nargs="+", default=list(synthetic.SCALES), choices=list(synthetic.SCALES))
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-surface-transit-speed", action="store_true")
+    parser.add_argument(
+        "--step-size-method", nargs="+", default=["interpolation"], choices=["interpolation", "grid", "newton"]
+    )
+    parser.add_argument("--output", default="assign_transit_benchmark.json")
+    parser.add_argument("--baseline", help="earlier output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slow-down per phase")
+    args = parser.parse_args(argv)
+
+    emmebank = emme_standin.install(zones=50)
+    import assign_transit_v2
+
+    results = []
+    comparisons = []
+    number = 0
+    for scale in args.scales:
+        for step_size_method in args.step_size_method:
+            number += 1
+            parameters = get_parameters(
+                surface_transit_speed=not args.no_surface_transit_speed,
+                step_size_method=step_size_method,
+            )
+            result = benchmark_scale(assign_transit_v2, emmebank, number, scale, args.iterations, args.seed, parameters)
+            results.append(result)
+            line_search = result["line_search"]
+            print(
+                "%-5s %7d segments  %-13s %.4f s per iteration, %d gradient evaluations in %d passes"
+                % (
+                    scale,
+                    result["element_totals"]["transit_segments"],
+                    step_size_method,
+                    result["per_iteration_seconds"],
+                    line_search["gradient_evaluations"],
+                    line_search["passes"],
+                )
+            )
+            for name, timing in result["phases"].items():
+                print("    %-32s %3d calls  mean %.4f s" % (name, timing["calls"], timing["mean_seconds"]))
+            for name, error in result["errors"].items():
+                print(
+                    "    %-32s FAILED %s (after %d of %d iterations; later phases not run)"
+                    % (name, error, result["completed_iterations"], result["iterations"])
+                )
+        number += 1
+        comparison = compare_network_calculations(assign_transit_v2, emmebank, number, scale, args.seed)
+        comparisons.append(comparison)
+        print(
+            "    %-32s %d calls %.4f s, coalesced %d calls %.4f s, max difference %g"
+            % (
+                "setup network calculations",
+                comparison["individual"]["network_calculator_calls"],
+                comparison["individual"]["seconds"],
+                comparison["coalesced"]["network_calculator_calls"],
+                comparison["coalesced"]["seconds"],
+                comparison["max_difference"],
+            )
+        )
+    output = {
+        "tool": "assign_transit_v2.AssignTransit",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "parameters": {
+            "step_size_methods": args.step_size_method,
+            "surface_transit_speed": not args.no_surface_transit_speed,
+        },
+        "results": results,
+        "network_calculations": comparisons,
+    }
+    with open(args.output, "w") as file:
+        json.dump(output, file, indent=2)
+    mismatches = [comparison["scale"] for comparison in comparisons if comparison["max_difference"] > 0.0]
+    for scale in mismatches:
+        print("MISMATCH %s: coalesced network calculations differ from individual calls" % scale)
+    failures = [result for result in results if result["errors"]]
+    for result in failures:
+        print("FAILED %s %s: %s" % (result["scale"], result["step_size_method"], ", ".join(sorted(result["errors"]))))
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for scale, name, before, after in regressions:
+            print("REGRESSION %s %s: %.4f s -> %.4f s" % (scale, name, before, after))
+    return 1 if mismatches or failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
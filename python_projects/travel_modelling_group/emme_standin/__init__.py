@@ -0,0 +1,85 @@
+"""
+Pure-Python/NumPy stand-in for the parts of the Emme Modeller API used by the TMG tools.
+
+Lets assign_transit_v2.py, tmg.py and pop.py be imported and their hot paths exercised and
+benchmarked without an Emme licence:
+
+    import emme_standin
+
+    bank = emme_standin.install(zones=100)
+    scenario = bank.create_scenario(1)
+    network = scenario._network
+    ... build the network with network.create_mode/create_regular_node/create_link/...
+    import assign_transit_v2
+
+install() must run before the tool modules are imported, because they bind the Modeller,
+the emmebank and the tools at import time.
+"""
+
+import sys
+from types import ModuleType
+
+from . import modeller
+from .modeller import Modeller, Emmebank, Scenario, UnsupportedInStandin
+from .network import Network
+from .tools import build_tools
+from .utilities import build_modules
+
+# names the tool modules bind at import time but never call on the paths the stand-in exercises
+_UNSUPPORTED_NAMES = {
+    "tmg2.utilities.geometry": ("Shapely2ESRI", "Point"),
+    "tmg2.utilities.network_editing": ("TransitLineProxy",),
+    "tmg2.utilities.spatial_index": ("GridIndex",),
+}
+
+
+def _unsupported(namespace, name):
+    def call(*args, **kwargs):
+        raise UnsupportedInStandin("%s.%s is not emulated by the Emme stand-in" % (namespace, name))
+
+    call.__name__ = name
+    return call
+
+
+def install(zones=0):
+    """
+    Registers the stand-in as ``inro.modeller`` and returns the (shared) stand-in emmebank.
+    """
+    inro = sys.modules.get("inro") or ModuleType("inro")
+    inro.__path__ = []
+    emme = ModuleType("inro.emme")
+    emme.__path__ = []
+    core = ModuleType("inro.emme.core")
+    core.__path__ = []
+    exception = ModuleType("inro.emme.core.exception")
+
+    class ModuleError(Exception):
+        pass
+
+    exception.ModuleError = ModuleError
+    inro.modeller = modeller
+    inro.emme = emme
+    emme.core = core
+    core.exception = exception
+    sys.modules.update(
+        {
+            "inro": inro,
+            "inro.modeller": modeller,
+            "inro.emme": emme,
+            "inro.emme.core": core,
+            "inro.emme.core.exception": exception,
+        }
+    )
+
+    instance = Modeller()
+    instance.emmebank.zones = zones
+    for namespace, module in build_modules().items():
+        instance.register_module(namespace, module)
+    for namespace, names in _UNSUPPORTED_NAMES.items():
+        module = instance._modules.get(namespace) or ModuleType(namespace)
+        for name in names:
+            setattr(module, name, _unsupported(namespace, name))
+        instance.register_module(namespace, module)
+    for namespace, tool in build_tools().items():
+        instance.register_tool(namespace, tool)
+    return instance.emmebank
@@ -0,0 +1,396 @@
+"""
+Stand-in for the subset of inro.modeller and the emmebank API used by the TMG tools.
+
+Installed as ``inro.modeller`` by emme_standin.install(). Scenarios keep their network in a
+column-oriented emme_standin.network.Network; get_network() and get_partial_network() hand out
+copies and are counted in Scenario.network_loads so tools can be audited for full loads.
+"""
+
+import os
+import time as _time
+from contextlib import contextmanager
+
+import numpy
+
+from .network import Network, ELEMENT_TYPES
+
+TupleType = object
+ListType = list
+InstanceType = object
+
+_logbook = []
+
+
+class UnsupportedInStandin(Exception):
+    """
+    Raised when a tool or function the TMG tools import is called, but the stand-in does not emulate it.
+    """
+
+
+@contextmanager
+def logbook_trace(name, attributes=None, value=None, save_arguments=False):
+    entry = {"name": name, "attributes": attributes, "children": []}
+    _logbook.append(entry)
+    try:
+        yield _trace_handle(entry)
+    finally:
+        pass
+
+
+class _trace_handle:
+    def __init__(self, entry):
+        self.entry = entry
+
+    def write(self, name="", attributes=None, value=None):
+        self.entry["children"].append({"name": name, "attributes": attributes})
+
+
+def logbook_write(name, value=None, attributes=None):
+    _logbook.append({"name": name, "attributes": attributes})
+
+
+def logbook_entries():
+    return list(_logbook)
+
+
+def logbook_clear():
+    del _logbook[:]
+
+
+class _tool_base:
+    __MODELLER_NAMESPACE__ = None
+
+    def __str__(self):
+        return "%s.%s" % (type(self).__module__, type(self).__name__)
+
+
+def Tool():
+    return _tool_base
+
+
+def method(return_type=None, argument_types=None):
+    def decorator(func):
+        return func
+
+    return decorator
+
+
+class Attribute:
+    """
+    Declared tool attribute; behaves as a plain default value.
+    """
+
+    def __init__(self, type=None):
+        self.type = type
+
+
+# ---EMMEBANK---------------------------------------------------------------------------------------------------------------
+
+
+class ExtraAttribute:
+    def __init__(self, scenario, element_type, id, default_value=0.0):
+        self._scenario = scenario
+        self.type = element_type
+        self.id = id
+        self.name = id
+        self.description = ""
+        self.default_value = default_value
+
+    def initialize(self, value=None):
+        value = self.default_value if value is None else value
+        self._scenario._network._stores[self.type].view(self.id)[:] = value
+
+    def __str__(self):
+        return self.id
+
+
+class Matrix:
+    def __init__(self, emmebank, id, default_value=0.0):
+        self._bank = emmebank
+        self.id = id
+        self.name = id
+        self.description = ""
+        self.default_value = default_value
+        self.type = {"mf": "FULL", "mo": "ORIGIN", "md": "DESTINATION", "ms": "SCALAR"}[id[:2]]
+        self.timestamp = _time.time()
+        self._data = None
+
+    def _shape(self):
+        zones = self._bank.zones
+        return {"FULL": (zones, zones), "ORIGIN": (zones,), "DESTINATION": (zones,), "SCALAR": ()}[self.type]
+
+    def get_numpy_data(self, scenario_id=None):
+        if self._data is None:
+            self._data = numpy.full(self._shape(), self.default_value, dtype=numpy.float64)
+        return self._data.copy()
+
+    def set_numpy_data(self, data, scenario_id=None):
+        self._data = numpy.array(data, dtype=numpy.float64).reshape(self._shape())
+        self.timestamp = _time.time()
+
+    def initialize(self, value=0.0):
+        self.default_value = value
+        self._data = None
+
+    def __str__(self):
+        return self.id
+
+
+class Function:
+    def __init__(self, id, expression):
+        self.id = id
+        self.expression = expression
+        self.type = {"fd": "VOLUME_DELAY", "ft": "TRANSIT_TIME", "fp": "TURN"}[id[:2]]
+
+    def __str__(self):
+        return self.id
+
+
+class Emmebank:
+    def __init__(self, zones=0, path="standin/emmebank"):
+        self.path = path
+        self.zones = zones
+        self._scenarios = {}
+        self._matrices = {}
+        self._functions = {}
+
+    @property
+    def dimensions(self):
+        totals = {"transit_segments": 0, "centroids": self.zones, "full_matrices": 9999}
+        for scenario in self._scenarios.values():
+            counts = scenario._network.element_totals()
+            totals["transit_segments"] = max(totals["transit_segments"], counts["transit_segments"])
+        return totals
+
+    # scenarios
+    def create_scenario(self, number, network=None):
+        scenario = Scenario(self, number, network if network is not None else Network())
+        self._scenarios[int(number)] = scenario
+        return scenario
+
+    def scenario(self, number):
+        return self._scenarios.get(int(number))
+
+    def scenarios(self):
+        return list(self._scenarios.values())
+
+    def delete_scenario(self, number):
+        del self._scenarios[int(number)]
+
+    # matrices
+    def matrix(self, id):
+        if isinstance(id, Matrix):
+            return id
+        return self._matrices.get(str(id))
+
+    def matrices(self):
+        return list(self._matrices.values())
+
+    def create_matrix(self, id, default_value=0.0):
+        if str(id) in self._matrices:
+            raise Exception("Matrix %s already exists" % id)
+        matrix = Matrix(self, str(id), default_value)
+        self._matrices[matrix.id] = matrix
+        return matrix
+
+    def delete_matrix(self, id):
+        del self._matrices[str(id)]
+
+    def available_matrix_identifier(self, type):
+        prefix = {"FULL": "mf", "ORIGIN": "mo", "DESTINATION": "md", "SCALAR": "ms"}[type]
+        number = 1
+        while "%s%d" % (prefix, number) in self._matrices:
+            number += 1
+        return "%s%d" % (prefix, number)
+
+    # functions
+    def function(self, id):
+        return self._functions.get(id)
+
+    def functions(self):
+        return list(self._functions.values())
+
+    def create_function(self, id, expression):
+        function = Function(id, expression)
+        self._functions[id] = function
+        return function
+
+    def delete_function(self, id):
+        del self._functions[str(id)]
+
+
+class StrategyFile:
+    def __init__(self, name, path=None):
+        self.name = name
+        self.path = path
+        self.attributes = {}
+
+    def add_attr_values(self, element_type, name, values):
+        self.attributes[(element_type, name)] = numpy.array(values, dtype=numpy.float64)
+        if self.path is not None:
+            arrays = dict(("%s.%s" % key, array) for key, array in self.attributes.items())
+            with open(self.path, "wb") as strat_file:
+                numpy.savez(strat_file, **arrays)
+
+
+class TransitStrategies:
+    def __init__(self, scenario):
+        self._scenario = scenario
+        self._files = []
+        self._deleted = 0
+        self.data = {}
+        self.saved = 0
+
+    def clear(self):
+        for strat_file in self._files:
+            self.delete_strat_file(strat_file.name)
+        self.data = {}
+
+    def _get_directory(self):
+        # like Emme, keep the strategy files in STRATS_s<number> next to the emmebank, when it is on disk
+        emmebank_directory = os.path.dirname(os.path.abspath(self._scenario.emmebank.path))
+        if not os.path.isdir(emmebank_directory):
+            return None
+        directory = os.path.join(emmebank_directory, "STRATS_s%s" % self._scenario.number)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def add_strat_file(self, name):
+        directory = self._get_directory()
+        path = None if directory is None else os.path.join(directory, "%d" % (len(self._files) + self._deleted))
+        strat_file = StrategyFile(name, path)
+        self._files.append(strat_file)
+        return strat_file
+
+    def strat_files(self):
+        return list(self._files)
+
+    def delete_strat_file(self, name):
+        for strat_file in self._files:
+            if strat_file.name == name:
+                if strat_file.path is not None and os.path.exists(strat_file.path):
+                    os.remove(strat_file.path)
+                self._deleted += 1
+        self._files = [f for f in self._files if f.name != name]
+
+    def _save_config(self):
+        self.saved += 1
+
+
+class _segment_setter:
+    def __init__(self, scenario):
+        object.__setattr__(self, "_scenario", scenario)
+
+    def __setattr__(self, name, values):
+        self._scenario._network._stores["TRANSIT_SEGMENT"].view(name)[:] = values
+
+
+class _net_handle:
+    def __init__(self, scenario):
+        self.segment = _segment_setter(scenario)
+
+
+class Scenario:
+    def __init__(self, emmebank, number, network):
+        self.emmebank = emmebank
+        self.number = int(number)
+        self.id = str(number)
+        self.title = "Scenario %s" % number
+        self._network = network
+        self._extra_attributes = {}
+        self.transit_strategies = TransitStrategies(self)
+        self.transit_assignment_timestamp = None
+        self.transit_class_specifications = {}
+        self.network_loads = {"full": 0, "partial": 0}
+        self._net = _net_handle(self)
+
+    def __str__(self):
+        return self.id
+
+    @property
+    def zone_numbers(self):
+        return sorted(node.number for node in self._network.centroids())
+
+    def get_network(self):
+        self.network_loads["full"] += 1
+        return self._network.copy()
+
+    def get_partial_network(self, element_types, include_attributes=False):
+        self.network_loads["partial"] += 1
+        return self._network.copy(include_attributes=include_attributes)
+
+    def publish_network(self, network, resolve_attributes=False):
+        self._network = network.copy()
+
+    def attributes(self, element_type):
+        return [a for a in self._network.attributes(element_type) if a in self._network._stores[element_type].columns]
+
+    def get_attribute_values(self, element_type, attributes):
+        return self._network.get_attribute_values(element_type, attributes)
+
+    def set_attribute_values(self, element_type, attributes, values):
+        self._network.set_attribute_values(element_type, attributes, values)
+
+    def extra_attribute(self, id):
+        return self._extra_attributes.get(id)
+
+    def extra_attributes(self):
+        return list(self._extra_attributes.values())
+
+    def create_extra_attribute(self, element_type, id, default_value=0.0):
+        if id in self._extra_attributes:
+            raise Exception("Extra attribute %s already exists" % id)
+        self._network.create_attribute(element_type, id, default_value)
+        attribute = ExtraAttribute(self, element_type, id, default_value)
+        self._extra_attributes[id] = attribute
+        return attribute
+
+    def delete_extra_attribute(self, id):
+        attribute = self._extra_attributes.pop(str(id))
+        self._network.delete_attribute(attribute.type, attribute.id)
+
+    def modes(self):
+        return list(self._network.modes())
+
+    def mode(self, id):
+        return self._network.mode(id)
+
+    def element_totals(self):
+        return self._network.element_totals()
+
+
+# ---MODELLER---------------------------------------------------------------------------------------------------------------
+
+
+class Modeller:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.emmebank = Emmebank()
+            cls._instance._modules = {}
+            cls._instance._tools = {}
+            cls._instance.scenario = None
+        return cls._instance
+
+    def module(self, namespace):
+        return self._modules[namespace]
+
+    def tool(self, namespace):
+        return self._tools[namespace]
+
+    def register_module(self, namespace, module):
+        self._modules[namespace] = module
+
+    def register_tool(self, namespace, tool):
+        self._tools[namespace] = tool
+
+    def matrix_snapshot(self, matrix):
+        matrix = self.emmebank.matrix(matrix)
+        return {
+            "id": matrix.id,
+            "description": matrix.description,
+            "timestamp": matrix.timestamp,
+            "data": matrix.get_numpy_data(),
+        }
@@ -0,0 +1,598 @@
+"""
+In-memory, column-oriented stand-in for the Emme Network API.
+
+Every element type keeps its attributes in numpy float64 columns; the element objects handed
+out by the iterators (nodes, links, transit lines and segments) are thin proxies that read and
+write those columns by index. The flat arrays returned by get_attribute_values follow the same
+element order as the columns, with the index structures laid out as:
+
+    NODE:            {node number: index}
+    LINK:            {i node number: {j node number: index}}
+    TRANSIT_VEHICLE: {vehicle number: index}
+    TRANSIT_LINE:    {line id: index}
+    TRANSIT_SEGMENT: {line id: [index of segment 0, index of segment 1, ...]}
+    MODE:            {mode id: index}
+
+Transit segments of a line are stored contiguously, including the hidden final segment.
+"""
+
+import numpy
+
+ELEMENT_TYPES = ("MODE", "NODE", "LINK", "TRANSIT_VEHICLE", "TRANSIT_LINE", "TRANSIT_SEGMENT")
+
+BUILTIN_ATTRIBUTES = {
+    "MODE": {"speed": 0.0},
+    "NODE": {
+        "x": 0.0,
+        "y": 0.0,
+        "data1": 0.0,
+        "data2": 0.0,
+        "data3": 0.0,
+        "initial_boardings": 0.0,
+        "final_alightings": 0.0,
+    },
+    "LINK": {
+        "length": 0.0,
+        "type": 1.0,
+        "num_lanes": 1.0,
+        "volume_delay_func": 1.0,
+        "data1": 0.0,
+        "data2": 0.0,
+        "data3": 0.0,
+        "auto_time": 0.0,
+        "auto_volume": 0.0,
+        "aux_transit_volume": 0.0,
+    },
+    "TRANSIT_VEHICLE": {"total_capacity": 0.0, "seated_capacity": 0.0},
+    "TRANSIT_LINE": {
+        "headway": 0.0,
+        "speed": 0.0,
+        "data1": 0.0,
+        "data2": 0.0,
+        "data3": 0.0,
+    },
+    "TRANSIT_SEGMENT": {
+        "dwell_time": 0.01,
+        "transit_time_func": 1.0,
+        "allow_boardings": 1.0,
+        "allow_alightings": 1.0,
+        "data1": 0.0,
+        "data2": 0.0,
+        "data3": 0.0,
+        "transit_volume": 0.0,
+        "transit_boardings": 0.0,
+        "transit_time": 0.0,
+    },
+}
+
+_ALIAS_PREFIX = {"NODE": "ui", "LINK": "ul", "TRANSIT_LINE": "ut", "TRANSIT_SEGMENT": "us"}
+_BOOLEAN_ATTRIBUTES = {"allow_boardings", "allow_alightings"}
+_INTEGER_ATTRIBUTES = {"transit_time_func", "volume_delay_func", "type", "num_lanes"}
+
+
+class column_store:
+    """
+    Growable set of equal-length float64 columns, one per attribute.
+    """
+
+    def __init__(self, defaults, aliases=None):
+        self.defaults = dict(defaults)
+        self.aliases = dict(aliases or {})
+        self.columns = {name: numpy.zeros(0) for name in self.defaults}
+        self.size = 0
+        self._capacity = 0
+
+    def resolve(self, name):
+        return self.aliases.get(name, name)
+
+    def __contains__(self, name):
+        return self.resolve(name) in self.columns
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, size):
+        if size <= self._capacity:
+            return
+        capacity = max(size, 2 * self._capacity, 16)
+        for name, column in self.columns.items():
+            grown = numpy.full(capacity, self.defaults[name], dtype=numpy.float64)
+            grown[: self.size] = column[: self.size]
+            self.columns[name] = grown
+        self._capacity = capacity
+
+    def append(self, count=1):
+        start = self.size
+        self._grow(start + count)
+        self.size += count
+        return start
+
+    def add(self, name, default=0.0):
+        self.defaults[name] = default
+        self.columns[name] = numpy.full(max(self._capacity, 0), default, dtype=numpy.float64)
+
+    def remove(self, name):
+        del self.defaults[name]
+        del self.columns[name]
+
+    def view(self, name):
+        return self.columns[self.resolve(name)][: self.size]
+
+    def copy(self):
+        other = column_store(self.defaults, self.aliases)
+        other.columns = {name: column[: self.size].copy() for name, column in self.columns.items()}
+        other.size = other._capacity = self.size
+        return other
+
+    def delete(self, start, stop):
+        for name, column in self.columns.items():
+            self.columns[name] = numpy.concatenate((column[:start], column[stop : self.size]))
+        self.size -= stop - start
+        self._capacity = self.size
+
+    def reset(self, names):
+        for name in names:
+            self.columns[name][: self.size] = self.defaults[name]
+
+
+class _element:
+    __slots__ = ("_network", "_index")
+    _element_type = None
+
+    def __init__(self, network, index):
+        object.__setattr__(self, "_network", network)
+        object.__setattr__(self, "_index", index)
+
+    def _store(self):
+        return self._network._stores[self._element_type]
+
+    def __getitem__(self, name):
+        store = self._store()
+        value = store.columns[store.resolve(name)][self._index]
+        if name in _BOOLEAN_ATTRIBUTES:
+            return bool(value)
+        if name in _INTEGER_ATTRIBUTES:
+            return int(value)
+        return float(value)
+
+    def __setitem__(self, name, value):
+        store = self._store()
+        store.columns[store.resolve(name)][self._index] = float(value)
+
+    def __getattr__(self, name):
+        store = self._network._stores[self._element_type]
+        if name in store:
+            return self[name]
+        raise AttributeError("%s has no attribute '%s'" % (self._element_type, name))
+
+    def __setattr__(self, name, value):
+        store = self._network._stores[self._element_type]
+        if name in store:
+            self[name] = value
+        else:
+            object.__setattr__(self, name, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._network is other._network and self._index == other._index
+
+    def __hash__(self):
+        return hash((self._element_type, self._index))
+
+    def __repr__(self):
+        return str(self)
+
+
+class mode(_element):
+    __slots__ = ()
+    _element_type = "MODE"
+
+    @property
+    def id(self):
+        return self._network._mode_ids[self._index]
+
+    @property
+    def type(self):
+        return self._network._mode_types[self._index]
+
+    @property
+    def description(self):
+        return self._network._mode_descriptions[self._index]
+
+    def __str__(self):
+        return self.id
+
+
+class node(_element):
+    __slots__ = ()
+    _element_type = "NODE"
+
+    @property
+    def number(self):
+        return self._network._node_numbers[self._index]
+
+    @property
+    def id(self):
+        return str(self.number)
+
+    @property
+    def is_centroid(self):
+        return self._network._node_is_centroid[self._index]
+
+    def outgoing_links(self):
+        return (link(self._network, i) for i in self._network._outgoing[self._index])
+
+    def incoming_links(self):
+        return (link(self._network, i) for i in self._network._incoming[self._index])
+
+    def __str__(self):
+        return str(self.number)
+
+
+class link(_element):
+    __slots__ = ()
+    _element_type = "LINK"
+
+    @property
+    def i_node(self):
+        return node(self._network, self._network._link_i[self._index])
+
+    @property
+    def j_node(self):
+        return node(self._network, self._network._link_j[self._index])
+
+    @property
+    def modes(self):
+        return frozenset(self._network._link_modes[self._index])
+
+    @property
+    def id(self):
+        return "%s-%s" % (self.i_node.number, self.j_node.number)
+
+    def __str__(self):
+        return self.id
+
+
+class transit_vehicle(_element):
+    __slots__ = ()
+    _element_type = "TRANSIT_VEHICLE"
+
+    @property
+    def number(self):
+        return self._network._vehicle_numbers[self._index]
+
+    @property
+    def id(self):
+        return str(self.number)
+
+    @property
+    def mode(self):
+        return self._network.mode(self._network._vehicle_modes[self._index])
+
+    def __str__(self):
+        return self.id
+
+
+class transit_line(_element):
+    __slots__ = ()
+    _element_type = "TRANSIT_LINE"
+
+    @property
+    def id(self):
+        return self._network._line_ids[self._index]
+
+    @property
+    def vehicle(self):
+        return transit_vehicle(self._network, self._network._line_vehicles[self._index])
+
+    @property
+    def mode(self):
+        return self.vehicle.mode
+
+    def segments(self, include_hidden=False):
+        start, stop = self._network._line_segments[self._index]
+        if not include_hidden:
+            stop -= 1
+        return (transit_segment(self._network, i) for i in range(start, stop))
+
+    def segment(self, number):
+        start, stop = self._network._line_segments[self._index]
+        if number < 0:
+            number += stop - start
+        if not 0 <= number < stop - start:
+            raise IndexError("segment %d does not exist on line %s" % (number, self.id))
+        return transit_segment(self._network, start + number)
+
+    def __str__(self):
+        return self.id
+
+
+class transit_segment(_element):
+    __slots__ = ()
+    _element_type = "TRANSIT_SEGMENT"
+
+    @property
+    def line(self):
+        return transit_line(self._network, self._network._segment_lines[self._index])
+
+    @property
+    def number(self):
+        return self._index - self._network._line_segments[self._network._segment_lines[self._index]][0]
+
+    @property
+    def link(self):
+        link_index = self._network._segment_links[self._index]
+        return None if link_index < 0 else link(self._network, link_index)
+
+    @property
+    def i_node(self):
+        return node(self._network, self._network._segment_i[self._index])
+
+    @property
+    def j_node(self):
+        link_index = self._network._segment_links[self._index]
+        return None if link_index < 0 else link(self._network, link_index).j_node
+
+    @property
+    def id(self):
+        return "%s-%s" % (self.line.id, self.number)
+
+    def __str__(self):
+        return self.id
+
+
+class Network:
+    """
+    Column-oriented network. Build it with the create_* methods, then use it exactly like an
+    Emme network object.
+    """
+
+    def __init__(self):
+        self._stores = {}
+        for element_type in ELEMENT_TYPES:
+            prefix = _ALIAS_PREFIX.get(element_type)
+            aliases = {"%s%d" % (prefix, i): "data%d" % i for i in (1, 2, 3)} if prefix else {}
+            self._stores[element_type] = column_store(BUILTIN_ATTRIBUTES[element_type], aliases)
+        self._custom = {t: [] for t in ELEMENT_TYPES}
+        self._mode_ids, self._mode_types, self._mode_descriptions = [], [], []
+        self._mode_index = {}
+        self._node_numbers, self._node_is_centroid = [], []
+        self._node_index = {}
+        self._outgoing, self._incoming = [], []
+        self._link_i, self._link_j, self._link_modes = [], [], []
+        self._link_index = {}
+        self._vehicle_numbers, self._vehicle_modes = [], []
+        self._vehicle_index = {}
+        self._line_ids, self._line_vehicles, self._line_segments = [], [], []
+        self._line_index = {}
+        self._segment_lines, self._segment_links, self._segment_i = [], [], []
+        self._indices = {}
+
+    # ---TOPOLOGY-------------------------------------------------------------------------------------------------------
+    def create_mode(self, type, id, description=""):
+        if id in self._mode_index:
+            raise Exception("Mode %s already exists" % id)
+        self._mode_index[id] = self._stores["MODE"].append()
+        self._indices = {}
+        self._mode_ids.append(id)
+        self._mode_types.append(type)
+        self._mode_descriptions.append(description)
+        return self.mode(id)
+
+    def _create_node(self, number, is_centroid):
+        if number in self._node_index:
+            raise Exception("Node %s already exists" % number)
+        index = self._stores["NODE"].append()
+        self._indices = {}
+        self._node_index[number] = index
+        self._node_numbers.append(number)
+        self._node_is_centroid.append(is_centroid)
+        self._outgoing.append([])
+        self._incoming.append([])
+        return node(self, index)
+
+    def create_regular_node(self, number):
+        return self._create_node(number, False)
+
+    def create_centroid(self, number):
+        return self._create_node(number, True)
+
+    def create_link(self, i_node_id, j_node_id, modes):
+        key = (int(i_node_id), int(j_node_id))
+        if key in self._link_index:
+            raise Exception("Link %s-%s already exists" % key)
+        i, j = self._node_index[key[0]], self._node_index[key[1]]
+        index = self._stores["LINK"].append()
+        self._link_index[key] = index
+        self._indices = {}
+        self._link_i.append(i)
+        self._link_j.append(j)
+        self._link_modes.append(set(str(m) for m in modes))
+        self._outgoing[i].append(index)
+        self._incoming[j].append(index)
+        return link(self, index)
+
+    def create_transit_vehicle(self, id, mode_id):
+        index = self._stores["TRANSIT_VEHICLE"].append()
+        self._vehicle_index[int(id)] = index
+        self._indices = {}
+        self._vehicle_numbers.append(int(id))
+        self._vehicle_modes.append(str(mode_id))
+        return transit_vehicle(self, index)
+
+    def create_transit_line(self, id, vehicle_id, itinerary):
+        if id in self._line_index:
+            raise Exception("Transit line %s already exists" % id)
+        itinerary = [int(n) for n in itinerary]
+        link_indices = [self._link_index[(i, j)] for i, j in zip(itinerary[:-1], itinerary[1:])]
+        index = self._stores["TRANSIT_LINE"].append()
+        self._line_index[id] = index
+        self._indices = {}
+        self._line_ids.append(id)
+        self._line_vehicles.append(self._vehicle_index[int(vehicle_id)])
+        start = self._stores["TRANSIT_SEGMENT"].append(len(itinerary))
+        self._line_segments.append((start, start + len(itinerary)))
+        self._segment_lines.extend([index] * len(itinerary))
+        self._segment_links.extend(link_indices + [-1])
+        self._segment_i.extend(self._node_index[n] for n in itinerary)
+        return transit_line(self, index)
+
+    def delete_transit_line(self, id):
+        index = self._line_index.get(id)
+        if index is None:
+            raise Exception("Transit line %s does not exist" % id)
+        start, stop = self._line_segments[index]
+        count = stop - start
+        self._stores["TRANSIT_LINE"].delete(index, index + 1)
+        self._stores["TRANSIT_SEGMENT"].delete(start, stop)
+        del self._line_ids[index]
+        del self._line_vehicles[index]
+        del self._line_segments[index]
+        self._line_segments = [(a - count, b - count) if a >= stop else (a, b) for a, b in self._line_segments]
+        self._line_index = {line_id: i for i, line_id in enumerate(self._line_ids)}
+        self._indices = {}
+        del self._segment_lines[start:stop]
+        del self._segment_links[start:stop]
+        del self._segment_i[start:stop]
+        self._segment_lines = [line - 1 if line > index else line for line in self._segment_lines]
+
+    # ---ACCESSORS------------------------------------------------------------------------------------------------------
+    def mode(self, id):
+        index = self._mode_index.get(str(id))
+        return None if index is None else mode(self, index)
+
+    def modes(self):
+        return (mode(self, i) for i in range(len(self._mode_ids)))
+
+    def node(self, number):
+        index = self._node_index.get(int(number))
+        return None if index is None else node(self, index)
+
+    def nodes(self):
+        return (node(self, i) for i in range(len(self._node_numbers)))
+
+    def regular_nodes(self):
+        return (node(self, i) for i, c in enumerate(self._node_is_centroid) if not c)
+
+    def centroids(self):
+        return (node(self, i) for i, c in enumerate(self._node_is_centroid) if c)
+
+    def link(self, i_node_id, j_node_id):
+        index = self._link_index.get((int(i_node_id), int(j_node_id)))
+        return None if index is None else link(self, index)
+
+    def links(self):
+        return (link(self, i) for i in range(len(self._link_i)))
+
+    def transit_vehicle(self, id):
+        index = self._vehicle_index.get(int(id))
+        return None if index is None else transit_vehicle(self, index)
+
+    def transit_vehicles(self):
+        return (transit_vehicle(self, i) for i in range(len(self._vehicle_numbers)))
+
+    def transit_line(self, id):
+        index = self._line_index.get(id)
+        return None if index is None else transit_line(self, index)
+
+    def transit_lines(self):
+        return (transit_line(self, i) for i in range(len(self._line_ids)))
+
+    def transit_segments(self, include_hidden=False):
+        for line in self.transit_lines():
+            for segment in line.segments(include_hidden):
+                yield segment
+
+    def element_totals(self):
+        return {
+            "regular_nodes": self._node_is_centroid.count(False),
+            "centroids": self._node_is_centroid.count(True),
+            "links": len(self._link_i),
+            "transit_lines": len(self._line_ids),
+            "transit_segments": len(self._segment_lines),
+        }
+
+    # ---ATTRIBUTES-----------------------------------------------------------------------------------------------------
+    def attributes(self, element_type):
+        return list(self._stores[element_type].columns)
+
+    def create_attribute(self, element_type, name, default_value=0.0):
+        if name in self._stores[element_type]:
+            raise Exception("Attribute %s already exists on %s" % (name, element_type))
+        self._stores[element_type].add(name, float(default_value))
+        self._custom[element_type].append(name)
+
+    def delete_attribute(self, element_type, name):
+        self._stores[element_type].remove(name)
+        if name in self._custom[element_type]:
+            self._custom[element_type].remove(name)
+
+    def copy_attribute(self, element_type, source, destination):
+        store = self._stores[element_type]
+        if destination not in store:
+            self.create_attribute(element_type, destination, store.defaults[store.resolve(source)])
+        store.view(destination)[:] = store.view(source)
+
+    def indices(self, element_type):
+        """
+        Index structure of an element type, as returned in position 0 by get_attribute_values. It is
+        cached until the topology changes, so callers must not modify it.
+        """
+        if element_type not in self._indices:
+            self._indices[element_type] = self._build_indices(element_type)
+        return self._indices[element_type]
+
+    def _build_indices(self, element_type):
+        if element_type == "NODE":
+            return dict(self._node_index)
+        if element_type == "LINK":
+            nested = {}
+            for (i, j), index in self._link_index.items():
+                nested.setdefault(i, {})[j] = index
+            return nested
+        if element_type == "TRANSIT_VEHICLE":
+            return dict(self._vehicle_index)
+        if element_type == "TRANSIT_LINE":
+            return dict(self._line_index)
+        if element_type == "TRANSIT_SEGMENT":
+            return {line_id: list(range(*self._line_segments[i])) for line_id, i in self._line_index.items()}
+        if element_type == "MODE":
+            return dict(self._mode_index)
+        raise Exception("Unknown element type %s" % element_type)
+
+    def get_attribute_values(self, element_type, attributes):
+        store = self._stores[element_type]
+        values = [self.indices(element_type)]
+        for name in attributes:
+            if name not in store:
+                raise Exception("Attribute %s does not exist on %s" % (name, element_type))
+            values.append(store.view(name).copy())
+        return tuple(values)
+
+    def set_attribute_values(self, element_type, attributes, values):
+        store = self._stores[element_type]
+        attributes = list(attributes)
+        for name, column in zip(attributes, list(values)[1:]):
+            if name not in store:
+                raise Exception("Attribute %s does not exist on %s" % (name, element_type))
+            column = numpy.asarray(column, dtype=numpy.float64)
+            if column.shape != (store.size,):
+                raise Exception("Expected %d values for %s.%s" % (store.size, element_type, name))
+            store.view(name)[:] = column
+
+    # ---COPYING--------------------------------------------------------------------------------------------------------
+    def copy(self, include_attributes=True):
+        other = Network.__new__(Network)
+        for key, value in self.__dict__.items():
+            if key == "_stores":
+                value = {t: store.copy() for t, store in value.items()}
+            elif isinstance(value, dict):
+                value = {k: list(v) if isinstance(v, list) else v for k, v in value.items()}
+            elif isinstance(value, list):
+                value = [list(v) if isinstance(v, list) else set(v) if isinstance(v, set) else v for v in value]
+            other.__dict__[key] = value
+        if not include_attributes:
+            for element_type, store in other._stores.items():
+                if element_type == "MODE":
+                    continue
+                store.reset(list(store.columns))
+        return other
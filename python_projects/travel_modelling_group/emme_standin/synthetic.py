@@ -0,0 +1,175 @@
+"""
+Synthetic transit networks for exercising and benchmarking the TMG tools on the Emme stand-in.
+
+build_scenario() lays out a square grid of regular nodes joined by two-way links, then draws
+transit lines as random monotone staircase walks over the grid (half of them reversed), so
+lines share links and cross each other as they would in a real network. Segment, line, link and
+node attributes are filled with plausible values in one array assignment per attribute:
+
+    bank = emme_standin.install(zones=50)
+    scenario = synthetic.build_scenario(bank, 1, lines=800, segments_per_line=24)
+
+simulate_assignment() overwrites the assignment results of a network with fresh values, standing
+in for the extended transit assignment between congested iterations.
+"""
+
+import math
+
+import numpy
+
+SCALES = {
+    "1k": {"lines": 50, "segments_per_line": 20},
+    "20k": {"lines": 800, "segments_per_line": 24},
+    "150k": {"lines": 3000, "segments_per_line": 49},
+}
+
+VEHICLES = ((1, "b", 60.0), (2, "s", 130.0), (3, "m", 900.0))
+
+
+def _grid_node(side, x, y):
+    return 10000 + y * side + x
+
+
+def _fill(network, element_type, values):
+    """
+    Sets each attribute in `values` from its generator, called with the number of elements.
+    """
+    size = network._stores[element_type].size
+    data = [network.indices(element_type)] + [values[name](size) for name in values]
+    network.set_attribute_values(element_type, list(values), data)
+
+
+def build_scenario(
+    emmebank,
+    number,
+    lines=50,
+    segments_per_line=20,
+    ttfs=(1, 2, 3),
+    ttf_weights=None,
+    doors=(0, 2, 3, 4),
+    tstops=(0, 1, 2),
+    exclusive_row_share=0.1,
+    seed=1,
+):
+    """
+    Creates scenario `number` on the stand-in emmebank with `lines` transit lines of
+    `segments_per_line` visible segments each (plus the hidden final segment), and returns it.
+    Every line of the scenario has 1 in @stsu, so the first surface transit speed rule applies to all.
+
+    Args:
+        - ttfs, ttf_weights: transit time functions given to the segments, and their relative frequency
+        - doors: @doors values drawn for the lines
+        - tstops: @tstop values drawn for the segments
+        - exclusive_row_share: share of links with no auto time (exclusive right of way)
+    """
+    rng = numpy.random.default_rng(seed)
+    scenario = emmebank.create_scenario(number)
+    network = scenario._network
+    network.create_mode("AUX_TRANSIT", "w")
+    for vehicle_id, mode_id, capacity in VEHICLES:
+        network.create_mode("TRANSIT", mode_id)
+        network.create_transit_vehicle(vehicle_id, mode_id).total_capacity = capacity
+    transit_modes = ["w"] + [mode_id for _, mode_id, _ in VEHICLES]
+
+    spread = max(10, int(math.sqrt(lines)))
+    side = segments_per_line + spread + 1
+    for y in range(side):
+        for x in range(side):
+            network.create_regular_node(_grid_node(side, x, y))
+    for y in range(side):
+        for x in range(side):
+            for dx, dy in ((1, 0), (0, 1)):
+                if x + dx < side and y + dy < side:
+                    network.create_link(_grid_node(side, x, y), _grid_node(side, x + dx, y + dy), transit_modes)
+                    network.create_link(_grid_node(side, x + dx, y + dy), _grid_node(side, x, y), transit_modes)
+    for zone in range(1, emmebank.zones + 1):
+        network.create_centroid(zone)
+        node = _grid_node(side, int(rng.integers(side)), int(rng.integers(side)))
+        network.create_link(zone, node, ["w"])
+        network.create_link(node, zone, ["w"])
+
+    for line_number in range(lines):
+        x, y = int(rng.integers(spread)), int(rng.integers(spread))
+        itinerary = [_grid_node(side, x, y)]
+        for step in rng.random(segments_per_line) < 0.5:
+            x, y = (x + 1, y) if step else (x, y + 1)
+            itinerary.append(_grid_node(side, x, y))
+        if line_number % 2:
+            itinerary.reverse()
+        if line_number % 10 == 0:
+            vehicle_id = VEHICLES[2][0]
+        elif line_number % 3 == 0:
+            vehicle_id = VEHICLES[1][0]
+        else:
+            vehicle_id = VEHICLES[0][0]
+        network.create_transit_line("L%05d" % line_number, vehicle_id, itinerary)
+
+    for element_type, attribute_id in (
+        ("TRANSIT_SEGMENT", "@tstop"),
+        ("TRANSIT_LINE", "@doors"),
+        ("TRANSIT_LINE", "@stsu"),
+    ):
+        scenario.create_extra_attribute(element_type, attribute_id)
+
+    weights = numpy.asarray(ttf_weights if ttf_weights is not None else [1.0] * len(ttfs), dtype=numpy.float64)
+    _fill(
+        network,
+        "NODE",
+        {"initial_boardings": lambda n: rng.uniform(0, 50, n), "final_alightings": lambda n: rng.uniform(0, 50, n)},
+    )
+    _fill(
+        network,
+        "LINK",
+        {
+            "length": lambda n: rng.uniform(0.2, 1.5, n),
+            "auto_time": lambda n: numpy.where(rng.random(n) < exclusive_row_share, 0.0, rng.uniform(0.5, 4.0, n)),
+            "aux_transit_volume": lambda n: rng.uniform(0, 30, n),
+        },
+    )
+    _fill(
+        network,
+        "TRANSIT_LINE",
+        {
+            "headway": lambda n: rng.choice([3.0, 5.0, 10.0, 15.0, 20.0, 30.0], n),
+            "@doors": lambda n: rng.choice(numpy.asarray(doors, dtype=numpy.float64), n),
+            "@stsu": lambda n: numpy.ones(n),
+        },
+    )
+    _fill(
+        network,
+        "TRANSIT_SEGMENT",
+        {
+            "transit_time_func": lambda n: rng.choice(
+                numpy.asarray(ttfs, dtype=numpy.float64), n, p=weights / weights.sum()
+            ),
+            "@tstop": lambda n: rng.choice(numpy.asarray(tstops, dtype=numpy.float64), n),
+            "dwell_time": lambda n: rng.choice([0.0, 0.01, 0.5], n),
+            "allow_boardings": lambda n: (rng.random(n) < 0.9).astype(numpy.float64),
+            "allow_alightings": lambda n: (rng.random(n) < 0.9).astype(numpy.float64),
+        },
+    )
+    simulate_assignment(network, rng)
+    return scenario
+
+
+def simulate_assignment(network, rng):
+    """
+    Writes a fresh set of transit assignment results (segment volumes, boardings and times, node
+    boardings and alightings, auxiliary transit volumes) onto `network`, as the extended transit
+    assignment does between congested iterations. Volumes stay within a few times line capacity.
+    """
+    _fill(
+        network,
+        "TRANSIT_SEGMENT",
+        {
+            "transit_volume": lambda n: rng.gamma(2.0, 400.0, n),
+            "transit_boardings": lambda n: rng.uniform(0, 300, n),
+            "transit_time": lambda n: rng.uniform(0.5, 5.0, n),
+        },
+    )
+    _fill(
+        network,
+        "NODE",
+        {"initial_boardings": lambda n: rng.uniform(0, 50, n), "final_alightings": lambda n: rng.uniform(0, 50, n)},
+    )
+    _fill(network, "LINK", {"aux_transit_volume": lambda n: rng.uniform(0, 30, n)})
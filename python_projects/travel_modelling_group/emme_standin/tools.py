@@ -0,0 +1,419 @@
+"""
+Stand-ins for the Emme tools fetched through Modeller.tool().
+
+The network and matrix calculators evaluate the subset of the Emme expression and selection
+syntax used by the TMG tools, one element at a time. The extended transit assignment is a
+deterministic synthetic loading, not a strategy-based assignment: line shares fall with the
+congestion term in us3 so that a congested assignment loop behaves like the real thing and can
+be profiled at realistic network sizes.
+"""
+
+import math
+import re
+
+import numpy
+
+from .modeller import Modeller, UnsupportedInStandin
+
+_SEGMENT_NAMES = {
+    "timtr": "transit_time",
+    "voltr": "transit_volume",
+    "board": "transit_boardings",
+    "dwt": "dwell_time",
+    "ttf": "transit_time_func",
+}
+_LINE_NAMES = {"hdw": "headway", "spd": "speed"}
+_LINK_NAMES = {"len": "length", "vdf": "volume_delay_func", "lanes": "num_lanes", "timau": "auto_time"}
+_RELATIONAL = {".ne.": "!=", ".eq.": "==", ".lt.": "<", ".le.": "<=", ".gt.": ">", ".ge.": ">="}
+
+
+def _python_expression(expression):
+    expression = str(expression).replace("^", "**")
+    return re.sub(r"@(\w+)", r"_at_\1", expression)
+
+
+class _element_namespace(dict):
+    """
+    Resolves the names in an Emme expression against one network element.
+    """
+
+    def __init__(self, lookups):
+        super().__init__()
+        self._lookups = lookups
+
+    def __missing__(self, name):
+        if name.startswith("_at_"):
+            name = "@" + name[4:]
+        for lookup in self._lookups:
+            try:
+                return lookup(name)
+            except (AttributeError, KeyError):
+                continue
+        if name in dir(math):
+            return getattr(math, name)
+        raise NameError("'%s' is not defined for this element" % name)
+
+
+def _attribute_lookup(element, names):
+    def lookup(name):
+        if element is None:
+            raise KeyError(name)
+        return element[names.get(name, name)]
+
+    return lookup
+
+
+def _parse_selection(selection):
+    """
+    Splits an Emme selection into a list of alternatives (or), each a list of terms (and).
+    """
+    selection = str(selection).strip()
+    alternatives = []
+    for alternative in re.split(r"\s+or\s+", selection):
+        terms = []
+        for term in re.split(r"\s+and\s+", alternative):
+            term = term.strip()
+            negate = term.startswith("not ")
+            if negate:
+                term = term[4:].strip()
+            if term == "all":
+                terms.append((negate, "all", None))
+                continue
+            name, _, values = term.partition("=")
+            terms.append((negate, name.strip(), values.strip()))
+        alternatives.append(terms)
+    return alternatives
+
+
+def _match_value(name, values, value):
+    if name == "mode":
+        # a link is selected when any of its modes is listed
+        return any(mode in values.replace(" ", "") for mode in str(value))
+    if name == "line":
+        pattern = "^" + re.escape(values).replace("\\*", ".*").replace("_", ".") + "$"
+        return re.match(pattern, str(value)) is not None
+    for value_range in values.replace("...", ",").split():
+        bounds = [float(v) for v in value_range.split(",") if v != ""]
+        if len(bounds) == 1 and value == bounds[0]:
+            return True
+        if len(bounds) >= 2 and bounds[0] <= value <= bounds[-1]:
+            return True
+    return False
+
+
+def _selected(alternatives, resolve):
+    for terms in alternatives:
+        matched = True
+        for negate, name, values in terms:
+            hit = True if name == "all" else _match_value(name, values, resolve(name))
+            if hit == negate:
+                matched = False
+                break
+        if matched:
+            return True
+    return False
+
+
+class network_calculator:
+    namespace = "inro.emme.network_calculation.network_calculator"
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, specification, scenario=None, full_report=False):
+        self.calls += 1
+        network = scenario._network
+        result = specification.get("result")
+        selections = specification.get("selections") or {}
+        expression = compile(_python_expression(specification["expression"]), "<expression>", "eval")
+        element_type = self._result_type(scenario, result, selections)
+        values = []
+        for element, namespace, resolve in self._elements(network, element_type, selections):
+            value = float(eval(expression, {"__builtins__": {}}, namespace))
+            values.append(value)
+            if result:
+                element[result] = value
+        report = {"num_evaluated": len(values), "type": "NETWORK_CALCULATION"}
+        if values:
+            report.update(
+                {
+                    "sum": sum(values),
+                    "average": sum(values) / len(values),
+                    "maximum": max(values),
+                    "minimum": min(values),
+                }
+            )
+        return report
+
+    def _result_type(self, scenario, result, selections):
+        if result:
+            attribute = scenario.extra_attribute(result)
+            if attribute is not None:
+                return attribute.type
+            prefixes = {"us": "TRANSIT_SEGMENT", "ut": "TRANSIT_LINE", "ul": "LINK", "ui": "NODE"}
+            if result[:2] in prefixes:
+                return prefixes[result[:2]]
+            for element_type in ("TRANSIT_SEGMENT", "TRANSIT_LINE", "LINK", "NODE"):
+                if result in scenario._network._stores[element_type]:
+                    return element_type
+        if "transit_line" in selections and "link" in selections:
+            return "TRANSIT_SEGMENT"
+        if "transit_line" in selections:
+            return "TRANSIT_LINE"
+        if "link" in selections:
+            return "LINK"
+        return "NODE"
+
+    def _elements(self, network, element_type, selections):
+        line_selection = _parse_selection(selections.get("transit_line", "all"))
+        link_selection = _parse_selection(selections.get("link", "all"))
+        node_selection = _parse_selection(selections.get("node", "all"))
+
+        def line_resolver(line):
+            def resolve(name):
+                if name == "mode":
+                    return line.mode.id
+                if name == "line":
+                    return line.id
+                return line[_LINE_NAMES.get(name, name)]
+
+            return resolve
+
+        def link_resolver(link):
+            def resolve(name):
+                if name == "i":
+                    return link.i_node.number
+                if name == "j":
+                    return link.j_node.number
+                if name == "mode":
+                    return "".join(sorted(link.modes))
+                return link[_LINK_NAMES.get(name, name)]
+
+            return resolve
+
+        if element_type == "TRANSIT_LINE":
+            for line in network.transit_lines():
+                resolve = line_resolver(line)
+                if _selected(line_selection, resolve):
+                    yield line, _element_namespace([resolve]), resolve
+        elif element_type == "TRANSIT_SEGMENT":
+            for line in network.transit_lines():
+                resolve_line = line_resolver(line)
+                if not _selected(line_selection, resolve_line):
+                    continue
+                for segment in line.segments():
+                    resolve_link = link_resolver(segment.link)
+                    if not _selected(link_selection, resolve_link):
+                        continue
+                    lookups = [_attribute_lookup(segment, _SEGMENT_NAMES), resolve_line, resolve_link]
+                    yield segment, _element_namespace(lookups), None
+        elif element_type == "LINK":
+            for link in network.links():
+                resolve = link_resolver(link)
+                if _selected(link_selection, resolve):
+                    yield link, _element_namespace([resolve]), resolve
+        else:
+            for node in network.nodes():
+
+                def resolve(name, node=node):
+                    return node.number if name in ("i", "node") else node[name]
+
+                if _selected(node_selection, resolve):
+                    yield node, _element_namespace([resolve]), resolve
+
+
+class matrix_calculator:
+    namespace = "inro.emme.matrix_calculation.matrix_calculator"
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, specification, scenario=None, num_processors=None):
+        self.calls += 1
+        bank = Modeller().emmebank
+        expression = str(specification["expression"])
+        for emme_operator, python_operator in _RELATIONAL.items():
+            expression = expression.replace(emme_operator, python_operator)
+        zones = bank.zones
+        namespace = {"p": numpy.arange(zones)[:, None], "q": numpy.arange(zones)[None, :], "numpy": numpy}
+        for matrix_id in set(re.findall(r"\b(m[fodsi]\d+)\b", expression)):
+            namespace[matrix_id] = bank.matrix(matrix_id).get_numpy_data()
+        value = eval(expression, {"__builtins__": {}}, namespace)
+        value = numpy.broadcast_to(numpy.asarray(value, dtype=numpy.float64), (zones, zones))
+        report = {"type": "MATRIX_CALCULATION"}
+        aggregation = specification.get("aggregation") or {}
+        if aggregation.get("origins") == "+" and aggregation.get("destinations") == "+":
+            report["result"] = float(value.sum())
+        elif specification.get("result"):
+            bank.matrix(specification["result"]).set_numpy_data(value)
+        return report
+
+
+class extended_transit_assignment:
+    namespace = "inro.emme.transit_assignment.extended_transit_assignment"
+
+    def __init__(self):
+        self.calls = 0
+        self.iterative_transit_assignment = False
+
+    def __call__(
+        self, specification, scenario=None, add_volumes=False, save_strategies=True, class_name=None, **kwargs
+    ):
+        self.calls += 1
+        bank = Modeller().emmebank
+        network = scenario._network
+        segments = network._stores["TRANSIT_SEGMENT"]
+        lines = network._stores["TRANSIT_LINE"]
+        demand = bank.matrix(specification["demand"]).get_numpy_data()
+        total_demand = float(demand.sum() - numpy.trace(demand))
+
+        segment_line = numpy.asarray(network._segment_lines, dtype=numpy.int64)
+        segment_link = numpy.asarray(network._segment_links, dtype=numpy.int64)
+        bounds = numpy.asarray(network._line_segments, dtype=numpy.int64).reshape(-1, 2)
+        visible = segment_link >= 0
+        position = numpy.arange(len(segment_line)) - bounds[segment_line, 0]
+        line_visible = bounds[:, 1] - bounds[:, 0] - 1
+
+        congestion = segments.view("data3")
+        line_congestion = numpy.bincount(segment_line, congestion * visible, minlength=len(lines))
+        line_congestion /= numpy.maximum(line_visible, 1)
+        attractiveness = numpy.exp(-2.0 * line_congestion) / numpy.maximum(lines.view("headway"), 1.0)
+        share = attractiveness / attractiveness.sum() if attractiveness.sum() > 0 else attractiveness
+        line_volume = 0.6 * total_demand * share
+
+        profile = numpy.sin(math.pi * (position + 1) / (line_visible[segment_line] + 1)) * visible
+        volume = line_volume[segment_line] * profile
+        previous = numpy.where(position > 0, numpy.roll(volume, 1), 0.0)
+        boardings = (numpy.maximum(volume - previous, 0.0) + 0.1 * volume) * visible
+        alightings = numpy.maximum(previous + boardings - volume, 0.0)
+
+        length = network._stores["LINK"].view("length")[numpy.maximum(segment_link, 0)] * visible
+        speed = segments.view("data1")
+        base_time = length * 60.0 / numpy.where(speed > 0.0, speed, 25.0)
+        transit_time = (base_time * (1.0 + congestion) + segments.view("dwell_time")) * visible
+
+        nodes = network._stores["NODE"]
+        segment_i = numpy.asarray(network._segment_i, dtype=numpy.int64)
+        link_j = numpy.asarray(network._link_j, dtype=numpy.int64)
+        initial_boardings = 0.6 * numpy.bincount(segment_i, boardings, minlength=len(nodes))
+        final_alightings = 0.6 * numpy.bincount(
+            link_j[numpy.maximum(segment_link, 0)], alightings * visible, minlength=len(nodes)
+        )
+        links = network._stores["LINK"]
+        aux_weight = (numpy.arange(len(links)) % 7 + 1.0) / (7.0 * max(len(links), 1))
+        aux_transit_volume = 0.4 * total_demand * aux_weight * (1.0 + line_congestion.mean() if len(lines) else 1.0)
+
+        if add_volumes:
+            volume = volume + segments.view("transit_volume")
+            boardings = boardings + segments.view("transit_boardings")
+            initial_boardings = initial_boardings + nodes.view("initial_boardings")
+            final_alightings = final_alightings + nodes.view("final_alightings")
+            aux_transit_volume = aux_transit_volume + links.view("aux_transit_volume")
+        segments.view("transit_volume")[:] = volume
+        segments.view("transit_boardings")[:] = boardings
+        segments.view("transit_time")[:] = transit_time
+        nodes.view("initial_boardings")[:] = initial_boardings
+        nodes.view("final_alightings")[:] = final_alightings
+        links.view("aux_transit_volume")[:] = aux_transit_volume
+
+        impedance_id = (specification.get("od_results") or {}).get("total_impedance")
+        if impedance_id:
+            zones = bank.zones
+            mean_time = float(transit_time.sum() / max(visible.sum(), 1))
+            offsets = (numpy.add.outer(numpy.arange(zones), numpy.arange(zones)) % 5) * 0.1
+            bank.matrix(impedance_id).set_numpy_data(mean_time * (1.0 + offsets))
+        scenario.transit_assignment_timestamp = self.calls
+        scenario.transit_class_specifications[class_name] = specification
+        return {"type": "EXTENDED_TRANSIT_ASSIGNMENT", "total_demand": total_demand}
+
+
+class _strategy_results_tool:
+    """
+    Fills the requested result matrices with demand-weighted constants derived from the
+    trip-component attributes, so extraction steps can be exercised and timed.
+    """
+
+    namespace = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def _fill(self, matrix_id, value):
+        if matrix_id:
+            bank = Modeller().emmebank
+            matrix = bank.matrix(matrix_id)
+            matrix.set_numpy_data(numpy.full((bank.zones, bank.zones), value))
+
+    def _component_mean(self, scenario, element_type, attribute):
+        if not attribute:
+            return 0.0
+        values = scenario._network._stores[element_type].view(attribute)
+        return float(values.mean()) if len(values) else 0.0
+
+
+class extended_transit_strategy_analysis(_strategy_results_tool):
+    namespace = "inro.emme.transit_assignment.extended.strategy_based_analysis"
+
+    def __call__(self, specification, scenario=None, class_name=None, num_processors=None):
+        self.calls += 1
+        components = specification["trip_components"]
+        value = self._component_mean(scenario, "TRANSIT_SEGMENT", components.get("in_vehicle"))
+        value += self._component_mean(scenario, "LINK", components.get("aux_transit"))
+        self._fill(specification["results"].get("strategy_values"), value)
+        return {"type": "EXTENDED_TRANSIT_STRATEGY_ANALYSIS"}
+
+
+class extended_transit_matrix_results(_strategy_results_tool):
+    namespace = "inro.emme.transit_assignment.extended.matrix_results"
+
+    def __call__(self, specification, scenario=None, class_name=None, num_processors=None):
+        """
+        In-vehicle times and costs are the same component means the strategy analysis gives for timtr and
+        for the cost attributes of the class assignment; the other results are filled with 1.
+        """
+        self.calls += 1
+        assignment = scenario.transit_class_specifications.get(class_name) or {}
+        components = {
+            "actual_in_vehicle_times": ("TRANSIT_SEGMENT", "transit_time"),
+            "actual_in_vehicle_costs": ("TRANSIT_SEGMENT", (assignment.get("in_vehicle_cost") or {}).get("penalty")),
+            "actual_aux_transit_costs": ("LINK", (assignment.get("aux_transit_cost") or {}).get("penalty")),
+        }
+        for key, value in specification.items():
+            if key.startswith("actual_") or key.startswith("total_"):
+                self._fill(value, 1.0)
+        for key, value in (specification.get("by_mode_subset") or {}).items():
+            if key in components:
+                self._fill(value, self._component_mean(scenario, *components[key]))
+            elif key.startswith("actual_"):
+                self._fill(value, 1.0)
+        return {"type": "EXTENDED_TRANSIT_MATRIX_RESULTS"}
+
+
+class unsupported_tool:
+    """
+    A tool the stand-in does not emulate; fetching it works, calling it raises UnsupportedInStandin.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def __call__(self, *args, **kwargs):
+        raise UnsupportedInStandin("%s is not emulated by the Emme stand-in" % self.namespace)
+
+
+def build_tools():
+    tools = [
+        network_calculator(),
+        matrix_calculator(),
+        extended_transit_assignment(),
+        extended_transit_strategy_analysis(),
+        extended_transit_matrix_results(),
+    ]
+    registry = {tool.namespace: tool for tool in tools}
+    for namespace in (
+        "inro.emme.traffic_assignment.sola_traffic_assignment",
+        "inro.emme.data.matrix.delete_matrix",
+        "inro.emme.data.scenario.copy_scenario",
+    ):
+        registry[namespace] = unsupported_tool(namespace)
+    return registry
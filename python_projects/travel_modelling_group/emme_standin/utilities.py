@@ -0,0 +1,228 @@
+"""
+Stand-ins for the TMG and INRO utility modules fetched through Modeller.module().
+"""
+
+import sys
+import traceback as _traceback
+from contextlib import contextmanager
+from types import ModuleType
+
+from .modeller import Modeller
+
+
+class null_pointer_exception(Exception):
+    pass
+
+
+class progress_tracker:
+    def __init__(self, number_of_tasks):
+        self.number_of_tasks = number_of_tasks
+        self.completed_tasks = 0
+        self.tool_calls = []
+
+    def reset(self, number_of_tasks=None):
+        if number_of_tasks is not None:
+            self.number_of_tasks = number_of_tasks
+        self.completed_tasks = 0
+
+    def start_process(self, number_of_subtasks):
+        pass
+
+    def complete_subtask(self):
+        pass
+
+    def complete_task(self):
+        self.completed_tasks += 1
+
+    def run_tool(self, tool, *args, **kwargs):
+        self.tool_calls.append(getattr(tool, "namespace", type(tool).__name__))
+        result = tool(*args, **kwargs)
+        self.completed_tasks += 1
+        return result
+
+    def get_progress(self):
+        return (0, self.number_of_tasks, self.completed_tasks)
+
+
+def _bank():
+    return Modeller().emmebank
+
+
+def load_scenario(scenario_number):
+    scenario = _bank().scenario(scenario_number)
+    if scenario is None:
+        raise Exception("Scenario %s was not found!" % scenario_number)
+    return scenario
+
+
+def get_emme_version(return_type=str):
+    version = (4, 6, 0)
+    if return_type is tuple:
+        return version
+    return "Emme %d.%d.%d" % version
+
+
+def format_reverse_stack():
+    return "".join(_traceback.format_exception(*sys.exc_info()))
+
+
+def initialize_matrix(id=None, default=0, name="", description="", matrix_type="FULL"):
+    bank = _bank()
+    if id is None:
+        id = bank.available_matrix_identifier(matrix_type)
+    matrix = bank.matrix(id)
+    if matrix is None:
+        matrix = bank.create_matrix(id, default)
+    else:
+        matrix.initialize(default)
+    if name:
+        matrix.name = name
+    matrix.description = description
+    return matrix
+
+
+def create_temp_attribute(scenario, attrib_id, attrib_type, description=None, default_value=0.0, assignment_type=None):
+    attribute = scenario.extra_attribute(attrib_id)
+    if attribute is None:
+        attribute = scenario.create_extra_attribute(attrib_type, attrib_id, default_value)
+    else:
+        attribute.initialize(default_value)
+    if description:
+        attribute.description = description
+    return attribute
+
+
+@contextmanager
+def temporary_matrix_manager():
+    temp_matrix_list = []
+    try:
+        yield temp_matrix_list
+    finally:
+        bank = _bank()
+        for matrix in temp_matrix_list:
+            if matrix is not None and bank.matrix(matrix.id) is not None:
+                bank.delete_matrix(matrix.id)
+
+
+@contextmanager
+def temporary_attribute_manager(scenario):
+    temp_attribute_list = []
+    try:
+        yield temp_attribute_list
+    finally:
+        for attribute in temp_attribute_list:
+            if attribute is not None and scenario.extra_attribute(attribute.id) is not None:
+                scenario.delete_extra_attribute(attribute.id)
+
+
+@contextmanager
+def temp_extra_attribute_manager(scenario, attribute_type, default=0.0, description=None):
+    number = 1
+    while scenario.extra_attribute("@tmp%d" % number) is not None:
+        number += 1
+    attribute = scenario.create_extra_attribute(attribute_type, "@tmp%d" % number, default)
+    if description:
+        attribute.description = description
+    try:
+        yield attribute
+    finally:
+        scenario.delete_extra_attribute(attribute.id)
+
+
+# ---DATABASE UTILITIES-----------------------------------------------------------------------------------------------------
+
+
+@contextmanager
+def congested_transit_temp_funcs(scenario, used_functions, create_copy, congestion_attribute):
+    bank = scenario.emmebank
+    original = {}
+    for function_id in used_functions:
+        function = bank.function(function_id)
+        if function is None:
+            continue
+        original[function_id] = function.expression
+        function.expression = "(%s)*(1+%s)" % (function.expression, congestion_attribute)
+    try:
+        yield original
+    finally:
+        for function_id, expression in original.items():
+            bank.function(function_id).expression = expression
+
+
+@contextmanager
+def backup_and_restore(scenario, backup_attributes):
+    backup = {}
+    for element_type, attributes in backup_attributes.items():
+        backup[element_type] = (attributes, scenario.get_attribute_values(element_type, attributes))
+    try:
+        yield backup
+    finally:
+        for element_type, (attributes, values) in backup.items():
+            scenario.set_attribute_values(element_type, attributes, values)
+
+
+def get_multi_class_strat(strategies, class_name):
+    for class_data in strategies.data["classes"]:
+        if class_data["name"] == class_name:
+            return class_data
+    raise Exception("No strategy data for class %s" % class_name)
+
+
+def create_segment_alightings_attribute(network):
+    """
+    Creates transit_alightings on the segments: the previous segment's volume plus the boardings minus the
+    volume, with none at the first segment of a line.
+    """
+    if "transit_alightings" not in network.attributes("TRANSIT_SEGMENT"):
+        network.create_attribute("TRANSIT_SEGMENT", "transit_alightings", 0.0)
+    for line in network.transit_lines():
+        previous_segment = None
+        for segment in line.segments(include_hidden=True):
+            if previous_segment is not None:
+                segment.transit_alightings = (
+                    previous_segment.transit_volume + segment.transit_boardings - segment.transit_volume
+                )
+            previous_segment = segment
+
+
+# ---PAGE BUILDER-----------------------------------------------------------------------------------------------------------
+
+
+class TmgToolPageBuilder:
+    def __init__(self, tool, title="", description="", runnable=True, branding_text="", **kwargs):
+        self.tool = tool
+        self.title = title
+        self.description = description
+
+    def render(self):
+        return "<h1>%s</h1>%s" % (self.title, self.description)
+
+
+def build_modules():
+    general_utilities = ModuleType("tmg2.utilities.general_utilities")
+    for name in (
+        "null_pointer_exception",
+        "progress_tracker",
+        "load_scenario",
+        "get_emme_version",
+        "format_reverse_stack",
+        "initialize_matrix",
+        "create_temp_attribute",
+        "temporary_matrix_manager",
+        "temporary_attribute_manager",
+        "temp_extra_attribute_manager",
+    ):
+        setattr(general_utilities, name, globals()[name])
+    database_utilities = ModuleType("inro.emme.utility.database_utilities")
+    for name in ("congested_transit_temp_funcs", "backup_and_restore", "get_multi_class_strat"):
+        setattr(database_utilities, name, globals()[name])
+    network_editing = ModuleType("tmg2.utilities.network_editing")
+    network_editing.create_segment_alightings_attribute = create_segment_alightings_attribute
+    page_builder = ModuleType("tmg2.utilities.TMG_tool_page_builder")
+    page_builder.TmgToolPageBuilder = TmgToolPageBuilder
+    return {
+        general_utilities.__name__: general_utilities,
+        database_utilities.__name__: database_utilities,
+        network_editing.__name__: network_editing,
+        page_builder.__name__: page_builder,
+    }
@@ -0,0 +1,29 @@
+"""
+The tests run the tools on the Emme stand-in. It is installed here, before any test module imports
+assign_transit_v2, since the tool modules bind the Modeller and the emmebank at import time.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emme_standin
+
+EMMEBANK = emme_standin.install(zones=30)
+
+
+@pytest.fixture
+def emmebank(tmp_path):
+    """
+    The stand-in emmebank, placed in a temporary directory so the strategy files and checkpoints of a
+    test are written there. The scenarios the test created are deleted afterwards.
+    """
+    path = EMMEBANK.path
+    EMMEBANK.path = str(tmp_path / "emmebank")
+    yield EMMEBANK
+    EMMEBANK.path = path
+    for scenario in list(EMMEBANK.scenarios()):
+        EMMEBANK.delete_scenario(scenario.number)
@@ -0,0 +1,90 @@
+"""
+Tests the period runner: the processor split, the checks on the periods and a run of the worker
+processes with the stand-in engine.
+"""
+
+import os
+
+import pytest
+
+import assign_transit_periods
+
+STANDIN_ENGINE = "assign_transit_periods:standin_engine"
+
+
+@pytest.mark.parametrize(
+    "number_of_periods, processors, max_workers, expected",
+    [
+        (4, 16, None, (4, [4, 4, 4, 4])),
+        (4, 10, None, (4, [3, 3, 2, 2])),
+        (6, 4, None, (4, [1, 1, 1, 1, 1, 1])),
+        (4, 1, None, (1, [1, 1, 1, 1])),
+        (4, 16, 2, (2, [8, 8, 8, 8])),
+        (1, 8, None, (1, [8])),
+    ],
+)
+def test_allocate_processors(number_of_periods, processors, max_workers, expected):
+    workers, period_processors = assign_transit_periods.allocate_processors(number_of_periods, processors, max_workers)
+    assert (workers, period_processors) == expected
+    # the periods running at the same time never ask for more than the processors given
+    assert sum(sorted(period_processors, reverse=True)[:workers]) <= processors
+
+
+def get_periods(*parameters):
+    return [{"name": "P%d" % i, "parameters": period_parameters} for i, period_parameters in enumerate(parameters)]
+
+
+def test_check_periods_accepts_separate_projects():
+    periods = get_periods(
+        {"project_file": os.path.join("AM", "AM.emp"), "scenario_number": 1},
+        {"project_file": os.path.join("MD", "MD.emp"), "scenario_number": 1},
+    )
+    assign_transit_periods.check_periods(periods, {"iterations": 5})
+
+
+def test_check_periods_refuses_shared_transit_classes():
+    periods = get_periods({"project_file": "AM.emp"}, {"project_file": "MD.emp"})
+    with pytest.raises(Exception, match="transit_classes"):
+        assign_transit_periods.check_periods(periods, {"transit_classes": []})
+
+
+def test_check_periods_refuses_shared_project():
+    periods = get_periods(
+        {"project_file": os.path.join("AM", "TMG.emp"), "scenario_number": 1},
+        {"project_file": os.path.join("AM", "..", "AM", "TMG.emp"), "scenario_number": 2},
+    )
+    with pytest.raises(Exception, match="both open the project"):
+        assign_transit_periods.check_periods(periods)
+
+
+def test_check_periods_refuses_shared_scenario():
+    periods = get_periods({"scenario_number": 1}, {"scenario_number": 2}, {"scenario_number": 1})
+    with pytest.raises(Exception, match="both assign scenario 1"):
+        assign_transit_periods.check_periods(periods)
+
+
+def test_run_periods_refuses_shared_transit_classes():
+    periods = get_periods({"scenario_number": 1}, {"scenario_number": 2})
+    with pytest.raises(Exception, match="transit_classes"):
+        assign_transit_periods.run_periods(periods, {"transit_classes": []}, STANDIN_ENGINE, processors=2)
+
+
+def test_run_periods_with_standin_engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    periods = get_periods({"scenario_number": 1}, {"scenario_number": 2, "scale": "huge"}, {"scenario_number": 3})
+    summary = assign_transit_periods.run_periods(
+        periods, {"scale": "1k", "iterations": 2}, STANDIN_ENGINE, processors=4, max_workers=2
+    )
+    assert summary["workers"] == 2
+    assert [period["name"] for period in summary["periods"]] == ["P0", "P1", "P2"]
+    assert [period["processors"] for period in summary["periods"]] == [2, 2, 2]
+    failed = summary["periods"][1]
+    # a failed period is reported without stopping the others
+    assert failed["status"] == "failed"
+    assert "Unknown synthetic network scale 'huge'" in failed["error"]
+    for period in (summary["periods"][0], summary["periods"][2]):
+        assert period["status"] == "completed"
+        assert period["result"]["scenario_number"] == period["scenario_number"]
+        assert period["result"]["errors"] == {}
+        assert len(period["result"]["step_sizes"]) == 2
+        assert period["pid"] != os.getpid()
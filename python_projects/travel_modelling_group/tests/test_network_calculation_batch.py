@@ -0,0 +1,91 @@
+"""
+Checks that network calculations coalesced by network_calculation_batch give the results of running
+each specification through the network calculator, on a synthetic stand-in network.
+"""
+
+import numpy
+import pytest
+
+import assign_transit_v2
+import benchmark_assign_transit
+from emme_standin import synthetic
+
+SPECIFICATIONS = [
+    {"result": "@ehdw", "expression": "hdw * 0.5 + 2", "selections": {"transit_line": "all"}},
+    {"result": "@ehdw", "expression": "(@ehdw - 1) ^ 2 / hdw", "selections": {"transit_line": "mode=bs"}},
+    {"result": "@ehdw", "expression": "@ehdw + 10", "selections": {"transit_line": "hdw=0,10"}},
+    # not coalesced: the network calculator runs it between the coalesced specifications
+    {"result": "@ehdw", "expression": "@ehdw * 2", "selections": {"transit_line": "line=L0000_"}},
+    {"result": "@ehdw", "expression": "@ehdw - .5", "selections": {"transit_line": "all"}},
+    {"result": "@walkp", "expression": "1.5", "selections": {"link": "all"}},
+    {"result": "@walkp", "expression": "len * 3 + @walkp", "selections": {"link": "length=0,0.5"}},
+]
+
+
+def get_scenario(emmebank, number):
+    scenario = synthetic.build_scenario(emmebank, number, lines=40, segments_per_line=10, seed=3)
+    scenario.create_extra_attribute("TRANSIT_LINE", "@ehdw")
+    scenario.create_extra_attribute("LINK", "@walkp")
+    return scenario
+
+
+def get_values(scenario, element_type, attribute):
+    return numpy.asarray(scenario.get_attribute_values(element_type, [attribute])[1], dtype=numpy.float64)
+
+
+def run_batch(scenario, coalesce):
+    batch = assign_transit_v2.network_calculation_batch(scenario, coalesce=coalesce)
+    for specification in SPECIFICATIONS:
+        batch.add(dict(specification, type="NETWORK_CALCULATION"))
+    calls = assign_transit_v2.network_calc_tool.calls
+    reports = batch.run()
+    return reports, assign_transit_v2.network_calc_tool.calls - calls
+
+
+def test_batch_matches_network_calculator(emmebank):
+    individual, coalesced = get_scenario(emmebank, 1), get_scenario(emmebank, 2)
+    individual_reports, individual_calls = run_batch(individual, False)
+    coalesced_reports, coalesced_calls = run_batch(coalesced, True)
+    assert individual_calls == len(SPECIFICATIONS)
+    assert coalesced_calls == 1
+    for element_type, attribute in (("TRANSIT_LINE", "@ehdw"), ("LINK", "@walkp")):
+        numpy.testing.assert_allclose(
+            get_values(coalesced, element_type, attribute), get_values(individual, element_type, attribute), rtol=1e-12
+        )
+    assert len(coalesced_reports) == len(individual_reports)
+    for coalesced_report, individual_report in zip(coalesced_reports, individual_reports):
+        assert coalesced_report["num_evaluated"] == individual_report["num_evaluated"]
+        assert coalesced_report["num_evaluated"] > 0
+        for key in ("sum", "average", "maximum", "minimum"):
+            assert coalesced_report[key] == pytest.approx(individual_report[key], rel=1e-12)
+
+
+def test_setup_calculations_match_network_calculator(emmebank):
+    comparison = benchmark_assign_transit.compare_network_calculations(assign_transit_v2, emmebank, 1, "1k", 3)
+    assert comparison["max_difference"] == 0.0
+    assert comparison["coalesced"]["network_calculator_calls"] < comparison["individual"]["network_calculator_calls"]
+
+
+def test_non_finite_result_is_rejected(emmebank):
+    scenario = get_scenario(emmebank, 1)
+    before = get_values(scenario, "TRANSIT_LINE", "@ehdw")
+    batch = assign_transit_v2.network_calculation_batch(scenario)
+    batch.add(
+        {
+            "type": "NETWORK_CALCULATION",
+            "result": "@ehdw",
+            "expression": "hdw",
+            "selections": {"transit_line": "all"},
+        }
+    )
+    batch.add(
+        {
+            "type": "NETWORK_CALCULATION",
+            "result": "@ehdw",
+            "expression": "1 / (hdw - hdw)",
+            "selections": {"transit_line": "all"},
+        }
+    )
+    with pytest.raises(Exception, match="not finite"):
+        batch.run()
+    numpy.testing.assert_array_equal(get_values(scenario, "TRANSIT_LINE", "@ehdw"), before)
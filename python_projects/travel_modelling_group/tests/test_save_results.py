@@ -0,0 +1,86 @@
+"""
+Checks AssignTransit._save_results, which works on segment arrays, against the per-segment loop it
+replaced, on a synthetic stand-in network with surface transit speeds.
+"""
+
+import numpy
+import pytest
+
+import assign_transit_v2
+import benchmark_assign_transit
+from emme_standin import synthetic
+
+
+def save_results(tool, scenario, parameters, network, alphas, strategies):
+    # AssignTransit._save_results before it used segment arrays
+    if scenario.extra_attribute("@ccost") is not None:
+        ccost = scenario.extra_attribute("@ccost")
+        scenario.delete_extra_attribute("@ccost")
+        network.delete_attribute(ccost.type, "@ccost")
+    type = "TRANSIT_SEGMENT"
+    congestion_attribute = scenario.create_extra_attribute(type, "@ccost")
+    congestion_attribute.description = "congestion cost"
+    network.create_attribute(type, "@ccost")
+    for line in network.transit_lines():
+        capacity = float(line.total_capacity)
+        i = 0
+        for segment in line.segments():
+            volume = float(segment.voltr)
+            congestion_term = tool._calculate_segment_cost(parameters, volume, capacity, segment)
+            base_time = float(segment.uncongested_time) - float(line.segment(i + 1).base_dwell_time)
+            segment.transit_time = (base_time + float(line.segment(i + 1).dwell_time)) * (1 + congestion_term)
+            segment["@ccost"] = segment.transit_time - base_time
+            i += 1
+    attribute_mapping = tool._attribute_mapping()
+    attribute_mapping["TRANSIT_SEGMENT"]["@ccost"] = "@ccost"
+    attribute_mapping["TRANSIT_SEGMENT"]["transit_time"] = "transit_time"
+    for type, mapping in attribute_mapping.items():
+        data = network.get_attribute_values(type, mapping.values())
+        scenario.set_attribute_values(type, mapping.keys(), data)
+    if parameters["surface_transit_speed"] == True:
+        data = scenario.get_attribute_values("TRANSIT_SEGMENT", ["transit_volume", "transit_boardings"])
+        network.set_attribute_values("TRANSIT_SEGMENT", ["transit_volume", "transit_boardings"], data)
+        assign_transit_v2.net_edit.create_segment_alightings_attribute(network)
+        network = tool._surface_transit_speed_update(scenario, parameters, network, 1)
+        data = network.get_attribute_values("TRANSIT_SEGMENT", ["transit_boardings", "transit_alightings"])
+        scenario.set_attribute_values("TRANSIT_SEGMENT", ["@boardings", "@alightings"], data)
+    strategies.data["alphas"] = alphas
+    strategies._save_config()
+
+
+def get_results(emmebank, number, surface_transit_speed, vectorized):
+    scenario = synthetic.build_scenario(emmebank, number, lines=60, segments_per_line=12, seed=4)
+    scenario.create_extra_attribute("TRANSIT_SEGMENT", "@boardings")
+    scenario.create_extra_attribute("TRANSIT_SEGMENT", "@alightings")
+    parameters = benchmark_assign_transit.get_parameters(surface_transit_speed=surface_transit_speed)
+    tool = assign_transit_v2.AssignTransit()
+    network = tool._prepare_network(scenario, parameters, scenario.extra_attribute("@stsu"))
+    rng = numpy.random.default_rng(9)
+    synthetic.simulate_assignment(network, rng)
+    tool._compute_segment_costs(scenario, parameters, network)
+    # dwell times that differ from the base dwell times, so the stop of each segment matters
+    indices, dwell_time = network.get_attribute_values("TRANSIT_SEGMENT", ["dwell_time"])
+    dwell_time = numpy.asarray(dwell_time) * rng.uniform(0.5, 2.0, len(dwell_time))
+    network.set_attribute_values("TRANSIT_SEGMENT", ["dwell_time"], [indices, dwell_time])
+    strategies = scenario.transit_strategies
+    strategies.data = {"classes": []}
+    if vectorized:
+        tool._save_results(scenario, parameters, network, [0.4, 0.6], strategies)
+    else:
+        save_results(tool, scenario, parameters, network, [0.4, 0.6], strategies)
+    assert strategies.data["alphas"] == [0.4, 0.6]
+    return {
+        (element_type, attribute): numpy.asarray(scenario.get_attribute_values(element_type, [attribute])[1])
+        for element_type in ("NODE", "LINK", "TRANSIT_LINE", "TRANSIT_SEGMENT")
+        for attribute in scenario.attributes(element_type)
+    }
+
+
+@pytest.mark.parametrize("surface_transit_speed", [True, False])
+def test_save_results_matches_segment_loop(emmebank, surface_transit_speed):
+    expected = get_results(emmebank, 1, surface_transit_speed, False)
+    results = get_results(emmebank, 2, surface_transit_speed, True)
+    assert set(results) == set(expected)
+    for key in expected:
+        numpy.testing.assert_array_equal(results[key], expected[key], err_msg="%s %s" % key)
+    assert numpy.any(results[("TRANSIT_SEGMENT", "@ccost")] != 0)
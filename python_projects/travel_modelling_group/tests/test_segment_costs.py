@@ -0,0 +1,124 @@
+"""
+Checks the array versions of the per-iteration segment updates of AssignTransit against the object
+loops they replaced, on a synthetic stand-in network.
+"""
+
+import numpy
+import pytest
+
+import assign_transit_v2
+from emme_standin import synthetic
+
+TTF_DEFINITIONS = [
+    {"ttf": 1, "congestion_exponent": 5.972385, "congestion_perception": 1},
+    {"ttf": 2, "congestion_exponent": 6.72, "congestion_perception": 2},
+    {"ttf": 3, "congestion_exponent": 9.0, "congestion_perception": 1},
+    # only the first definition of a TTF is used
+    {"ttf": 1, "congestion_exponent": 3.0, "congestion_perception": 5},
+]
+
+
+def get_parameters():
+    return {"assignment_period": 3.0, "ttf_definitions": TTF_DEFINITIONS, "surface_transit_speed": False}
+
+
+def get_network(emmebank, tool, parameters):
+    # TTF 4 has no definition, so its segments have no congestion cost
+    scenario = synthetic.build_scenario(emmebank, 1, lines=40, segments_per_line=12, ttfs=(1, 2, 3, 4), seed=5)
+    network = tool._prepare_network(scenario, parameters, scenario.extra_attribute("@stsu"))
+    synthetic.simulate_assignment(network, numpy.random.default_rng(5))
+    return scenario, network
+
+
+def compute_segment_costs(tool, parameters, network):
+    # the object loop of AssignTransit._compute_segment_costs before it used attribute arrays
+    excess_km = 0.0
+    for line in network.transit_lines():
+        capacity = line.total_capacity
+        for segment in line.segments():
+            volume = segment.current_voltr = segment.voltr
+            length = segment.link.length
+            if volume >= capacity:
+                excess = volume - capacity
+                excess_km += excess * length
+            segment.cost = tool._calculate_segment_cost(parameters, segment.voltr, capacity, segment)
+    return excess_km
+
+
+def update_volumes(network, lambdaK):
+    # the object loop of AssignTransit._update_volumes before it used attribute arrays
+    alpha = 1 - lambdaK
+    for node in network.regular_nodes():
+        node.inboa = node.inboa * alpha + node.initial_boardings * lambdaK
+        node.fiali = node.fiali * alpha + node.final_alightings * lambdaK
+    for link in network.links():
+        link.volax = link.volax * alpha + link.aux_transit_volume * lambdaK
+    for line in network.transit_lines():
+        for segment in line.segments():
+            segment.voltr = segment.voltr * alpha + segment.transit_volume * lambdaK
+            segment.board = segment.board * alpha + segment.transit_boardings * lambdaK
+
+
+def get_values(network, element_type, attribute):
+    return numpy.asarray(network.get_attribute_values(element_type, [attribute])[1], dtype=numpy.float64)
+
+
+def test_segment_cost_array_matches_scalar(emmebank):
+    tool = assign_transit_v2.AssignTransit()
+    parameters = get_parameters()
+    scenario, network = get_network(emmebank, tool, parameters)
+    segments = [segment for line in network.transit_lines() for segment in line.segments()]
+    capacity = numpy.array([float(segment.line.total_capacity) for segment in segments])
+    ttf = numpy.array([segment.transit_time_func for segment in segments])
+    ttf_lookup = tool._get_ttf_lookup(parameters)
+    for scale in (0.0, 0.5, 0.9, 1.0, 1.1, 3.0):
+        volume = capacity * scale
+        expected = [
+            tool._calculate_segment_cost(parameters, volume[i], capacity[i], segment)
+            for i, segment in enumerate(segments)
+        ]
+        cost = tool._calculate_segment_cost_array(ttf_lookup, volume, capacity, ttf)
+        numpy.testing.assert_array_equal(cost, expected)
+    assert numpy.all(cost[ttf == 4] == 0)
+    assert numpy.all(cost[ttf != 4] > 0)
+
+
+def test_compute_segment_costs_matches_object_loop(emmebank):
+    tool = assign_transit_v2.AssignTransit()
+    parameters = get_parameters()
+    scenario, network = get_network(emmebank, tool, parameters)
+    expected_network = network.copy()
+    excess_km = tool._compute_segment_costs(scenario, parameters, network)
+    expected_excess_km = compute_segment_costs(tool, parameters, expected_network)
+    assert excess_km == pytest.approx(expected_excess_km, rel=1e-12)
+    assert expected_excess_km > 0
+    for attribute in ("cost", "current_voltr"):
+        numpy.testing.assert_array_equal(
+            get_values(network, "TRANSIT_SEGMENT", attribute),
+            get_values(expected_network, "TRANSIT_SEGMENT", attribute),
+        )
+    numpy.testing.assert_array_equal(
+        get_values(scenario, "TRANSIT_SEGMENT", "data3"), get_values(network, "TRANSIT_SEGMENT", "cost")
+    )
+
+
+@pytest.mark.parametrize("lambdaK", [0.0, 0.37, 1.0])
+def test_update_volumes_matches_object_loop(emmebank, lambdaK):
+    tool = assign_transit_v2.AssignTransit()
+    parameters = get_parameters()
+    scenario, network = get_network(emmebank, tool, parameters)
+    # give the running volumes values different from the last assignment
+    synthetic.simulate_assignment(network, numpy.random.default_rng(6))
+    expected_network = network.copy()
+    tool._update_volumes(network, lambdaK)
+    update_volumes(expected_network, lambdaK)
+    for element_type, attribute in (
+        ("NODE", "inboa"),
+        ("NODE", "fiali"),
+        ("LINK", "volax"),
+        ("TRANSIT_SEGMENT", "voltr"),
+        ("TRANSIT_SEGMENT", "board"),
+    ):
+        numpy.testing.assert_array_equal(
+            get_values(network, element_type, attribute), get_values(expected_network, element_type, attribute)
+        )